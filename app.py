@@ -1,24 +1,42 @@
 from fastapi import (FastAPI, Request, Depends, Form, Body, HTTPException)
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from db import Base, engine, get_db
 import schemas, crud, models
-from misc import api
-import uuid, os
+from misc import api, archive, line_report, snapshot, xlsx_export
+import asyncio, uuid, os, time
 from fastapi import status
-from utils.middleware import ContextProcessorMiddleware
+from utils.middleware import (ContextProcessorMiddleware, QueryTimingMiddleware,
+                              MetricsMiddleware, ClientIPLoggingMiddleware)
+from utils import metrics, jobs, scheduler, fiscal, gl
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from sqlalchemy import text, select, func
+from sqlalchemy.exc import IntegrityError
 import crud
 import requests
 from auth import Auth
 
 load_dotenv()  # Load environment variables from .env file
 
-app = FastAPI(title=os.getenv('APPNAME', 'Budget Coder (FastAPI + Jinja2)'))
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # periodic ERP syncs (SYNC_ACCOUNTS / SYNC_BUDGET / SYNC_ACTUALS); nothing runs unless configured
+    scheduler.start()
+    if snapshot.LEDGER_SNAPSHOT:
+        # build the ledger snapshot before the first report request has to wait for it
+        await asyncio.to_thread(snapshot.get)
+    yield
+    await scheduler.stop()
+    xlsx_export.shutdown()
+
+app = FastAPI(title=os.getenv('APPNAME', 'Budget Coder (FastAPI + Jinja2)'), lifespan=lifespan)
 app.add_middleware(ContextProcessorMiddleware)
+app.add_middleware(QueryTimingMiddleware)
+app.add_middleware(ClientIPLoggingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app_root = os.path.dirname(os.path.abspath(__file__))
 os.environ.setdefault("APP_ROOT", app_root)
@@ -45,6 +63,123 @@ with engine.connect() as conn:
     except Exception as _e:
         pass
 
+with engine.begin() as conn:
+    # next-line lookups read one account's lines through this index
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_actual_items_acct5_line ON actual_items(acct5, line)"))
+    # a manager's accounts, for reports filtered by manager
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_acct_mgrs_manager_key ON acct_mgrs(manager_id, key)"))
+
+with engine.begin() as conn:
+    # money moved from REAL dollars to INTEGER cents; DROP COLUMN needs SQLite 3.35+
+    for table in ("budget_items", "actual_items"):
+        colnames = [c[1] for c in conn.execute(text(f"PRAGMA table_info({table})")).fetchall()]
+        if 'amount_cents' not in colnames:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN amount_cents INTEGER NOT NULL DEFAULT 0"))
+            conn.execute(text(f"UPDATE {table} SET amount_cents = CAST(ROUND(amount * 100) AS INTEGER) "
+                              "WHERE amount IS NOT NULL"))
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN amount"))
+    # duplicate checks look actuals up by exact amount within an account
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_actual_items_acct5_amount ON actual_items(acct5, amount_cents)"))
+
+with engine.begin() as conn:
+    # content fingerprint of imported actuals; existing imported rows (those with a vouchno) stay
+    # NULL until the dedupe:actuals job (POST /api/actuals/dedupe) or the next ERP import fills
+    # it in and removes their duplicates
+    colnames = [c[1] for c in conn.execute(text("PRAGMA table_info(actual_items)")).fetchall()]
+    if 'row_hash' not in colnames:
+        conn.execute(text("ALTER TABLE actual_items ADD COLUMN row_hash TEXT"))
+    conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ux_actual_items_row_hash ON actual_items(row_hash)"))
+
+with engine.begin() as conn:
+    # fiscal year of every ledger row (utils/fiscal.py): actuals by tr_date, budget lines by datefrom
+    for table, date_column in (("budget_items", "datefrom"), ("actual_items", "tr_date")):
+        colnames = [c[1] for c in conn.execute(text(f"PRAGMA table_info({table})")).fetchall()]
+        if 'fiscal_year' not in colnames:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN fiscal_year INTEGER NOT NULL DEFAULT 0"))
+            conn.execute(text(f"UPDATE {table} SET fiscal_year = "
+                              f"{fiscal.sql_expression(date_column, fiscal.current_fiscal_year())}"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_fy_acct5_line ON {table}(fiscal_year, acct5, line)"))
+    # year-to-date scans for the year-over-year report
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_actual_items_fy_acct5_date "
+                      "ON actual_items(fiscal_year, acct5, tr_date, line, amount_cents)"))
+
+with engine.begin() as conn:
+    # the ledger snapshot (misc/snapshot.py) re-reads rows updated or deleted since
+    # it was built; inserts it finds by rowid.  The log keeps the last 100k changes.
+    for table in ("accounts", "acct_mgrs", "budget_items", "actual_items"):
+        for event in ("UPDATE", "DELETE"):
+            conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS tr_{table}_{event.lower()}_log AFTER {event} ON {table} "
+                              f"BEGIN INSERT INTO ledger_changes (tbl, row_id) VALUES ('{table}', old.rowid); END"))
+    conn.execute(text("CREATE TRIGGER IF NOT EXISTS tr_ledger_changes_prune AFTER INSERT ON ledger_changes "
+                      "WHEN new.id % 10000 = 0 BEGIN DELETE FROM ledger_changes WHERE id <= new.id - 100000; END"))
+
+with engine.begin() as conn:
+    # GL segments of account keys (utils/gl.py) and their descriptions from the GL listing
+    colnames = [c[1] for c in conn.execute(text("PRAGMA table_info(accounts)")).fetchall()]
+    if 'seg1' not in colnames:
+        for i in range(1, gl.SEGMENTS + 1):
+            conn.execute(text(f"ALTER TABLE accounts ADD COLUMN seg{i} TEXT"))
+            conn.execute(text(f"ALTER TABLE accounts ADD COLUMN seg{i}_desc TEXT"))
+        rows = [{"b_id": id, **{f"seg{i}": code for i, code in enumerate(gl.segments(key), 1)}}
+                for id, key in conn.execute(text("SELECT id, key FROM accounts"))]
+        if rows:
+            conn.execute(text("UPDATE accounts SET " + ", ".join(f"seg{i} = :seg{i}" for i in range(1, gl.SEGMENTS + 1))
+                              + " WHERE id = :b_id"), rows)
+    for i in range(1, gl.SEGMENTS + 1):
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_accounts_seg{i} ON accounts(seg{i})"))
+
+with engine.begin() as conn:
+    # actuals per fiscal year, account and fiscal month (models.ActualMonthly) for the monthly
+    # spend report, adjusted by triggers on every write to actual_items.  The month is computed
+    # from FISCAL_YEAR_START_MONTH, so the triggers are recreated and the table rebuilt from the
+    # ledger when they are missing or were created for another start month or date rule; dated
+    # rows whose stored fiscal_year an older rule derived differently are re-derived first.
+    month = fiscal.sql_month_expression
+    installed = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'trigger' "
+                                  "AND name = 'tr_actual_monthly_insert'")).scalar()
+    if installed is None or month("new.tr_date") not in installed:
+        def bump(row, sign):
+            return (f"INSERT INTO actual_monthly (fiscal_year, acct5, month, amount_cents, count) "
+                    f"VALUES ({row}.fiscal_year, {row}.acct5, {month(row + '.tr_date')}, "
+                    f"{sign}{row}.amount_cents, {sign}1) ON CONFLICT (fiscal_year, acct5, month) DO UPDATE "
+                    "SET amount_cents = amount_cents + excluded.amount_cents, count = count + excluded.count; ")
+        for event, body in (("INSERT", bump("new", "")), ("DELETE", bump("old", "-")),
+                            ("UPDATE", bump("old", "-") + bump("new", ""))):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS tr_actual_monthly_{event.lower()}"))
+            conn.execute(text(f"CREATE TRIGGER tr_actual_monthly_{event.lower()} AFTER {event} ON actual_items "
+                              f"BEGIN {body}END"))
+        for table, date_column in (("budget_items", "datefrom"), ("actual_items", "tr_date")):
+            derived = fiscal.sql_expression(date_column, 0)
+            conn.execute(text(f"UPDATE {table} SET fiscal_year = {derived} "
+                              f"WHERE {month(date_column)} > 0 AND fiscal_year != {derived} "
+                              f"AND {derived} NOT IN (SELECT fiscal_year FROM archived_years)"))
+        conn.execute(text("DELETE FROM actual_monthly"))
+        conn.execute(text(f"INSERT INTO actual_monthly (fiscal_year, acct5, month, amount_cents, count) "
+                          f"SELECT fiscal_year, acct5, {month('tr_date')}, sum(amount_cents), count(*) "
+                          f"FROM actual_items GROUP BY 1, 2, 3"))
+
+with engine.begin() as conn:
+    # reads of a fiscal year in archived_years go to its file (misc/archive.py), so ledger writes
+    # to it are rejected
+    for table in ("budget_items", "actual_items"):
+        for event in ("INSERT", "UPDATE"):
+            conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS tr_{table}_{event.lower()}_archived BEFORE {event} "
+                              f"ON {table} WHEN new.fiscal_year IN (SELECT fiscal_year FROM archived_years) "
+                              f"BEGIN SELECT RAISE(ABORT, '{archive.ARCHIVED_ERROR}'); END"))
+
+with engine.begin() as conn:
+    try:
+        # acct_mgrs created before the unique (key, manager_id) constraint:
+        # drop duplicate rows, then enforce uniqueness with an index
+        ddl = conn.execute(text("SELECT group_concat(sql, ';') FROM sqlite_master "
+                                "WHERE tbl_name = 'acct_mgrs'")).scalar() or ''
+        if 'uq_acct_mgrs_key_manager' not in ddl:
+            conn.execute(text("DELETE FROM acct_mgrs WHERE rowid NOT IN "
+                              "(SELECT min(rowid) FROM acct_mgrs GROUP BY key, manager_id)"))
+            conn.execute(text("CREATE UNIQUE INDEX uq_acct_mgrs_key_manager ON acct_mgrs(key, manager_id)"))
+    except Exception as _e:
+        print(f"acct_mgrs migration skipped: {_e}")
+
 with engine.connect() as conn:
     try:
         # upgrade managers table.
@@ -55,10 +190,23 @@ with engine.connect() as conn:
     except Exception as _e:
         pass
 
+# Jobs left queued/running by a process that has exited would block their kind forever
+jobs.recover()
 
 # API router
 app.include_router(api.router)
 
+@app.exception_handler(IntegrityError)
+async def integrity_error(request: Request, exc: IntegrityError):
+    # a write to an archived fiscal year, rejected by the archived_years triggers
+    if archive.ARCHIVED_ERROR in str(exc.orig):
+        return JSONResponse({"ok": False, "error": archive.ARCHIVED_ERROR}, status_code=409)
+    raise exc
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # Utilities
 def uuid4():
     return str(uuid.uuid4())
@@ -68,59 +216,12 @@ def pad2(s: str) -> str:
     return s.zfill(2)[-2:]
 
 def build_line_items(db, acct5_filter=None, desc_filter=None, manager_filter=None):
-    managers = crud.list_managers(db)
-    accounts = crud.list_accounts(db)
-    budget = crud.list_budget(db)
-    actuals = crud.list_actuals(db)
-    # Build account to manager mapping
-    acct_manager_map = {a.key: a.manager_id for a in accounts}
-    budget_lookup = {(b.acct5, b.line): b.description for b in budget}
-    joined = {}
-    for b in budget:
-        if acct5_filter and b.acct5 != acct5_filter:
-            continue
-        if manager_filter and acct_manager_map.get(b.acct5) != manager_filter:
-            continue
-        if desc_filter and desc_filter.lower() not in (b.description or '').lower():
-            continue
-        k = (b.acct5, b.line)
-        joined[k] = {"acct5": b.acct5, "line": b.line, "budget_desc": b.description, "budget": b.amount, "actual": 0.0, "actual_desc": None}
-    for a in actuals:
-        if acct5_filter and a.acct5 != acct5_filter:
-            continue
-        if manager_filter and acct_manager_map.get(a.acct5) != manager_filter:
-            continue
-        if desc_filter and desc_filter.lower() not in (a.description or '').lower():
-            continue
-        k = (a.acct5, a.line)
-        if k not in joined:
-            joined[k] = {
-                "acct5": a.acct5,
-                "line": a.line,
-                "budget_desc": budget_lookup.get(k),
-                "budget": 0.0,
-                "actual": a.amount,
-                "actual_desc": a.description
-            }
-        else:
-            joined[k]["actual"] += a.amount
-            joined[k]["actual_desc"] = a.description
-    items = []
-    for (acct5, line), row in joined.items():
-        items.append({
-            "acct5": acct5, "line": line,
-            "budget": row["budget"],
-            "actual": row["actual"],
-            "variance": row["budget"] - row["actual"],
-            "budget_desc": row["budget_desc"],
-            "actual_desc": row["actual_desc"],
-        })
-    items.sort(key=lambda r: (r["acct5"], r["line"]))
-    return items
+    return line_report.line_items(db, acct5=acct5_filter, description=desc_filter, manager=manager_filter,
+                                  fiscal_year=fiscal.current_fiscal_year())
 
 def build_budget_items(db, acct5_filter=None, desc_filter=None, manager_filter=None):
     accounts = crud.list_accounts(db)
-    budget = crud.list_budget(db)
+    budget = crud.list_budget(db, fiscal.current_fiscal_year())
     # Build account to manager mapping
     acct_manager_map = {a.key: a.manager_id for a in accounts}
     items = []
@@ -143,7 +244,7 @@ def build_budget_items(db, acct5_filter=None, desc_filter=None, manager_filter=N
 
 def build_actual_items(db, acct5_filter=None, desc_filter=None, vendor_filter=None, manager_filter=None):
     accounts = crud.list_accounts(db)
-    actuals = crud.list_actuals(db)
+    actuals = crud.list_actuals(db, fiscal.current_fiscal_year())
     acct_manager_map = {a.key: a.manager_id for a in accounts}
     items = []
     for a in actuals:
@@ -228,7 +329,8 @@ def accounts_page(request: Request, db: Session = Depends(get_db)):
             error_message = qp.get('msg')
     except Exception:
         pass
-    return templates.TemplateResponse("accounts.html", {"request": request, "managers": managers, "accounts": accounts, "import_summary": import_summary, "error_message": error_message, **request.state.context})
+    import_job = qp.get('job')
+    return templates.TemplateResponse("accounts.html", {"request": request, "managers": managers, "accounts": accounts, "import_summary": import_summary, "error_message": error_message, "import_job": import_job, **request.state.context})
 
 @app.get("/budgets", response_class=HTMLResponse)
 def budgets_page(request: Request, db: Session = Depends(get_db)):
@@ -369,7 +471,7 @@ def actuals_edit_get(id: str, request: Request, db: Session = Depends(get_db)):
     actual = crud.get_actual_item(db, id)
     managers = crud.list_managers(db)
     accounts = crud.list_accounts(db)
-    actuals = crud.list_actuals(db)
+    actuals = crud.list_actuals(db, fiscal.current_fiscal_year())
     return templates.TemplateResponse("actuals.html", {"request": request, "managers": managers, "accounts": accounts, "actuals": actuals, "edit_actual": actual, **request.state.context})
 
 @app.post("/actuals/edit/{id}")
@@ -389,43 +491,10 @@ def actuals_edit_post(id: str,
     return RedirectResponse("/actuals", status_code=status.HTTP_303_SEE_OTHER)
 
 @app.post("/actuals/import")
-def actuals_import(db: Session = Depends(get_db)):
-    from data import Data
-    from urllib.parse import quote_plus
-    created = 0
-    total = 0
-    try:
-        d = Data()
-        rows = d.load_actual_items() or []
-        total = len(rows)
-        for r in rows:
-            acct5 = (r.get('gl') or '').strip()
-            line = pad2(r.get('line') or '')
-            desc = (r.get('description') or '').strip()
-            amount = float(r.get('amount') or 0.0)
-            seq = r.get('seq')
-            seq_val = None if not seq else float(seq)
-            tr_date = r.get('tr_date') or None
-            vendor_name = (r.get('vendor_name') or '').strip() or None
-            vouchno = (r.get('vouchno') or '').strip() or None
-            if not acct5 or not line or not desc or amount == 0.0:
-                continue
-            crud.create_actual_item(db, schemas.LineItemCreate(
-                id=uuid4(),
-                acct5=acct5,
-                line=line,
-                description=desc,
-                amount=amount,
-                seq=seq_val,
-                tr_date=tr_date,
-                vendor_name=vendor_name,
-                vouchno=vouchno
-            ))
-            created += 1
-    except Exception as e:
-        msg = quote_plus(str(e))
-        return RedirectResponse(f"/actuals?msg={msg}", status_code=303)
-    return RedirectResponse(f"/actuals?created={created}&total={total}", status_code=303)
+def actuals_import():
+    # runs in the background; the actuals page polls the job
+    data = api.start_import_job("erp:actuals")
+    return RedirectResponse(f"/actuals?job={data['job_id']}", status_code=303)
 
 @app.get("misc/get/gl-list", response_model=dict)
 def test1():
@@ -436,28 +505,20 @@ def test1():
 
 @app.post("/accounts/assign")
 def accounts_assign(payload: dict = Body(...), db: Session = Depends(get_db)):
+    # drag-and-drop on the assign page toggles; see /api/accounts/assign for add/remove
     account_id = payload.get("account_id")
     account_ids = payload.get("account_ids") or ([] if not account_id else [account_id])
     manager_id = payload.get("manager_id")
     if not account_ids:
         return JSONResponse({"ok": False, "error": "No account IDs provided"}, status_code=400)
-    assigned = 0
-    for aid in account_ids:
-        # lookup GL for aid
-        glkey = crud.get_account_glkey(db, aid)
-        acct_mgrs_rec = crud.get_acct_mgr_by_key_mgr(db, glkey, manager_id)
-        if acct_mgrs_rec:
-            # remove existing acct_mgrs record
-            crud.delete_acct_mgr(db, acct_mgrs_rec.id)
-        else:
-            # create acct_mgrs record
-            acct_mgr = schemas.AcctMgrCreate(id=uuid4(), key=glkey, manager_id=manager_id)
-            crud.create_acct_mgr(db, acct_mgr)
-
-        assigned += 1
-    if assigned:
-        db.commit()
-    return {"ok": True, "assigned": assigned, "manager_id": manager_id}
+    if not manager_id or not crud.get_manager(db, manager_id):
+        return JSONResponse({"ok": False, "error": "Unknown manager"}, status_code=400)
+    mode = payload.get("mode") or "toggle"
+    if mode not in crud.ASSIGN_MODES:
+        return JSONResponse({"ok": False, "error": f"mode must be one of {', '.join(crud.ASSIGN_MODES)}"},
+                            status_code=400)
+    result = crud.bulk_assign_managers(db, account_ids, manager_id, mode)
+    return {"ok": True, "assigned": result["accounts"], "manager_id": manager_id, **result}
 
 # Inline budget upsert (create/update by acct5+line)
 @app.post("/budget/upsert")
@@ -522,35 +583,19 @@ from fastapi.responses import HTMLResponse
 def voucher_lines_html(request: Request, vouchno: str = None, db: Session = Depends(get_db)):
     if not vouchno:
         return HTMLResponse("<div class='text-red-600'>No voucher number provided.</div>")
-    # Query for voucher lines (replace with your actual query logic)
+    # Query for voucher lines through the configured source provider (SQL Server or replay)
     try:
-        from data.db_connector import DB
-        app_root = os.getenv("APP_ROOT", ".")
-        sql_path = os.path.join(app_root, "sql", "03-voucher-lines.sql")
-        if not os.path.exists(sql_path):
-            return HTMLResponse("<div class='text-red-600'>SQL file not found.</div>")
-        sql = open(sql_path, "r").read()
-        sql = sql.replace("{vouchno}", "?")
-        dbconn = DB()
+        from data.data import Data
         tax = 0.0
         shipping = 0.0
         total_amount = 0.0
-        results = []
-        try:
-            cursor = dbconn.connection.cursor()
-            rows = cursor.execute(sql, vouchno)
-            results = [DB.extract_row(row) for row in rows]
-            tax = float(results[0].get('tax', 0.0) or 0.0) if results else 0.0
-            shipping = float(results[0].get('freight', 0.0) or 0.0) if results else 0.0
-            for r in results:
-                amt = float(r.get('amount', 0.0) or 0.0)
-                total_amount += amt
-            total_amount += tax + shipping
-        finally:
-            try:
-                dbconn.connection.close()
-            except Exception:
-                pass
+        results = Data().load_voucher_lines(vouchno)
+        tax = float(results[0].get('tax', 0.0) or 0.0) if results else 0.0
+        shipping = float(results[0].get('freight', 0.0) or 0.0) if results else 0.0
+        for r in results:
+            amt = float(r.get('amount', 0.0) or 0.0)
+            total_amount += amt
+        total_amount += tax + shipping
     except Exception as e:
         return HTMLResponse(f"<div class='text-red-600'>Error: {str(e)}</div>")
     # Render the template
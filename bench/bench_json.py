@@ -0,0 +1,78 @@
+"""
+Payload size vs. latency for the JSON response paths.
+
+Compares, for list payloads shaped like /api/actuals rows:
+  * response_model path: Pydantic validation of every row + JSONResponse
+  * JSONResponse (stdlib json) on plain dicts
+  * FastJSONResponse (orjson when installed) on plain dicts
+
+Usage:
+    python bench/bench_json.py [--sizes 1000,10000,50000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+import schemas
+from utils.responses import FastJSONResponse, orjson
+
+
+def make_rows(n: int) -> list[dict]:
+    rows = []
+    for i in range(n):
+        rows.append({
+            "id": f"{i:032x}",
+            "acct5": f"52{i % 1000:03d}-03-31-01-01",
+            "line": f"{i % 100:02d}",
+            "description": f"Purchase order line {i}",
+            "amount": round((i * 37) % 100000 / 100.0, 2),
+            "seq": float(i * 5),
+            "tr_date": f"2025-{(i % 12) + 1:02d}-{(i % 28) + 1:02d}",
+            "vendor_name": f"Vendor {i % 500}",
+            "vouchno": f"{100000 + i}",
+        })
+    return rows
+
+
+def best_of(fn, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None or dt < best else best
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,50000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    adapter = TypeAdapter(List[schemas.LineItem])
+    print(f"orjson: {'yes' if orjson is not None else 'no (stdlib fallback)'}")
+    print(f"{'rows':>8} {'bytes':>12} {'validated ms':>13} {'stdlib ms':>10} {'fast ms':>9} {'speedup':>8}")
+    for n in [int(s) for s in args.sizes.split(",") if s]:
+        rows = make_rows(n)
+        body = FastJSONResponse(content=rows).body
+
+        def validated():
+            items = adapter.validate_python(rows)
+            JSONResponse(content=adapter.dump_python(items, mode="json"))
+
+        t_val = best_of(validated, args.repeat)
+        t_std = best_of(lambda: JSONResponse(content=rows), args.repeat)
+        t_fast = best_of(lambda: FastJSONResponse(content=rows), args.repeat)
+        print(f"{n:>8} {len(body):>12} {t_val * 1000:>13.1f} {t_std * 1000:>10.1f} {t_fast * 1000:>9.1f} {t_val / t_fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Time the budget-vs-actual line report (/api/line-items) engines against a
+generated dataset, for the full report and for one manager's and one
+account's slice.
+
+    dict    the original join: every budget line and actual loaded as ORM
+            objects and merged in Python dicts (kept here as the reference)
+    numpy   misc.line_report.numpy_line_items: column arrays, bincount group-by, masks
+    sql     misc.line_report.sql_line_items: one grouped outer-join statement with the
+            filters pushed down
+    snapshot  misc.line_report.snapshot_line_items: the process-local ledger snapshot
+            (misc/snapshot.py); the first run of a case includes building it
+
+All engines must return the same amounts; the run stops if they differ.
+
+Usage:
+    python bench/datagen.py --db /tmp/bench-large.db --scale large      # 1M actuals
+    python bench/bench_line_report.py --db /tmp/bench-large.db [--repeat 3] [--engines numpy]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def dict_join(db, acct5=None, description=None, manager=None) -> list[dict]:
+    import crud
+    budget = crud.list_budget(db)
+    actuals = crud.list_actuals(db)
+    managed = {m.key for m in crud.list_acct_mgrs(db) if m.manager_id == manager}
+    budget_lookup = {(b.acct5, b.line): b.description for b in budget}
+
+    def keep(row) -> bool:
+        if acct5 and row.acct5 != acct5:
+            return False
+        if manager and row.acct5 not in managed:
+            return False
+        return not description or description.lower() in (row.description or "").lower()
+
+    joined = {}
+    for b in budget:
+        if keep(b):
+            k = (b.acct5, b.line)
+            entry = joined.setdefault(k, {"budget": 0, "actual": 0, "budget_desc": None, "actual_desc": None})
+            entry["budget"] += b.amount_cents
+            entry["budget_desc"] = b.description
+    for a in actuals:
+        if keep(a):
+            k = (a.acct5, a.line)
+            entry = joined.setdefault(k, {"budget": 0, "actual": 0, "budget_desc": budget_lookup.get(k),
+                                          "actual_desc": None})
+            entry["actual"] += a.amount_cents
+            entry["actual_desc"] = a.description
+    return [{"acct5": k[0], "line": k[1], "budget": r["budget"] / 100, "actual": r["actual"] / 100,
+             "variance": (r["budget"] - r["actual"]) / 100, "budget_desc": r["budget_desc"],
+             "actual_desc": r["actual_desc"]} for k, r in sorted(joined.items())]
+
+
+def engines() -> dict:
+    from misc import line_report
+    return {"dict": dict_join, **line_report.ENGINES}
+
+
+def _amounts(rows):
+    return [(r["acct5"], r["line"], round(r["budget"], 2), round(r["actual"], 2)) for r in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="dataset produced by bench/datagen.py")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--engines", help="comma-separated subset of engines to run")
+    args = parser.parse_args()
+
+    os.environ["BUDGET_DB_PATH"] = args.db
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import text
+    from db import SessionLocal
+
+    db = SessionLocal()
+    counts = {t: db.execute(text(f"select count(*) from {t}")).scalar() for t in ("budget_items", "actual_items")}
+    key = db.execute(text("select key from accounts order by key limit 1")).scalar()
+    manager = db.execute(text("select manager_id from acct_mgrs group by manager_id "
+                              "order by count(*) desc limit 1")).scalar()
+    cases = {"all": {}, "manager": {"manager": manager}, "acct5": {"acct5": key},
+             "description": {"description": "repairs"}}
+    available = engines()
+    selected = args.engines.split(",") if args.engines else list(available)
+    print(f"dataset: {counts}")
+    print(f"{'case':<12} {'engine':<8} {'rows':>8} {'median s':>10} {'min s':>8}")
+    for case, kwargs in cases.items():
+        reference = None
+        for name in selected:
+            samples, rows = [], None
+            for _ in range(args.repeat):
+                db.expunge_all()
+                t0 = time.perf_counter()
+                rows = available[name](db, **kwargs)
+                samples.append(time.perf_counter() - t0)
+            print(f"{case:<12} {name:<8} {len(rows):>8} {statistics.median(samples):>10.3f} {min(samples):>8.3f}",
+                  flush=True)
+            if reference is None:
+                reference = _amounts(rows)
+            elif _amounts(rows) != reference:
+                sys.exit(f"{name} disagrees with {selected[0]} for case '{case}'")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Per-request overhead of the metrics and query-timing middleware.
+
+Serves a trivial JSON endpoint through the FastAPI TestClient with and
+without MetricsMiddleware / QueryTimingMiddleware, and times the raw
+Histogram.observe() call.
+
+Usage:
+    python bench/bench_metrics.py [--requests 5000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from utils import metrics
+from utils.middleware import MetricsMiddleware, QueryTimingMiddleware
+
+
+def make_app(*middleware) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/ping/{key}")
+    def ping(key: str):
+        return {"key": key}
+
+    for mw in middleware:
+        app.add_middleware(mw)
+    return app
+
+
+def per_request(app: FastAPI, n: int) -> float:
+    client = TestClient(app)
+    for i in range(min(200, n)):
+        client.get(f"/api/ping/{i}")
+    t0 = time.perf_counter()
+    for i in range(n):
+        client.get(f"/api/ping/{i}")
+    return (time.perf_counter() - t0) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    base = per_request(make_app(), args.requests)
+    with_metrics = per_request(make_app(MetricsMiddleware), args.requests)
+    with_both = per_request(make_app(QueryTimingMiddleware, MetricsMiddleware), args.requests)
+    print(f"baseline            {base * 1e6:8.1f} us/request")
+    print(f"+ metrics           {with_metrics * 1e6:8.1f} us/request  (+{(with_metrics - base) * 1e6:.1f} us)")
+    print(f"+ metrics + timing  {with_both * 1e6:8.1f} us/request  (+{(with_both - base) * 1e6:.1f} us)")
+
+    h = metrics.Histogram("bench_observe_seconds", "bench only", ("route",))
+    n = 200000
+    t0 = time.perf_counter()
+    for i in range(n):
+        h.observe(0.003, route="/api/home-items")
+    print(f"Histogram.observe   {(time.perf_counter() - t0) / n * 1e9:8.0f} ns/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Time and peak Python memory for writing a large line-detail workbook.
+
+Compares openpyxl write-only mode (what misc/xlsx_export uses) against the
+default in-memory workbook for the same synthetic rows.
+
+Usage:
+    python bench/bench_xlsx.py [--rows 100000] [--skip-normal]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import Workbook
+
+from misc import exports
+from misc.xlsx_export import write_sheet
+
+
+def line_rows(n: int):
+    for i in range(n):
+        budget = float((i * 13) % 50000)
+        actual = float((i * 7) % 40000) + 0.25
+        yield {
+            "acct5": f"52{i // 100 % 1000:03d}-03-31-01-01",
+            "line": f"{i % 100:02d}",
+            "budget": budget,
+            "actual": actual,
+            "variance": budget - actual,
+            "budget_desc": f"Budget line {i}",
+            "actual_desc": f"Invoice {i}",
+        }
+
+
+def run(label: str, write_only: bool, n: int):
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        wb = Workbook(write_only=write_only)
+        if write_only:
+            write_sheet(wb, "Lines", line_rows(n), exports.LINE_REPORT_FIELDS, [22, 6, 14, 14, 14, 40, 40])
+        else:
+            ws = wb.active
+            ws.append(exports.LINE_REPORT_FIELDS)
+            for row in line_rows(n):
+                ws.append([row[k] for k in exports.LINE_REPORT_FIELDS])
+        wb.save(path)
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+    print(f"{label:<12} rows={n:<8} time={elapsed:7.2f}s  peak_py_mem={peak / 1e6:8.1f} MB  file={size / 1e6:6.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--skip-normal", action="store_true", help="only run write-only mode")
+    args = parser.parse_args()
+    run("write-only", True, args.rows)
+    if not args.skip_normal:
+        run("in-memory", False, args.rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Synthetic data generator for the budget SQLite schema.
+
+Creates (or replaces) a database with the tables from models.py and fills it
+with deterministic, realistic-looking data: GL keys like 52100-03-31-01-01,
+managers assigned to accounts, a line-00 imported budget per account plus
+extra budget lines, and actuals spread across the current fiscal year, or
+across the last --years fiscal years with a budget for each of them.
+The triggers and derived tables that app.py maintains (actual_monthly,
+ledger_changes) are set up the first time the app opens the database.
+
+Usage:
+    python bench/datagen.py --db /tmp/bench.db --scale small
+    python bench/datagen.py --db /tmp/bench.db --accounts 5000 --managers 200 \\
+        --budget-lines 50000 --actuals 1000000
+    python bench/datagen.py --db /tmp/bench.db --scale large --years 5   # 5 fiscal years of history
+
+Scales:
+    small   500 accounts,  20 managers,   5k budget lines,  50k actuals
+    medium  2k accounts,   80 managers,  20k budget lines, 250k actuals
+    large   5k accounts,  200 managers,  50k budget lines,   1M actuals
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = {
+    "small": dict(accounts=500, managers=20, budget_lines=5000, actuals=50000),
+    "medium": dict(accounts=2000, managers=80, budget_lines=20000, actuals=250000),
+    "large": dict(accounts=5000, managers=200, budget_lines=50000, actuals=1000000),
+}
+
+CHUNK = 10000
+
+FUNDS = [52100, 52200, 52300, 53100, 54100, 55100, 56100, 57100, 61100, 62100, 63100, 71100]
+VENDORS = ["Grainger", "Fastenal", "Home Depot", "Staples", "CDW", "Amazon", "Ferguson", "NAPA",
+           "Verizon", "PG&E", "Waste Management", "Uline", "Sherwin-Williams", "Dell", "Cintas"]
+ITEMS = ["Supplies", "Repairs", "Fuel", "Parts", "Services", "Software", "Utilities", "Rental",
+         "Training", "Postage", "Equipment", "Contract labor", "Chemicals", "Uniforms"]
+
+
+def gl_keys(n: int, rnd: random.Random) -> list[str]:
+    keys = set()
+    while len(keys) < n:
+        fund = rnd.choice(FUNDS)
+        keys.add(f"{fund:05d}-{rnd.randint(1, 12):02d}-{rnd.randint(10, 60):02d}-"
+                 f"{rnd.randint(1, 9):02d}-{rnd.randint(1, 20):02d}")
+    return sorted(keys)
+
+
+def chunked(rows, size=CHUNK):
+    batch = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(db_path: str, accounts: int, managers: int, budget_lines: int, actuals: int,
+             seed: int = 42, quiet: bool = False, years: int = 1) -> dict:
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    os.environ["BUDGET_DB_PATH"] = db_path
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import create_engine, insert
+    import models
+    from db import Base
+    from utils import fiscal
+
+    engine = create_engine("sqlite:///" + db_path)
+    Base.metadata.create_all(bind=engine)
+    rnd = random.Random(seed)
+    log = (lambda *a: None) if quiet else (lambda *a: print(*a, flush=True))
+    t0 = time.perf_counter()
+
+    keys = gl_keys(accounts, rnd)
+    mgr_ids = [f"mgr{i:04d}" for i in range(managers)]
+    current = fiscal.current_fiscal_year()
+    fiscal_years = list(range(current - max(1, years) + 1, current + 1))
+    first_day = datetime.date.fromisoformat(fiscal.bounds(fiscal_years[0])[0])
+    days = (datetime.date.today() + datetime.timedelta(days=1) - first_day).days or 1
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.Manager), [
+            {"id": m, "name": f"manager{i:04d}", "isdefault": "off", "isadmin": "on" if i == 0 else "off"}
+            for i, m in enumerate(mgr_ids)])
+        conn.execute(insert(models.Account), [
+            {"id": f"acct{i:06d}", "key": k, "description": f"{rnd.choice(ITEMS)} - {k[:8]}"}
+            for i, k in enumerate(keys)])
+        assignments = []
+        for i, k in enumerate(keys):
+            for m in rnd.sample(mgr_ids, k=min(len(mgr_ids), rnd.choice((1, 1, 1, 2)))):
+                assignments.append({"id": f"am{len(assignments):07d}", "key": k, "manager_id": m})
+        conn.execute(insert(models.AcctMgr), assignments)
+    log(f"managers={managers} accounts={accounts} acct_mgrs={len(assignments)}")
+
+    def budget_rows():
+        n = 0
+        per_account = max(1, budget_lines // max(1, accounts))
+        for fy in fiscal_years:
+            for k in keys:
+                for line in range(per_account):
+                    if n >= budget_lines * len(fiscal_years):
+                        return
+                    yield {"id": f"b{n:08d}", "acct5": k, "line": f"{line:02d}", "fiscal_year": fy,
+                           "description": "Imported budget" if line == 0 else f"{rnd.choice(ITEMS)} line {line}",
+                           "amount_cents": rnd.randint(50000, 25000000)}
+                    n += 1
+
+    with engine.begin() as conn:
+        for batch in chunked(budget_rows()):
+            conn.execute(insert(models.BudgetItem), batch)
+    log(f"budget_items={budget_lines * len(fiscal_years)}")
+
+    def actual_rows():
+        for n in range(actuals):
+            k = keys[rnd.randrange(accounts)]
+            day = first_day + datetime.timedelta(days=rnd.randrange(days))
+            yield {"id": f"a{n:09d}", "acct5": k, "line": f"{rnd.randint(0, 9):02d}",
+                   "tr_date": day.isoformat(), "fiscal_year": fiscal.fiscal_year(day), "description": f"{rnd.choice(ITEMS)} inv {rnd.randint(1000, 99999)}",
+                   "amount_cents": round(rnd.lognormvariate(5, 1.2) * 100), "seq": float(1 + n * 5),
+                   "vendor_name": rnd.choice(VENDORS), "vouchno": f"{300000 + n // 3:07d}"}
+
+    written = 0
+    for batch in chunked(actual_rows()):
+        with engine.begin() as conn:
+            conn.execute(insert(models.ActualItem), batch)
+        written += len(batch)
+        if written % 200000 == 0:
+            log(f"  actual_items {written}/{actuals}")
+    log(f"actual_items={actuals}")
+    engine.dispose()
+    elapsed = time.perf_counter() - t0
+    log(f"generated {db_path} in {elapsed:.1f}s")
+    return {"db": db_path, "accounts": accounts, "managers": managers, "budget_lines": budget_lines,
+            "actuals": actuals, "years": fiscal_years, "seed": seed, "sample_key": keys[0], "sample_manager": mgr_ids[0],
+            "seconds": round(elapsed, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="SQLite file to create (replaced if it exists)")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--accounts", type=int)
+    parser.add_argument("--managers", type=int)
+    parser.add_argument("--budget-lines", type=int)
+    parser.add_argument("--actuals", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--years", type=int, default=1, help="fiscal years of history; actuals are spread over all")
+    args = parser.parse_args()
+    sizes = dict(SCALES[args.scale])
+    for name in sizes:
+        value = getattr(args, name)
+        if value is not None:
+            sizes[name] = value
+    generate(args.db, seed=args.seed, years=args.years, **sizes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Benchmark runner: times the /api/* endpoints, the page routes and the import
+paths through the FastAPI TestClient against a generated dataset.
+
+Results are written as JSON and compared with a stored baseline, so a change
+that slows an endpoint down shows up as a number rather than a feeling.
+
+Usage:
+    python bench/datagen.py --db /tmp/bench.db --scale medium
+    python bench/run.py --db /tmp/bench.db --save-baseline        # first run
+    python bench/run.py --db /tmp/bench.db                        # later runs compare
+    python bench/run.py --db /tmp/bench.db --only line-items --repeat 10
+
+The dataset is copied before the run, so the import benchmarks never modify
+the generated file.  After the imports the run checks that no actual seq was
+handed out twice (one of the CSV imports has a rejected batch retried row by
+row) and fails if one was.
+"""
+import argparse
+import base64
+import datetime
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "bench")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, "results")
+
+PAGES = ["/", "/managers", "/accounts", "/budgets", "/assign", "/actuals"]
+
+
+def b64(s: str) -> str:
+    return base64.b64encode(s.encode()).decode()
+
+
+def server_timing_queries(header: str | None) -> int | None:
+    if not header:
+        return None
+    m = re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', header)
+    return int(m.group(1)) if m else None
+
+
+def timed(client, method: str, url: str, repeat: int, files_factory=None) -> dict:
+    samples = []
+    resp = None
+    for _ in range(repeat):
+        # uploads are rebuilt per run so repeated imports don't collide on ids
+        files = files_factory() if files_factory else None
+        t0 = time.perf_counter()
+        resp = client.request(method, url, files=files)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "status": resp.status_code,
+        "bytes": len(resp.content),
+        "queries": server_timing_queries(resp.headers.get("server-timing")),
+        "min_ms": round(samples[0], 2),
+        "median_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+        "samples": len(samples),
+    }
+
+
+def api_cases(app, key: str, manager: str) -> list[tuple[str, str]]:
+    """(name, url) pairs: explicit parameterised cases plus every parameterless GET /api route."""
+    cases = [
+        ("home-items?manager", f"/api/home-items?manager={manager}"),
+        ("line-items?manager", f"/api/line-items?manager={manager}"),
+        ("line-items?acct5", f"/api/line-items?acct5={key}"),
+        ("actual-items?acct5", f"/api/actual-items?acct5={key}"),
+        ("actual-items?manager", f"/api/actual-items?manager={manager}"),
+        ("budget-items?manager", f"/api/budget-items?manager={manager}"),
+        ("assign-items?manager", f"/api/assign-items?manager={manager}"),
+        ("assign-items?none", "/api/assign-items?manager=__none__"),
+        ("managers-for-account", f"/api/managers-for-account/{key}"),
+        ("budget/next-line", f"/api/budget/next-line/{key}"),
+        ("next-line/actuals", f"/api/next-line/actuals/{key}"),
+        ("export/line-items.csv", "/api/export/line-items?format=csv"),
+        ("export/actuals.ndjson", "/api/export/actuals?format=ndjson"),
+        ("export/summary.xlsx", "/api/export/summary.xlsx"),
+    ]
+    for route in app.routes:
+        path = getattr(route, "path", "")
+        methods = getattr(route, "methods", None) or set()
+        if path.startswith("/api/") and "GET" in methods and "{" not in path:
+            cases.append((path[len("/api/"):], path))
+    seen, unique = set(), []
+    for name, url in cases:
+        if name not in seen:
+            seen.add(name)
+            unique.append((name, url))
+    return unique
+
+
+def actuals_csv(n: int, key: str, duplicate: bool = False) -> bytes:
+    buf = io.StringIO()
+    buf.write("id,acct5,line,description,amount,tr_date,vendor_name,vouchno\n")
+    stamp = int(time.time() * 1000)
+    for i in range(n):
+        # with `duplicate` the last row repeats the first id: its batch is rejected and retried row by row
+        rid = 0 if duplicate and i == n - 1 and n > 1 else i
+        what = "bench dup row" if duplicate else "bench row"
+        buf.write(f"bench{stamp}-{rid},{key},{i % 10:02d},{what} {i},{(i % 997) + 0.25},"
+                  f"{datetime.date.today().isoformat()},Bench Vendor,{900000 + i}\n")
+    return buf.getvalue().encode()
+
+
+def budget_xlsx(n: int, key: str) -> bytes:
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Budget")
+    ws.append(["GL", "Line", "Description", "Amount"])
+    for i in range(n):
+        ws.append([f"{key[:-2]}{i % 100:02d}", 20 + i // 100 % 80, f"bench line {i}", float(i % 5000)])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def import_cases(key: str, csv_rows: int, xlsx_rows: int) -> list[tuple]:
+    xlsx_body = budget_xlsx(xlsx_rows, key)
+    return [
+        (f"import/actuals.csv[{csv_rows}]", "POST", "/api/import/actuals",
+         lambda: {"file": ("actuals.csv", actuals_csv(csv_rows, key))}),
+        (f"import/actuals.csv[{csv_rows},dup]", "POST", "/api/import/actuals",
+         lambda: {"file": ("actuals.csv", actuals_csv(csv_rows, key, duplicate=True))}),
+        (f"import/budget.xlsx[{xlsx_rows}]", "POST", "/api/import/budget.xlsx",
+         lambda: {"file": ("budget.xlsx", xlsx_body)}),
+    ]
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list[str]:
+    regressions = []
+    base = baseline.get("results", {})
+    print(f"\n{'benchmark':<42} {'base ms':>9} {'now ms':>9} {'change':>8}")
+    for name, now in results["results"].items():
+        old = base.get(name)
+        if not old:
+            print(f"{name:<42} {'-':>9} {now['median_ms']:>9.1f} {'new':>8}")
+            continue
+        ratio = now["median_ms"] / old["median_ms"] if old["median_ms"] else 1.0
+        flag = ""
+        if ratio > 1 + threshold and now["median_ms"] - old["median_ms"] > min_delta_ms:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<42} {old['median_ms']:>9.1f} {now['median_ms']:>9.1f} {(ratio - 1) * 100:>+7.0f}%{flag}")
+    if baseline.get("meta", {}).get("dataset") != results["meta"].get("dataset"):
+        print("\nnote: baseline was recorded against a different dataset")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", required=True, help="dataset produced by bench/datagen.py")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="regex; run only benchmarks whose name matches")
+    parser.add_argument("--skip-imports", action="store_true")
+    parser.add_argument("--csv-rows", type=int, default=20000)
+    parser.add_argument("--xlsx-rows", type=int, default=5000)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown that counts as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore slowdowns smaller than this")
+    parser.add_argument("--out", default=DEFAULT_RESULTS, help="directory for result JSON files")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="budget-bench-")
+    work_db = os.path.join(workdir, "bench.db")
+    shutil.copyfile(args.db, work_db)
+    os.environ["BUDGET_DB_PATH"] = work_db
+    os.environ.setdefault("APP_ROOT", ROOT)
+    os.environ["QUERY_BUDGET"] = "0"
+    sys.path.insert(0, ROOT)
+
+    import sqlalchemy as sa
+    probe = sa.create_engine("sqlite:///" + work_db)
+    with probe.connect() as conn:
+        key = conn.execute(sa.text("select key from accounts order by key limit 1")).scalar()
+        manager = conn.execute(sa.text("select manager_id from acct_mgrs group by manager_id "
+                                       "order by count(*) desc limit 1")).scalar()
+        counts = {t: conn.execute(sa.text(f"select count(*) from {t}")).scalar()
+                  for t in ("accounts", "managers", "acct_mgrs", "budget_items", "actual_items")}
+    probe.dispose()
+
+    from fastapi.testclient import TestClient
+    import app as app_module
+    # record 500s as results instead of aborting the run
+    client = TestClient(app_module.app, raise_server_exceptions=False)
+    client.cookies.set("session", "bench")
+    client.cookies.set("user", b64("bench"))
+    client.cookies.set("uid", b64(manager))
+
+    only = re.compile(args.only) if args.only else None
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dataset": counts,
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+
+    def record(name, method, url, files_factory=None):
+        if only and not only.search(name):
+            return
+        r = timed(client, method, url, args.repeat, files_factory)
+        results["results"][name] = r
+        q = "" if r["queries"] is None else f"{r['queries']:>6} q"
+        print(f"{name:<42} {r['status']:>4} {r['median_ms']:>10.1f} ms  p95 {r['p95_ms']:>9.1f}  {r['bytes']:>11} B {q}",
+              flush=True)
+
+    print(f"dataset: {counts}")
+    for name, url in api_cases(app_module.app, key, manager):
+        record("api/" + name, "GET", url)
+    for page in PAGES:
+        record("page" + page, "GET", page)
+    reused = 0
+    if not args.skip_imports:
+        for name, method, url, factory in import_cases(key, args.csv_rows, args.xlsx_rows):
+            record(name, method, url, files_factory=factory)
+        # every seq is handed out once, also to the rows of a rejected batch retried row by row:
+        # no value is stored twice and the counter is past all of them; the run fails otherwise
+        with app_module.engine.connect() as conn:
+            reused = conn.execute(sa.text(
+                "select (select count(*) - count(distinct seq) from actual_items where seq is not null)"
+                " + (select count(*) from actual_items where seq >="
+                " (select next_value from sequences where name = 'actual_items.seq'))")).scalar()
+        if reused:
+            print(f"\n{reused} actual seq value(s) handed out twice or not reserved")
+
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(out_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults written to {out_path}")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    if reused:
+        return 1
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            return 1
+    else:
+        print(f"no baseline at {args.baseline}; run with --save-baseline to create one")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,13 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func, and_
-from sqlalchemy.types import Float
+from sqlalchemy import select, func, and_, null, delete, cast, Integer
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import uuid
 import models
 import schemas
+from utils.money import to_cents, from_cents
+from utils import fiscal
+from utils.sequences import ACTUAL_SEQ
+from utils.text import contains
 
 
 # ---------- Managers ----------
@@ -81,6 +86,48 @@ def delete_acct_mgr(db: Session, record_id: str):
     db.commit()
     return True
 
+ASSIGN_MODES = ("add", "remove", "toggle")
+
+def bulk_assign_managers(db: Session, account_ids: list[str], manager_id: str, mode: str = "toggle") -> dict:
+    """Add, remove or toggle manager_id on many accounts in one transaction.
+
+    Account keys and the manager's current assignments are each read with one
+    query; inserts rely on the unique (key, manager_id) constraint, so running
+    the same add twice cannot create duplicates.
+    """
+    if mode not in ASSIGN_MODES:
+        raise ValueError(f"mode must be one of {', '.join(ASSIGN_MODES)}")
+    ids = list(dict.fromkeys(account_ids))
+    keys, current = {}, set()
+    # chunked to stay under SQLite's bound-parameter limit
+    for i in range(0, len(ids), 500):
+        keys.update(db.execute(select(models.Account.id, models.Account.key)
+                               .where(models.Account.id.in_(ids[i:i + 500]))).all())
+    key_list = list(dict.fromkeys(keys.values()))
+    for i in range(0, len(key_list), 500):
+        current.update(db.execute(select(models.AcctMgr.key)
+                                  .where(models.AcctMgr.manager_id == manager_id,
+                                         models.AcctMgr.key.in_(key_list[i:i + 500]))).scalars())
+    if mode == "add":
+        to_add, to_remove = [k for k in key_list if k not in current], []
+    elif mode == "remove":
+        to_add, to_remove = [], [k for k in key_list if k in current]
+    else:
+        to_add = [k for k in key_list if k not in current]
+        to_remove = [k for k in key_list if k in current]
+    added = removed = 0
+    if to_add:
+        stmt = sqlite_insert(models.AcctMgr.__table__).on_conflict_do_nothing(index_elements=["key", "manager_id"])
+        added = db.execute(stmt, [{"id": uuid.uuid4().hex, "key": k, "manager_id": manager_id}
+                                  for k in to_add]).rowcount
+    for i in range(0, len(to_remove), 500):
+        removed += db.execute(delete(models.AcctMgr)
+                              .where(models.AcctMgr.manager_id == manager_id,
+                                     models.AcctMgr.key.in_(to_remove[i:i + 500]))).rowcount
+    db.commit()
+    return {"added": added, "removed": removed, "accounts": len(keys),
+            "missing": [i for i in ids if i not in keys]}
+
 
 # ---------- Accounts ----------
 def list_accounts(db: Session):
@@ -95,9 +142,9 @@ def account_list(db: Session, filter_acct: str | None = None,
     else:
         query = select(models.Account)
     if filter_acct:
-        query = query.where(models.Account.key.like(f"%{filter_acct}%"))
+        query = query.where(contains(models.Account.key, filter_acct))
     if filter_desc:
-        query = query.where(models.Account.description.like(f"%{filter_desc}%"))
+        query = query.where(contains(models.Account.description, filter_desc))
 
     accounts = db.execute(query).scalars().all()
     # return only account keys
@@ -116,14 +163,14 @@ def get_account_glkey(db: Session, id: str):
     return obj.key if obj else None
 
 def create_account(db: Session, acc: schemas.AccountCreate):
-    obj = models.Account(id=acc.id, key=acc.key, description=acc.description, manager_id=acc.manager_id)
+    obj = models.Account(id=acc.id, key=acc.key, description=acc.description)
     db.add(obj); db.commit(); db.refresh(obj); return obj
 
 def update_account(db: Session, id: str, acc: schemas.AccountBase):
     obj = get_account(db, id)
     if not obj:
         return None
-    obj.key = acc.key; obj.description = acc.description; obj.manager_id = acc.manager_id
+    obj.key = acc.key; obj.description = acc.description
     db.commit(); db.refresh(obj); return obj
 
 def delete_account(db: Session, id: str):
@@ -144,9 +191,23 @@ def get_account_by_key(db: Session, key: str):
     search_result = db.execute(select(models.Account).where(models.Account.key == key)).scalars().first()
     return search_result
 
+def _in_year(stmt, model, fiscal_year: int | None):
+    # served by the (fiscal_year, acct5, line) index; None means every year
+    return stmt if fiscal_year is None else stmt.where(model.fiscal_year == fiscal_year)
+
 # ---------- Budget Items ----------
-def list_budget(db: Session):
-    return db.execute(select(models.BudgetItem)).scalars().all()
+def list_budget(db: Session, fiscal_year: int | None = None):
+    return db.execute(_in_year(select(models.BudgetItem), models.BudgetItem, fiscal_year)).scalars().all()
+
+def list_budget_rows(db: Session, fiscal_year: int | None = None) -> list[dict]:
+    """Return budget items as plain dicts shaped like schemas.LineItem.
+    Skips ORM object construction and Pydantic validation; use only for trusted list responses.
+    """
+    t = models.BudgetItem
+    stmt = select(t.id, t.acct5, t.line, t.description, t.amount,
+                  null().label('seq'), null().label('tr_date'),
+                  null().label('vendor_name'), null().label('vouchno'))
+    return [dict(r) for r in db.execute(_in_year(stmt, t, fiscal_year)).mappings()]
 
 def get_budget_item(db: Session, id: str):
     return db.get(models.BudgetItem, id)
@@ -168,8 +229,20 @@ def delete_budget_item(db: Session, id: str):
         return False
     db.delete(obj); db.commit(); return True
 
-def get_budget_item_by_acct_line(db: Session, acct5: str, line: str):
-    return db.execute(select(models.BudgetItem).where(models.BudgetItem.acct5 == acct5, models.BudgetItem.line == line)).scalars().first()
+def create_budget_line(db: Session, acct5: str, description: str, amount: float, line: str | None = None):
+    """Add a budget line, allocating its number unless a free `line` is given; one transaction."""
+    allocated = allocate_line(db, models.BudgetItem, acct5)
+    if not line or get_budget_item_by_acct_line(db, acct5, line):
+        # no line asked for, or someone else took it since the form was filled in
+        line = allocated
+    obj = models.BudgetItem(id=uuid.uuid4().hex, acct5=acct5, line=line, description=description, amount=amount)
+    db.add(obj); db.commit(); db.refresh(obj); return obj
+
+def get_budget_item_by_acct_line(db: Session, acct5: str, line: str, fiscal_year: int | None = None):
+    # budget lines are edited in the current fiscal year unless another one is given
+    t = models.BudgetItem
+    stmt = select(t).where(t.acct5 == acct5, t.line == line)
+    return db.execute(_in_year(stmt, t, fiscal_year or fiscal.current_fiscal_year())).scalars().first()
 
 def upsert_budget_item(db: Session, acct5: str, line: str, description: str, amount: float):
     obj = get_budget_item_by_acct_line(db, acct5, line)
@@ -184,13 +257,20 @@ def upsert_budget_item(db: Session, acct5: str, line: str, description: str, amo
         return new, True
 
 # ---------- Actual Items ----------
-def list_actuals(db: Session):
-    return db.execute(select(models.ActualItem)).scalars().all()
+def list_actuals(db: Session, fiscal_year: int | None = None):
+    return db.execute(_in_year(select(models.ActualItem), models.ActualItem, fiscal_year)).scalars().all()
+
+def list_actual_rows(db: Session, fiscal_year: int | None = None) -> list[dict]:
+    """Return actual items as plain dicts shaped like schemas.LineItem (see list_budget_rows)."""
+    t = models.ActualItem
+    stmt = select(t.id, t.acct5, t.line, t.description, t.amount,
+                  t.seq, t.tr_date, t.vendor_name, t.vouchno)
+    return [dict(r) for r in db.execute(_in_year(stmt, t, fiscal_year)).mappings()]
 
 def list_actuals_filtered(db: Session, acct5: str | None = None, description: str | None = None, vendor: str | None = None, manager: str | None = None):
     """Return actual items optionally filtered by acct5 (exact), description (contains, case-insensitive),
     vendor_name (contains, case-insensitive), and manager (by joining accounts -> manager_id).
-    Uses lower() + COALESCE to be portable across DBs.
+    Uses lower() + COALESCE to be portable across DBs; see utils/text.py.
     """
     stmt = select(models.ActualItem)
     conds = []
@@ -201,11 +281,9 @@ def list_actuals_filtered(db: Session, acct5: str | None = None, description: st
     if acct5:
         conds.append(models.ActualItem.acct5 == acct5)
     if description:
-        pat = f"%{description.lower()}%"
-        conds.append(func.lower(func.coalesce(models.ActualItem.description, '')).like(pat))
+        conds.append(contains(models.ActualItem.description, description))
     if vendor:
-        patv = f"%{vendor.lower()}%"
-        conds.append(func.lower(func.coalesce(models.ActualItem.vendor_name, '')).like(patv))
+        conds.append(contains(models.ActualItem.vendor_name, vendor))
     if conds:
         stmt = stmt.where(and_(*conds))
     return db.execute(stmt).scalars().all()
@@ -214,10 +292,11 @@ def get_actual_item(db: Session, id: str):
     return db.get(models.ActualItem, id)
 
 def create_actual_item(db: Session, it: schemas.LineItemCreate):
-    # calculate next seq number if not provided
+    # take the next seq number if not provided
     if it.seq is None:
-        max_seq = db.execute(select(func.max(models.ActualItem.seq))).scalar()
-        it.seq = float(max_seq + 5) if max_seq is not None else 1.0
+        it.seq = ACTUAL_SEQ.next()
+    if not it.line:
+        it.line = allocate_line(db, models.ActualItem, it.acct5)
     obj = models.ActualItem(
         id=it.id,
         acct5=it.acct5,
@@ -255,12 +334,12 @@ def delete_actual_item(db: Session, id: str):
     return True
 
 def actual_exists_ignore_line(db: Session, acct5: str, description: str, amount: float, tr_date: str | None, vendor_name: str | None) -> bool:
-    eps = 0.005  # 1/2 cent tolerance
-    stmt = select(models.ActualItem).where(
+    # exact match on integer cents, served by the (acct5, amount_cents) index
+    stmt = select(models.ActualItem.id).where(
         and_(
             models.ActualItem.acct5 == acct5,
+            models.ActualItem.amount_cents == to_cents(amount),
             models.ActualItem.description == description,
-            func.abs(models.ActualItem.amount - amount) <= eps,
             (models.ActualItem.tr_date == tr_date if tr_date is not None else models.ActualItem.tr_date.is_(None)),
             (models.ActualItem.vendor_name == vendor_name if vendor_name is not None else models.ActualItem.vendor_name.is_(None)),
         )
@@ -268,28 +347,51 @@ def actual_exists_ignore_line(db: Session, acct5: str, description: str, amount:
     return db.execute(stmt).scalars().first() is not None
 
 # ---------- Helpers ----------
-def next_line_for_account(db: Session, table, acct5: str) -> str:
-    # Ensure line is cast to integer safely for max calculation
-    max_line = db.query(func.max(func.cast(table.line, Float))).filter(table.acct5 == acct5).scalar()
-    n = int(max_line or 0) + 1
-    return f"{n:02d}"
-
+def _max_line(table, acct5: str):
+    # served by the (acct5, line) index: only this account's entries are read
+    return (select(func.coalesce(func.max(cast(table.line, Integer)), 0))
+            .where(table.acct5 == acct5).scalar_subquery())
 
-def get_budget_total_for_account(db, a:str) -> float | None:
-    result = db.execute(
-        select(models.BudgetItem.amount).where(models.BudgetItem.acct5 == a)
+def next_line_for_account(db: Session, table, acct5: str) -> str:
+    """The line allocate_line would hand out next, without reserving it (for prefilling forms)."""
+    c = models.LineCounter
+    counter = (select(c.last_line).where(c.kind == table.__tablename__, c.acct5 == acct5)
+               .scalar_subquery())
+    n = db.execute(select(func.max(func.coalesce(counter, 0), _max_line(table, acct5)))).scalar()
+    return f"{n + 1:02d}"
+
+def allocate_line(db: Session, table, acct5: str) -> str:
+    """Reserve the next line number for acct5 in `table` inside the caller's transaction.
+
+    One INSERT ... ON CONFLICT DO UPDATE ... RETURNING on line_counters takes the
+    SQLite write lock, so concurrent callers always get different numbers.  The
+    counter is seeded from (and never falls behind) the highest existing line.
+    """
+    t = models.LineCounter.__table__
+    stmt = sqlite_insert(t).values(kind=table.__tablename__, acct5=acct5, last_line=_max_line(table, acct5) + 1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[t.c.kind, t.c.acct5],
+        set_={"last_line": func.max(t.c.last_line + 1, stmt.excluded.last_line)},
+    ).returning(t.c.last_line)
+    return f"{db.execute(stmt).scalar_one():02d}"
+
+
+def get_budget_total_for_account(db, a:str, fiscal_year: int | None = None) -> float | None:
+    # sum in integer cents, converted once
+    result = db.execute(_in_year(
+        select(func.sum(models.BudgetItem.amount_cents)).where(models.BudgetItem.acct5 == a),
+        models.BudgetItem, fiscal_year)
     ).scalar()
-    if result is None:
-        result = 0.0
-    return result
+    return from_cents(result or 0)
 
 
-def get_actual_total_for_account(db, a:str) -> float | None:
+def get_actual_total_for_account(db, a:str, fiscal_year: int | None = None) -> float | None:
     # calculate the sum of actual_items.amount where acct5 == a
-    result = db.execute(
-        select(func.sum(models.ActualItem.amount)).where(models.ActualItem.acct5 == a)
+    result = db.execute(_in_year(
+        select(func.sum(models.ActualItem.amount_cents)).where(models.ActualItem.acct5 == a),
+        models.ActualItem, fiscal_year)
     ).scalar_one_or_none()
-    return float(result) if result is not None else 0.0
+    return from_cents(result or 0)
 
 def get_account_description_for_account(db, a:str) -> str | None:
     result = db.execute(
@@ -300,15 +402,14 @@ def get_account_description_for_account(db, a:str) -> str | None:
     return result
 
 
-def actuals_get_by_account_vendor(db, account, filter_vendor):
-    stmt = select(models.ActualItem)
+def actuals_get_by_account_vendor(db, account, filter_vendor, fiscal_year: int | None = None):
+    stmt = _in_year(select(models.ActualItem), models.ActualItem, fiscal_year)
     conds = []
     # If filtering by manager, join Account and add condition on manager_id
     if account:
         conds.append(models.ActualItem.acct5 == account)
     if filter_vendor:
-        pat = f"%{filter_vendor.lower()}%"
-        conds.append(func.lower(func.coalesce(models.ActualItem.vendor_name, '')).like(pat))
+        conds.append(contains(models.ActualItem.vendor_name, filter_vendor))
 
     if conds:
         stmt = stmt.where(and_(*conds))
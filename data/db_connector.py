@@ -16,7 +16,10 @@ connection = db.connection
 # Note that the WMISDB class also includes commented out examples of methods for specific database operations.
 
 """
-import pyodbc
+try:
+    import pyodbc
+except ImportError:  # only required by the SQL Server source provider
+    pyodbc = None
 from dotenv import load_dotenv
 from os import getenv
 
@@ -34,6 +37,10 @@ class DBError(Exception):
         super().__init__(self.message)
 
 
+# columns that should be numeric
+NUMERIC_COLUMNS = {'amount', 'tax', 'freight', 'total', 'total_amount', 'seq'}
+
+
 class DB:
     """
     This class is used to connect to the WMIS database, and provide a connection object.
@@ -90,20 +97,21 @@ class DB:
 
 
     def _connection_(self):
+        if pyodbc is None:
+            raise DBError("pyodbc is not installed; set SOURCE_PROVIDER=replay to use captured data")
         if self.connection is None:
             self.connection = pyodbc.connect(self._conn_str_())
         return self.connection
 
     @staticmethod
-    def extract_row(row: pyodbc.Cursor):
+    def extract_row(row: "pyodbc.Row"):
         """
         extract_row is a static method that takes a pyodbc cursor object and returns a dictionary of the row data.
         each field in the row is converted to a string and the dictionary keys are converted to lower case.
         """
         r = {}
         i = 0
-        # columns that should be numeric
-        numeric_cols = {'amount', 'tax', 'freight', 'total', 'total_amount', 'seq'}
+        numeric_cols = NUMERIC_COLUMNS
         try:
             for item in row.cursor_description:
                 name = item[0]
@@ -0,0 +1,218 @@
+"""
+Source providers for the ERP queries behind Data and /voucher-lines.
+
+A provider runs one of the named source queries and returns its rows as
+dicts with lower-cased keys, the same shape DB.extract_row produces:
+
+    gl_list        sql/01-gl-listing.sql
+    actual_items   sql/02-actual-items.sql
+    voucher_lines  sql/03-voucher-lines.sql   (one parameter: vouchno)
+    budget_import  sql/04-budget.sql
+
+SOURCE_PROVIDER selects the implementation:
+
+    sqlserver (default)  live queries through pyodbc (data.db_connector.DB)
+    replay               captured result sets from SOURCE_REPLAY_DIR, so imports
+                         and /voucher-lines can be exercised and load-tested
+                         without the production ERP
+
+Replay files are looked up per query name as <name>.csv, <name>.parquet
+(needs pyarrow) or a table <name> in <SOURCE_REPLAY_DIR>/replay.db.
+SOURCE_REPLAY_LATENCY_MS adds a fixed delay per query and
+SOURCE_REPLAY_ROWS_PER_SEC throttles delivery to mimic a slow link.
+
+Capture a replay set from the live server with:
+
+    python -m data.providers capture --out ./replay [--vouchno 123456 ...]
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+
+from dotenv import load_dotenv
+
+from utils.instrumentation import source_timer
+from .db_connector import DB, DBError, NUMERIC_COLUMNS
+
+load_dotenv()
+
+QUERIES = {
+    "gl_list": "01-gl-listing.sql",
+    "actual_items": "02-actual-items.sql",
+    "voucher_lines": "03-voucher-lines.sql",
+    "budget_import": "04-budget.sql",
+}
+
+
+def read_sql(name: str) -> str:
+    app_root = os.getenv("APP_ROOT", "./")
+    sql_path = os.path.join(app_root, "sql", QUERIES[name])
+    if not os.path.exists(sql_path):
+        raise DBError(f"SQL file not found: {sql_path}")
+    with open(sql_path, "r") as f:
+        sql = f.read()
+    # the voucher query is stored with a {vouchno} placeholder; bind it instead of formatting it in
+    return sql.replace("{vouchno}", "?")
+
+
+def normalize_value(name: str, value):
+    """Coerce a captured value the way DB.extract_row does: numeric columns to float, the rest to str."""
+    if value is None:
+        return None
+    if name in NUMERIC_COLUMNS:
+        if value == "":
+            # CSV captures can't tell NULL from empty; numeric NULLs come back empty
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            try:
+                return float(str(value).strip() or 0.0)
+            except ValueError:
+                return 0.0
+    return str(value)
+
+
+class SourceProvider(ABC):
+    """Runs a named source query and returns its rows as dicts."""
+    name = ""
+
+    @abstractmethod
+    def fetch(self, query: str, params: tuple = ()) -> list[dict]:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class SqlServerProvider(SourceProvider):
+    name = "sqlserver"
+
+    def __init__(self):
+        self.db = DB()
+
+    def fetch(self, query: str, params: tuple = ()) -> list[dict]:
+        sql = read_sql(query)
+        cursor = self.db.connection.cursor()
+        with source_timer():
+            rows = cursor.execute(sql, *params)
+            return [self.db.extract_row(row) for row in rows]
+
+    def close(self) -> None:
+        if self.db and self.db.connection:
+            self.db.connection.close()
+        self.db = None
+
+
+class ReplayProvider(SourceProvider):
+    name = "replay"
+
+    # parameterised queries filter the captured rows on these columns
+    PARAM_COLUMNS = {"voucher_lines": ("vouchno",)}
+
+    def __init__(self, directory: str | None = None, latency_ms: float | None = None,
+                 rows_per_sec: float | None = None):
+        self.directory = directory or os.getenv("SOURCE_REPLAY_DIR", "./replay")
+        self.latency_ms = float(os.getenv("SOURCE_REPLAY_LATENCY_MS", "0") if latency_ms is None else latency_ms)
+        self.rows_per_sec = float(os.getenv("SOURCE_REPLAY_ROWS_PER_SEC", "0") if rows_per_sec is None else rows_per_sec)
+
+    def _read(self, query: str) -> list[dict]:
+        base = os.path.join(self.directory, query)
+        if os.path.exists(base + ".csv"):
+            with open(base + ".csv", newline="", encoding="utf-8-sig") as f:
+                return [{k.lower(): v for k, v in row.items()} for row in csv.DictReader(f)]
+        if os.path.exists(base + ".parquet"):
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise DBError("pyarrow is required to replay .parquet captures")
+            return [{k.lower(): v for k, v in row.items()} for row in pq.read_table(base + ".parquet").to_pylist()]
+        fixture = os.path.join(self.directory, "replay.db")
+        if os.path.exists(fixture):
+            conn = sqlite3.connect(fixture)
+            try:
+                conn.row_factory = sqlite3.Row
+                rows = conn.execute(f'SELECT * FROM "{query}"').fetchall()
+                return [{k.lower(): row[k] for k in row.keys()} for row in rows]
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                conn.close()
+        raise DBError(f"No replay data for '{query}' in {self.directory}")
+
+    def fetch(self, query: str, params: tuple = ()) -> list[dict]:
+        with source_timer():
+            if self.latency_ms:
+                time.sleep(self.latency_ms / 1000.0)
+            rows = self._read(query)
+            for col, value in zip(self.PARAM_COLUMNS.get(query, ()), params):
+                rows = [r for r in rows if str(r.get(col) or "") == str(value)]
+            results = [{k: normalize_value(k, v) for k, v in r.items()} for r in rows]
+            if self.rows_per_sec:
+                time.sleep(len(results) / self.rows_per_sec)
+        return results
+
+
+PROVIDERS = {
+    SqlServerProvider.name: SqlServerProvider,
+    ReplayProvider.name: ReplayProvider,
+}
+
+
+def get_provider() -> SourceProvider:
+    kind = os.getenv("SOURCE_PROVIDER", SqlServerProvider.name).lower()
+    if kind not in PROVIDERS:
+        raise DBError(f"Unknown SOURCE_PROVIDER '{kind}'")
+    return PROVIDERS[kind]()
+
+
+def write_csv(path: str, rows: list[dict]) -> None:
+    fields = []
+    for r in rows:
+        for k in r:
+            if k not in fields:
+                fields.append(k)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def capture(out_dir: str, vouchnos: list[str] | None = None) -> dict:
+    """Run the source queries against SQL Server and save the result sets as replay CSVs."""
+    os.makedirs(out_dir, exist_ok=True)
+    provider = SqlServerProvider()
+    counts = {}
+    try:
+        for query in ("gl_list", "actual_items", "budget_import"):
+            rows = provider.fetch(query)
+            write_csv(os.path.join(out_dir, query + ".csv"), rows)
+            counts[query] = len(rows)
+        lines = []
+        for v in vouchnos or []:
+            for row in provider.fetch("voucher_lines", (v,)):
+                lines.append({"vouchno": v, **row})
+        if lines:
+            write_csv(os.path.join(out_dir, "voucher_lines.csv"), lines)
+        counts["voucher_lines"] = len(lines)
+    finally:
+        provider.close()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture ERP result sets for the replay source provider.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cap = sub.add_parser("capture")
+    cap.add_argument("--out", default="./replay")
+    cap.add_argument("--vouchno", action="append", help="voucher number to capture lines for (repeatable)")
+    args = parser.parse_args()
+    if args.command == "capture":
+        print(capture(args.out, args.vouchno))
+
+
+if __name__ == "__main__":
+    main()
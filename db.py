@@ -1,15 +1,43 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
 import os
+from utils import instrumentation, metrics
+import time
 
 load_dotenv()
 dbpath = os.getenv("BUDGET_DB_PATH", "./budget.db")
 SQLALCHEMY_DATABASE_URL = "sqlite:///" + dbpath
+# how long a statement waits for another connection's write lock before 'database is locked'
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.db_pool_wait.observe(time.perf_counter() - started)
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, pool_size=20, max_overflow=-1, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool, pool_size=20, max_overflow=-1,
+    connect_args={"check_same_thread": False}
 )
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets requests read while an import, the dedupe or the archive job holds the write
+    # lock for its whole transaction; writers queue for up to the busy timeout
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+event.listen(engine, "connect", _sqlite_pragmas)
+event.listen(engine, "before_cursor_execute", instrumentation.before_cursor_execute)
+event.listen(engine, "after_cursor_execute", instrumentation.after_cursor_execute)
+event.listen(engine, "handle_error", instrumentation.handle_error)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -1,21 +1,47 @@
-import uuid
+import datetime
+import os
 from fastapi import (APIRouter, Depends, HTTPException,
                      UploadFile, File, Request, Query)
-from fastapi import status
-from typing import List, Dict
+from typing import List, Literal
 from sqlalchemy.orm import Session
-from sqlalchemy import Table, MetaData
 from starlette.responses import RedirectResponse
 from db import get_db
-from data.data import Data
 import models
 import schemas
 import crud
 import csv, io
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+from utils.responses import FastJSONResponse
+from misc import (exports, imports, xlsx_export, erp_imports, line_report, snapshot, archive, yoy_report,
+                  monthly_report, segment_report, forecast, batch)
+from utils import jobs, scheduler, fiscal, gl
 
 router = APIRouter(prefix="/api", tags=["api"])
 
+
+def fiscal_year_param(fiscal_year: int | None = Query(default=None, description="Fiscal year (default: the current one)")) -> int:
+    return fiscal_year or fiscal.current_fiscal_year()
+
+
+def ledger_db(fy: int = Depends(fiscal_year_param)):
+    """Session for reading the requested fiscal year: live tables, or the year's archive file."""
+    yield from archive.get_db(fy)
+
+
+def segment_params(seg1: str | None = Query(default=None, description="GL fund segment, e.g. 52100"),
+                   seg2: str | None = Query(default=None, description="GL department segment, e.g. 03"),
+                   seg3: str | None = Query(default=None, description="GL segment 3"),
+                   seg4: str | None = Query(default=None, description="GL segment 4"),
+                   seg5: str | None = Query(default=None, description="GL segment 5")) -> dict[int, str]:
+    """Segment codes to filter accounts by (utils/gl.py), keyed by segment number."""
+    return {i: code for i, code in enumerate((seg1, seg2, seg3, seg4, seg5), 1) if code}
+
+
+def _from_snapshot(fy: int) -> bool:
+    # the snapshot holds the live tables only
+    return snapshot.LEDGER_SNAPSHOT and not archive.is_archived(fy)
+
 # ---- Manager routes (single-record writes) ----
 @router.get("/managers", response_model=List[schemas.Manager])
 def managers_list(db: Session = Depends(get_db)):
@@ -94,8 +120,9 @@ def accounts_delete(id: str, db: Session = Depends(get_db)):
 
 # ---- Budget items ----
 @router.get("/budget", response_model=List[schemas.LineItem])
-def budget_list(db: Session = Depends(get_db)):
-    return crud.list_budget(db)
+def budget_list(fy: int = Depends(fiscal_year_param), db: Session = Depends(ledger_db)):
+    # trusted rows straight from the table: skip ORM objects and response_model validation
+    return FastJSONResponse(content=crud.list_budget_rows(db, fy))
 
 @router.post("/budget", response_model=schemas.LineItem)
 def budget_create(it: schemas.LineItemCreate, db: Session = Depends(get_db)):
@@ -103,49 +130,33 @@ def budget_create(it: schemas.LineItemCreate, db: Session = Depends(get_db)):
 
 @router.get("/budget/next-line/{acct5}")
 def budget_next_line(acct5: str, db: Session = Depends(get_db)):
-    # determine the maximum line for this acct5
-    items = crud.list_budget(db)
-    max_line = -1
-    for it in items:
-        if it.acct5 == acct5:
-            try:
-                line_num = int(it.line)
-                if line_num > max_line:
-                    max_line = line_num
-            except Exception:
-                pass
-    next_line_num = f"{max_line + 1:02d}"
-    return {"next_line": next_line_num}
+    # a suggestion for the add-line form; the number is reserved when the line is added
+    return {"next_line": crud.next_line_for_account(db, models.BudgetItem, acct5)}
 
 @router.post("/budget/add/line/{gl}/{line}/{amount}/{desc}")
 def budget_add_line(
         gl: str, line: str, amount: float, desc: str,
         db: Session = Depends(get_db)):
     try:
-        # Log the received payload for debugging
-        print(f"Received payload: gl={gl}, line={line}, amount={amount}, desc={desc}")
-
-        item: models.BudgetItem = models.BudgetItem()
-        item.acct5 = gl
-        item.line = line
-        item.amount = amount
-        item.description = desc
-        item.id = uuid.uuid4().hex.lower().replace('-', '')
-        obj = crud.create_budget_item(db, item)
-        result = {"msg": item.id, "status": 200}
+        # if the suggested line was taken in the meantime, the next free one is used
+        obj = crud.create_budget_line(db, gl, desc, amount, line=line)
+        result = {"msg": obj.id, "line": obj.line, "status": 200}
     except Exception as exc:
         result = {"msg": f"Error: {exc}", "status": 500 }
 
     return result
 
+@router.post("/budget/lines")
+def budget_line_create(it: schemas.BudgetLineCreate, db: Session = Depends(get_db)):
+    """Add a budget line; the line number is allocated atomically when omitted."""
+    obj = crud.create_budget_line(db, it.acct5, it.description, it.amount, line=it.line)
+    return {"id": obj.id, "acct5": obj.acct5, "line": obj.line, "description": obj.description, "amount": obj.amount}
+
 @router.post("/budget/delete/line/{gl}/{line}")
 def budget_add_line(
         gl: str, line: str,
         db: Session = Depends(get_db)):
     try:
-        # Log the received payload for debugging
-        print(f"Received payload: gl={gl}, line={line}")
-
         record = crud.get_budget_item_by_acct_line(db, gl, line)
         if record:
             crud.delete_budget_item(db, record.id)
@@ -158,6 +169,13 @@ def budget_add_line(
 
     return result
 
+@router.post("/batch")
+def batch_write(req: schemas.BatchRequest, db: Session = Depends(get_db)):
+    """Create, update and delete budget and actual lines in one transaction; all or nothing."""
+    ok, results = batch.apply(db, req.operations)
+    return FastJSONResponse(content={"ok": ok, "results": results},
+                            status_code=200 if ok else 409)
+
 @router.put("/budget/{id}", response_model=schemas.LineItem)
 def budget_update(id: str, it: schemas.LineItemBase, db: Session = Depends(get_db)):
     obj = crud.update_budget_item(db, id, it)
@@ -172,8 +190,9 @@ def budget_delete(id: str, db: Session = Depends(get_db)):
 
 # ---- Actuals items ----
 @router.get("/actuals", response_model=List[schemas.LineItem])
-def actuals_list(db: Session = Depends(get_db)):
-    return crud.list_actuals(db)
+def actuals_list(fy: int = Depends(fiscal_year_param), db: Session = Depends(ledger_db)):
+    # trusted rows straight from the table: skip ORM objects and response_model validation
+    return FastJSONResponse(content=crud.list_actual_rows(db, fy))
 
 @router.post("/actuals", response_model=schemas.LineItem)
 def actuals_create(it: schemas.LineItemCreate, db: Session = Depends(get_db)):
@@ -193,8 +212,8 @@ def actuals_delete(id: str, db: Session = Depends(get_db)):
 
 @router.post("/actuals/delete00")
 def actuals_delete_line00(db: Session = Depends(get_db)):
-    # delete all actual_items with line='00';
-    items = crud.list_actuals(db)
+    # delete the current fiscal year's actual_items with line='00'
+    items = crud.list_actuals(db, fiscal.current_fiscal_year())
     delete_count = 0
     for it in items:
         if it.line == '00':
@@ -204,46 +223,95 @@ def actuals_delete_line00(db: Session = Depends(get_db)):
 
 # ---- CSV import/export ----
 
+@router.get("/export/{kind}.xlsx")
+async def export_xlsx(kind: str,
+                      account: str | None = Query(default=None, description="Filter by Account", alias="acct5"),
+                      manager: str | None = Query(default=None, description="Filter by Manager"),
+                      fy: int = Depends(fiscal_year_param)):
+    # declared before /export/{kind} so 'summary.xlsx' is not taken as a csv kind
+    if kind not in xlsx_export.WORKBOOKS:
+        raise HTTPException(400, "Unknown kind")
+    path = await xlsx_export.render(kind, acct5=account, manager=manager, fiscal_year=fy)
+    return FileResponse(path, media_type=xlsx_export.XLSX_MEDIA_TYPE, filename=f"{kind}.xlsx",
+                        background=BackgroundTask(os.remove, path))
+
+@router.get("/export/{kind}")
+def export_rows(kind: str,
+                format: str = Query(default="csv", description="csv or ndjson"),
+                account: str | None = Query(default=None, description="Filter by Account", alias="acct5"),
+                manager: str | None = Query(default=None, description="Filter by Manager"),
+                fy: int = Depends(fiscal_year_param)):
+    if kind not in exports.EXPORTS:
+        raise HTTPException(400, "Unknown kind")
+    if format not in exports.MEDIA_TYPES:
+        raise HTTPException(400, "Unknown format")
+    body = exports.export_stream(kind, format, acct5=account, manager=manager, fiscal_year=fy)
+    headers = {"Content-Disposition": f'attachment; filename="{kind}.{format}"'}
+    return StreamingResponse(body, media_type=exports.MEDIA_TYPES[format], headers=headers)
+
+@router.post("/import/budget.xlsx")
+def import_budget_xlsx(file: UploadFile = File(...), db: Session = Depends(get_db)):
+    # declared before /import/{kind} so the workbook path is not taken as a csv kind
+    return imports.import_budget_xlsx(db, file.file)
+
 @router.post("/import/{kind}")
 def import_csv(kind: str, file: UploadFile = File(...), db: Session = Depends(get_db)):
-    content = file.file.read().decode('utf-8')
-    reader = csv.DictReader(io.StringIO(content))
-    count = 0
-    if kind == "managers":
-        for row in reader:
-            crud.create_manager(db, schemas.ManagerCreate(**row))
-            count += 1
-    elif kind == "accounts":
-        for row in reader:
-            crud.create_account(db, schemas.AccountCreate(**row))
-            count += 1
-    elif kind == "budget":
-        for row in reader:
-            row['amount'] = float(row.get('amount') or 0)
-            crud.create_budget_item(db, schemas.LineItemCreate(**row))
-            count += 1
-    elif kind == "actuals":
-        for row in reader:
-            row['amount'] = float(row.get('amount') or 0)
-            crud.create_actual_item(db, schemas.LineItemCreate(**row))
-            count += 1
-    else:
+    if kind not in imports.KINDS:
         raise HTTPException(400, "Unknown kind")
-    return {"ok": True, "count": count}
-
-@router.post("/actuals/import")
-def actuals_import(request: Request, db: Session = Depends(get_db)):
-    """
-    Endpoint to import actuals. You can implement your import logic here.
-    """
-    # TODO: Implement import logic (e.g., parse uploaded file, insert records)
-    data = Data()
-    actual_items = data.load_actual_items()
-    for item in actual_items:
-        item['amount'] = float(item.get('amount') or 0)
-        crud.create_actual_item(db, schemas.LineItemCreate(**item))
-        print(f"Import: {item}")
-    return {"status": "success", "message": "Import endpoint reached."}
+    return imports.import_csv(db, kind, file.file)
+
+@router.post("/actuals/import", status_code=202)
+def actuals_import():
+    """Start (or join) the ERP actuals import job; poll /api/jobs/{id} for progress."""
+    return start_import_job("erp:actuals")
+
+@router.post("/archive", status_code=202)
+def ledger_archive():
+    """Start (or join) the job that moves closed fiscal years into their archive files."""
+    return start_import_job("archive:ledger")
+
+@router.get("/fiscal-years")
+def fiscal_years(db: Session = Depends(get_db)):
+    return {"current": fiscal.current_fiscal_year(), "live": archive.live_years(db),
+            "archived": archive.archived_years()}
+
+@router.post("/actuals/dedupe", status_code=202)
+def actuals_dedupe():
+    """Start (or join) the job that fingerprints imported actuals, existing ones included, and removes duplicates."""
+    return start_import_job("dedupe:actuals")
+
+# ---- Background jobs ----
+def start_import_job(kind: str) -> dict:
+    job, started = jobs.start(kind, erp_imports.JOBS[kind])
+    return {"job_id": job["id"], "started": started, "job": job}
+
+@router.get("/jobs")
+def jobs_list(kind: str | None = None, limit: int = Query(default=20, le=200)):
+    return FastJSONResponse(content=jobs.latest(kind, limit))
+
+@router.get("/jobs/{job_id}")
+def jobs_get(job_id: str):
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(404, "Not found")
+    return FastJSONResponse(content=job)
+
+@router.post("/jobs/{job_id}/cancel")
+def jobs_cancel(job_id: str):
+    job = jobs.cancel(job_id)
+    if not job:
+        raise HTTPException(404, "Not found")
+    return FastJSONResponse(content=job)
+
+@router.get("/scheduler")
+def scheduler_stats():
+    """Last-run stats and next run of each scheduled ERP sync."""
+    return FastJSONResponse(content=scheduler.stats())
+
+@router.get("/snapshot")
+def snapshot_stats():
+    """Rows, memory and refresh counts of this worker's ledger snapshot."""
+    return FastJSONResponse(content=snapshot.stats())
 
 # ---- Utility: Next line ----
 @router.get("/next-line/{kind}/{acct5}")
@@ -260,14 +328,17 @@ def api_actual_items(account: str | None = Query(default=None, description="Filt
                      description: str | None = Query(default=None, description="Filter by Description"),
                      manager: str | None = Query(default=None, description="Filter by Manager"),
                      vendor: str | None = Query(default=None, description="Filter by Vendor Text"),
-                     db: Session = Depends(get_db)):
+                     fy: int = Depends(fiscal_year_param),
+                     db: Session = Depends(ledger_db)):
+    if _from_snapshot(fy):
+        return FastJSONResponse(content=snapshot.actual_items(account, description, manager, vendor, fiscal_year=fy))
 
     accounts = crud.account_list(db, filter_acct=account, filter_desc=description, filter_manager=manager)
     # we know the accounts to include, now retrieve the actual items.
 
     items = []
     for a in accounts:
-        actuals = crud.actuals_get_by_account_vendor(db, account=a, filter_vendor=vendor)
+        actuals = crud.actuals_get_by_account_vendor(db, account=a, filter_vendor=vendor, fiscal_year=fy)
         for act in actuals:
             items.append({
                 "account": a,
@@ -280,70 +351,73 @@ def api_actual_items(account: str | None = Query(default=None, description="Filt
             })
 
     items.sort(key=lambda r: (r["account"], r["tr_date"], r["vouchno"]))
-    return JSONResponse(content=items)
+    return FastJSONResponse(content=items)
 
 @router.get("/line-items", operation_id="get_line_items")
-def api_line_items(request: Request, db: Session = Depends(get_db)):
+def api_line_items(request: Request, fy: int = Depends(fiscal_year_param), db: Session = Depends(ledger_db)):
     qp = request.query_params
-    acct5_filter = qp.get('acct5') or None
-    desc_filter = qp.get('description') or None
-    manager_filter = qp.get('manager') or None
-    managers = crud.list_managers(db)
-    accounts = crud.list_accounts(db)
-    budget = crud.list_budget(db)
-    actuals = crud.list_actuals(db)
-    acct_mgrs = crud.list_acct_mgrs(db)
-    acct_manager_map = {a.key: a.manager_id for a in acct_mgrs}
-    budget_lookup = {(b.acct5, b.line): b.description for b in budget}
-    joined = {}
-    for b in budget:
-        if acct5_filter and b.acct5 != acct5_filter:
-            continue
-        if manager_filter and acct_manager_map.get(b.acct5) != manager_filter:
-            continue
-        if desc_filter and desc_filter.lower() not in (b.description or '').lower():
-            continue
-        k = (b.acct5, b.line)
-        joined[k] = {"acct5": b.acct5, "line": b.line, "budget_desc": b.description, "budget": b.amount, "actual": 0.0, "actual_desc": None}
-    for a in actuals:
-        if acct5_filter and a.acct5 != acct5_filter:
-            continue
-        if manager_filter and acct_manager_map.get(a.acct5) != manager_filter:
-            continue
-        if desc_filter and desc_filter.lower() not in (a.description or '').lower():
-            continue
-        k = (a.acct5, a.line)
-        if k not in joined:
-            joined[k] = {
-                "acct5": a.acct5,
-                "line": a.line,
-                "budget_desc": budget_lookup.get(k),
-                "budget": 0.0,
-                "actual": a.amount,
-                "actual_desc": a.description
-            }
-        else:
-            joined[k]["actual"] += a.amount
-            joined[k]["actual_desc"] = a.description
-    items = []
-    for (acct5, line), row in joined.items():
-        items.append({
-            "acct5": acct5, "line": line,
-            "budget": row["budget"],
-            "actual": row["actual"],
-            "variance": row["budget"] - row["actual"],
-            "budget_desc": row["budget_desc"],
-            "actual_desc": row["actual_desc"],
-        })
-    items.sort(key=lambda r: (r["acct5"], r["line"]))
-    return JSONResponse(content=items)
+    items = line_report.line_items(db, acct5=qp.get('acct5') or None, description=qp.get('description') or None,
+                                   manager=qp.get('manager') or None, fiscal_year=fy)
+    return FastJSONResponse(content=items)
+
+@router.get("/yoy-items", operation_id="get_yoy_items")
+def api_yoy_items(account: str | None = Query(default=None, description="Filter by Account", alias="acct5"),
+                  manager: str | None = Query(default=None, description="Filter by Manager"),
+                  as_of: datetime.date | None = Query(default=None, description="Last day counted (default: today)"),
+                  lines: bool = Query(default=False, description="One row per account line"),
+                  fy: int = Depends(fiscal_year_param),
+                  db: Session = Depends(get_db)):
+    """This year's budget and actual to date against last year's actual to the same fiscal day."""
+    items = yoy_report.yoy_items(db, fiscal_year=fy, as_of=as_of, acct5=account, manager=manager, lines=lines)
+    return FastJSONResponse(content=items)
+
+@router.get("/monthly-items", operation_id="get_monthly_items")
+def api_monthly_items(account: str | None = Query(default=None, description="Filter by Account", alias="acct5"),
+                      prefix: str | None = Query(default=None, description="Accounts whose key starts with this"),
+                      manager: str | None = Query(default=None, description="Filter by Manager"),
+                      segments: dict[int, str] = Depends(segment_params),
+                      fy: int = Depends(fiscal_year_param),
+                      db: Session = Depends(ledger_db)):
+    """Actuals month by month with the cumulative spend against the year's budget."""
+    report = monthly_report.monthly_items(db, fiscal_year=fy, acct5=account, prefix=prefix,
+                                          segments=segments, manager=manager)
+    return FastJSONResponse(content=report)
+
+@router.get("/segment-items", operation_id="get_segment_items")
+def api_segment_items(level: int = Query(default=1, ge=0, le=gl.SEGMENTS,
+                                         description="Group by the first N GL segments; 0 for one total"),
+                      manager: str | None = Query(default=None, description="Filter by Manager"),
+                      segments: dict[int, str] = Depends(segment_params),
+                      fy: int = Depends(fiscal_year_param),
+                      db: Session = Depends(ledger_db)):
+    """Budget, actual and variance summed per GL segment group."""
+    items = segment_report.segment_items(db, fiscal_year=fy, level=level, segments=segments, manager=manager)
+    return FastJSONResponse(content=items)
+
+@router.get("/forecast-items", operation_id="get_forecast_items")
+def api_forecast_items(account: str | None = Query(default=None, description="Filter by Account", alias="acct5"),
+                       manager: str | None = Query(default=None, description="Filter by Manager"),
+                       segments: dict[int, str] = Depends(segment_params),
+                       method: Literal["seasonal", "linear"] = Query(default="seasonal",
+                                                                     description="Projection method"),
+                       as_of: datetime.date | None = Query(default=None, description="Cut-off day (default: today)"),
+                       over: bool = Query(default=False, description="Only accounts projected over budget"),
+                       fy: int = Depends(fiscal_year_param),
+                       db: Session = Depends(get_db)):
+    """Projected year-end actual and over/under-spend per account."""
+    items = forecast.forecast_items(db, fiscal_year=fy, method=method, as_of=as_of, acct5=account,
+                                    segments=segments, manager=manager, over_only=over)
+    return FastJSONResponse(content=items)
 
 @router.get("/home-items")
 def api_home_items(
         account: str | None = Query(default=None, description="Filter by Account", alias="acct5"),
         description: str | None = Query(default=None, description="Filter by Description"),
         manager: str | None = Query(default=None, description="Filter by Manager"),
-        db: Session = Depends(get_db)):
+        fy: int = Depends(fiscal_year_param),
+        db: Session = Depends(ledger_db)):
+    if _from_snapshot(fy):
+        return FastJSONResponse(content=snapshot.home_items(account, description, manager, fiscal_year=fy))
 
     accounts = crud.account_list(db, filter_acct=account, filter_desc=description, filter_manager=manager)
 
@@ -351,8 +425,8 @@ def api_home_items(
     # for each account, generate object with account, description, budget amount, actual amount, and variance amount
     for a  in accounts:
         try:
-            budget_amount = crud.get_budget_total_for_account(db, a)
-            actual_amount = crud.get_actual_total_for_account(db, a)
+            budget_amount = crud.get_budget_total_for_account(db, a, fy)
+            actual_amount = crud.get_actual_total_for_account(db, a, fy)
             variance_amount = budget_amount - actual_amount
             desc = crud.get_account_description_for_account(db, a)
             aobj = {
@@ -369,7 +443,7 @@ def api_home_items(
     # sort results by account
     results.sort(key=lambda r: r["account"])
 
-    return JSONResponse(content=results)
+    return FastJSONResponse(content=results)
 
 @router.get("/account-items")
 def api_account_items(
@@ -396,13 +470,16 @@ def api_account_items(
     # sort results by account
     results.sort(key=lambda r: r["account"])
 
-    return JSONResponse(content=results)
+    return FastJSONResponse(content=results)
 
 @router.get("/budget-items", operation_id="get_budget_items")
 def api_budget_items(account: str | None = Query(default=None, description="Filter by Account", alias="acct5"),
                      description: str | None = Query(default=None, description="Filter by Description"),
                      manager: str | None = Query(default=None, description="Filter by Manager"),
-                     db: Session = Depends(get_db)):
+                     fy: int = Depends(fiscal_year_param),
+                     db: Session = Depends(ledger_db)):
+    if _from_snapshot(fy):
+        return FastJSONResponse(content=snapshot.budget_items(account, description, manager, fiscal_year=fy))
 
     accounts = crud.account_list(db, filter_acct=account, filter_desc=description, filter_manager=manager)
 
@@ -411,7 +488,7 @@ def api_budget_items(account: str | None = Query(default=None, description="Filt
     for a  in accounts:
         try:
             desc = crud.get_account_description_for_account(db, a)
-            budget_amount = crud.get_budget_total_for_account(db, a)
+            budget_amount = crud.get_budget_total_for_account(db, a, fy)
             aobj = {
                 "account": a,
                 "description": desc,
@@ -424,73 +501,26 @@ def api_budget_items(account: str | None = Query(default=None, description="Filt
     # sort results by account
     results.sort(key=lambda r: r["account"])
 
-    return JSONResponse(content=results)
+    return FastJSONResponse(content=results)
 
 
 
-@router.post("/budgets/import", status_code=200)
-def import_budgets(db: Session = Depends(get_db)):
+@router.post("/budgets/import", status_code=202)
+def import_budgets():
     """
-    Calls data.load_budget_import() and saves returned rows into `budget_items`.
-    Expects load_budget_import() to return an iterable of dict-like records.
+    Starts a background job that calls data.load_budget_import() and saves the
+    returned rows into `budget_items` as line 00.  Returns the job id right away.
     """
-    from db import engine
-    metadata = MetaData()
-    try:
-        data = Data()
-        rows: List[Dict] = data.load_budget_import()
-    except Exception as exc:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(exc))
-
-    if not rows:
-        return {"imported": 0}
-
-    # Reflect the existing table
-    try:
-        budget_items = Table("budget_items", metadata, autoload_with=engine)
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"Could not reflect table: {exc}")
-
-    # Bulk insert (SQLAlchemy Core)
-    try:
-        # If rows is a generator, convert to list
-        row_list = list(rows)
-        for r in row_list:
-            gl_acct = r.get('formattedglacctno', '')
-            #
-            # extract last 14 characters of gl_acct
-            # skip if last 14 are all zeros
-            #
-            gl_last14 = gl_acct[-14:]
-            if gl_last14 > '00-00-00-00-00':
-                amount = r.get('budgetamt', 0)
-                desc = r.get('description', '')
-                with engine.begin() as conn:
-                    conn.execute(budget_items.insert().values(
-                        id=uuid.uuid4().hex.lower().replace('-', ''),
-                        acct5=gl_acct,
-                        line='00',
-                        amount=float(amount) if amount is not None else 0.0,
-                        description=desc if desc is not None else ''
-                        )
-                    )
-            else:
-                # skip this row
-                pass
-
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"Insert failed: {exc}")
-
-    return {"imported": len(row_list)}
+    return start_import_job("erp:budget")
 
 @router.post("/budgets/delete_line00", status_code=200)
 def delete_budgets00(db: Session = Depends(get_db)):
     """
-    Delete all budget_items with line='00';
+    Delete the current fiscal year's budget_items with line='00' (the ERP budget import).
     """
     delete_count = 0
     try:
-        items = crud.list_budget(db)
+        items = crud.list_budget(db, fiscal.current_fiscal_year())
         for it in items:
             if it.line == '00':
                 crud.delete_budget_item(db, it.id)
@@ -503,36 +533,10 @@ def delete_budgets00(db: Session = Depends(get_db)):
 
 
 @router.post("/accounts/import")
-def accounts_import(db: Session = Depends(get_db)):
-    from data import Data
-    from urllib.parse import quote_plus
-    from uuid import uuid4
-    created = 0
-    updated = 0
-    total = 0
-    try:
-        d = Data()
-        rows = d.load_gl_list() or []
-        total = len(rows)
-        for r in rows:
-            key = (r.get('gl') or r.get('formattedglacctno') or '').strip()
-            desc = (r.get('descrip') or r.get('description') or '').strip()
-            if not key:
-                continue
-            existing = crud.get_account_by_key(db, key)
-            if existing:
-                if desc and existing.description != desc:
-                    existing.description = desc
-                    db.commit(); db.refresh(existing)
-                    updated += 1
-            else:
-                newid = uuid4().__str__().lower().replace('-','')
-                crud.create_account(db, schemas.AccountCreate(id=newid, key=key, description=desc or key, manager_id=None))
-                created += 1
-    except Exception as e:
-        msg = quote_plus(str(e))
-        return RedirectResponse(f"/accounts?msg={msg}", status_code=303)
-    return RedirectResponse(f"/accounts?created={created}&updated={updated}&total={total}", status_code=303)
+def accounts_import():
+    # the accounts page polls the job and shows the summary when it finishes
+    data = start_import_job("erp:accounts")
+    return RedirectResponse(f"/accounts?job={data['job_id']}", status_code=303)
 
 @router.post("/accounts/delete-all")
 def accounts_delete_all(db: Session = Depends(get_db)):
@@ -549,6 +553,13 @@ def accounts_delete_all(db: Session = Depends(get_db)):
         return RedirectResponse(f"/accounts?msg={msg}", status_code=303)
     return RedirectResponse(f"/accounts?msg=deleted:{deleted}", status_code=200)
 
+@router.post("/accounts/assign")
+def accounts_assign_bulk(payload: schemas.BulkAssign, db: Session = Depends(get_db)):
+    """Add, remove or toggle one manager on many accounts in a single transaction."""
+    if not crud.get_manager(db, payload.manager_id):
+        raise HTTPException(404, "Manager not found")
+    return crud.bulk_assign_managers(db, payload.account_ids, payload.manager_id, payload.mode)
+
 @router.get("/assign-items")
 def api_assign_items(
         account: str | None = Query(default=None, description="Filter by Account", alias="acct5"),
@@ -597,5 +608,5 @@ def api_assign_items(
         except Exception as exc:
             print(f"Error processing account {a}: {exc}")
 
-    return JSONResponse(content=results)
+    return FastJSONResponse(content=results)
 
@@ -0,0 +1,143 @@
+"""
+Archive of closed fiscal years (utils/fiscal.py).
+
+The live budget_items and actual_items tables keep the current fiscal year and
+the ARCHIVE_KEEP_YEARS before it; the archive:ledger job moves older years
+into one SQLite file per year, so the live tables, and every query on them,
+stay the same size however many years are retained.
+
+    ARCHIVE_DIR=./archive     where ledger-<year>.db files are written (default:
+                              an 'archive' directory next to BUDGET_DB_PATH)
+    ARCHIVE_KEEP_YEARS=1      closed years kept live, e.g. for year-over-year reports
+
+An archive file has the live schema and holds the year's budget lines,
+actuals and monthly actual totals plus a copy of accounts and acct_mgrs as they were when it was
+written, so the report code reads an archived year through an ordinary
+Session (open_session / get_db).  Archive files are opened read-only.
+
+Archiving a year copies its rows into ledger-<year>.db.tmp, renames that
+over ledger-<year>.db once the copy is complete, and then, inside the job's
+transaction, deletes the rows from the live tables and records the year in
+archived_years (models.ArchivedYear).  Reads follow archived_years, not the
+files, so the job's commit is what moves a year to its archive: until then
+(and for good, if the job fails or is cancelled) the year is read from the
+live tables, and a repeated run simply writes the file again.  Once a year is
+archived its reads never look at the live tables, so writes to it are
+rejected: triggers on budget_items and actual_items (app.py) abort an insert
+or update that would put a row in it with ARCHIVED_ERROR.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, select, insert, delete, func, union
+from sqlalchemy.orm import Session, sessionmaker
+
+import models
+from db import Base, SessionLocal, dbpath, engine
+from misc.imports import IMPORT_BATCH
+from utils import fiscal, metrics
+from utils.jobs import JobContext
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR") or os.path.join(os.path.dirname(os.path.abspath(dbpath)), "archive")
+ARCHIVE_KEEP_YEARS = int(os.getenv("ARCHIVE_KEEP_YEARS", "1"))
+
+# actual_monthly goes last: deleting a year's actuals adjusts its rows through the triggers
+LEDGER_TABLES = (models.BudgetItem.__table__, models.ActualItem.__table__, models.ActualMonthly.__table__)
+REFERENCE_TABLES = (models.Account.__table__, models.AcctMgr.__table__)
+
+# message of the triggers rejecting writes to an archived year
+ARCHIVED_ERROR = "fiscal year is archived"
+
+_sessions: dict[int, sessionmaker] = {}
+_lock = threading.Lock()
+
+
+def archive_path(year: int) -> str:
+    return os.path.join(ARCHIVE_DIR, f"ledger-{int(year)}.db")
+
+
+def archived_years() -> list[int]:
+    t = models.ArchivedYear.__table__
+    with engine.connect() as conn:
+        return list(conn.execute(select(t.c.fiscal_year).order_by(t.c.fiscal_year)).scalars())
+
+
+def is_archived(year: int) -> bool:
+    t = models.ArchivedYear.__table__
+    with engine.connect() as conn:
+        return conn.execute(select(t.c.fiscal_year).where(t.c.fiscal_year == year)).first() is not None
+
+
+def open_session(year: int | None = None) -> Session:
+    """Session for reading `year`: its archive file once archived, the live database otherwise."""
+    if year is None or not is_archived(year):
+        return SessionLocal()
+    with _lock:
+        factory = _sessions.get(year)
+        if factory is None:
+            engine = create_engine(f"sqlite:///file:{archive_path(year)}?mode=ro&uri=true",
+                                   connect_args={"check_same_thread": False})
+            factory = _sessions[year] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return factory()
+
+
+def get_db(year: int | None = None):
+    db = open_session(year)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def live_years(db: Session) -> list[int]:
+    stmt = union(*(select(t.c.fiscal_year).distinct() for t in LEDGER_TABLES))
+    return sorted(db.execute(stmt).scalars().all())
+
+
+def _copy(job: JobContext, db: Session, year: int, written: int) -> int:
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = archive_path(year)
+    tmp = path + ".tmp"
+    # left behind by a run that failed or was cancelled mid-copy
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    target = create_engine("sqlite:///" + tmp)
+    try:
+        Base.metadata.create_all(target, tables=[*LEDGER_TABLES, *REFERENCE_TABLES])
+        with target.begin() as out:
+            for t in REFERENCE_TABLES:
+                rows = [dict(r) for r in db.execute(select(t)).mappings()]
+                out.execute(delete(t))
+                if rows:
+                    out.execute(insert(t), rows)
+            for t in LEDGER_TABLES:
+                result = db.execute(select(t).where(t.c.fiscal_year == year).execution_options(yield_per=IMPORT_BATCH))
+                for batch in result.mappings().partitions():
+                    out.execute(insert(t), [dict(r) for r in batch])
+                    written += len(batch)
+                    job.progress(written=written)
+    except BaseException:
+        target.dispose()
+        os.remove(tmp)
+        raise
+    target.dispose()
+    os.replace(tmp, path)
+    return written
+
+
+def archive_closed_years(job: JobContext, db: Session) -> dict:
+    """Move the ledger rows of fiscal years before the kept ones into their archive files."""
+    started = time.perf_counter()
+    oldest_kept = fiscal.current_fiscal_year() - ARCHIVE_KEEP_YEARS
+    years = [y for y in live_years(db) if y < oldest_kept]
+    total = sum(db.execute(select(func.count()).select_from(t).where(t.c.fiscal_year.in_(years))).scalar()
+                for t in LEDGER_TABLES) if years else 0
+    job.set_phase("archiving", total=total)
+    written, moved = 0, {}
+    for year in years:
+        written = _copy(job, db, year, written)
+        moved[year] = sum(db.execute(delete(t).where(t.c.fiscal_year == year)).rowcount for t in LEDGER_TABLES)
+        db.execute(insert(models.ArchivedYear).prefix_with("OR IGNORE").values(fiscal_year=year))
+    metrics.record_import("archive:ledger", written, time.perf_counter() - started)
+    return {"archived": {str(y): n for y, n in moved.items()}, "total": written, "kept_from": oldest_kept}
@@ -0,0 +1,128 @@
+"""
+Batched writes to budget and actual lines (POST /api/batch): a list of
+create / update / delete operations applied in one transaction, so editing
+an account's lines is one round trip and one commit.
+
+    create  acct5, description and amount required; line is allocated when
+            omitted (for a budget line also when the one given is taken, as
+            crud.create_budget_line does); actuals take tr_date, vendor_name
+            and vouchno and get the next seq
+    update  the fields given are set; the line is addressed by id, or by
+            (acct5, line) in the current fiscal year, which fails when several
+            actual lines share it
+    delete  addressed like update
+
+The operations run in order, each seeing the ones before it.  The batch
+commits only when every operation succeeded; otherwise it is rolled back and
+the results say which operations failed and why (the others report what
+they would have done).  Operations after a database error are not run.
+"""
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+import crud
+import models
+import schemas
+from utils import fiscal
+from utils.sequences import ACTUAL_SEQ
+
+MODELS = {"budget": models.BudgetItem, "actual": models.ActualItem}
+# fields an update may set, per kind
+FIELDS = {"budget": ("acct5", "line", "description", "amount"),
+          "actual": ("acct5", "line", "description", "amount", "tr_date", "vendor_name", "vouchno")}
+
+
+class OperationError(Exception):
+    pass
+
+
+def _find(db: Session, it: schemas.BatchOperation):
+    model = MODELS[it.kind]
+    if it.id:
+        obj = db.get(model, it.id)
+    elif it.acct5 and it.line:
+        stmt = select(model).where(model.acct5 == it.acct5, model.line == it.line,
+                                   model.fiscal_year == fiscal.current_fiscal_year())
+        found = db.execute(stmt.limit(2)).scalars().all()
+        # actual lines need not be unique per (acct5, line); don't pick one of them at random
+        if len(found) > 1:
+            raise OperationError(f"{it.kind} line {it.acct5} {it.line} is ambiguous, give its id")
+        obj = found[0] if found else None
+    else:
+        raise OperationError("id or acct5 and line required")
+    if obj is None:
+        raise OperationError(f"{it.kind} line {it.id or f'{it.acct5} {it.line}'} not found")
+    return obj
+
+
+def _create(db: Session, it: schemas.BatchOperation, seq: float | None):
+    missing = [f for f in ("acct5", "description", "amount") if getattr(it, f) is None]
+    if missing:
+        raise OperationError(f"{', '.join(missing)} required")
+    model = MODELS[it.kind]
+    if it.kind == "budget":
+        allocated = crud.allocate_line(db, model, it.acct5)
+        # no line asked for, or someone else took it since the form was filled in
+        line = allocated if not it.line or crud.get_budget_item_by_acct_line(db, it.acct5, it.line) else it.line
+        obj = model(id=uuid.uuid4().hex, acct5=it.acct5, line=line, description=it.description, amount=it.amount)
+    else:
+        obj = model(id=str(uuid.uuid4()), acct5=it.acct5, line=it.line or crud.allocate_line(db, model, it.acct5),
+                    description=it.description, amount=it.amount, tr_date=it.tr_date, seq=seq,
+                    vendor_name=it.vendor_name, vouchno=it.vouchno)
+    db.add(obj)
+    return obj
+
+
+def _update(db: Session, it: schemas.BatchOperation):
+    obj = _find(db, it)
+    # lines addressed by (acct5, line) keep them; the other fields given are set
+    given = it.model_fields_set - ({"acct5", "line"} if not it.id else set())
+    for field in FIELDS[it.kind]:
+        if field in given:
+            if field in ("acct5", "line", "description", "amount") and getattr(it, field) is None:
+                raise OperationError(f"{field} can't be null")
+            setattr(obj, field, getattr(it, field))
+    return obj
+
+
+def apply(db: Session, operations: list[schemas.BatchOperation]) -> tuple[bool, list[dict]]:
+    """Run the operations in one transaction; (committed, per-operation results)."""
+    # seq numbers for new actuals, reserved with the batch so a rollback returns them
+    creates = sum(1 for it in operations if it.op == "create" and it.kind == "actual")
+    seqs = iter(ACTUAL_SEQ.reserve(creates, db.connection()))
+    results, ok = [], True
+    for i, it in enumerate(operations):
+        result = {"index": i, "op": it.op, "kind": it.kind}
+        try:
+            if it.op == "create":
+                obj = _create(db, it, next(seqs) if it.kind == "actual" else None)
+                status = "created"
+            elif it.op == "update":
+                obj = _update(db, it)
+                status = "updated"
+            else:
+                obj = _find(db, it)
+                db.delete(obj)
+                status = "deleted"
+            # later operations look lines up by (acct5, line) and must see this one
+            db.flush()
+            results.append({**result, "status": status, "id": obj.id, "acct5": obj.acct5, "line": obj.line})
+        except OperationError as exc:
+            ok = False
+            results.append({**result, "status": "error", "error": str(exc)})
+        except SQLAlchemyError as exc:
+            # the transaction can't go on; report this operation and skip the rest
+            db.rollback()
+            ok = False
+            results.append({**result, "status": "error", "error": str(exc.__cause__ or exc).splitlines()[0]})
+            results.extend({"index": j, "op": rest.op, "kind": rest.kind, "status": "not run"}
+                           for j, rest in enumerate(operations[i + 1:], i + 1))
+            break
+    if ok:
+        db.commit()
+    else:
+        db.rollback()
+    return ok, results
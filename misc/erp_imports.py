@@ -0,0 +1,212 @@
+"""
+Imports from the ERP source (data.Data: SQL Server or the replay provider),
+run as background jobs by utils.jobs, the dedupe job for imported actuals and
+the fiscal-year archive job (misc/archive.py).
+
+Each import fetches the full result set, then writes it in batches of
+IMPORT_BATCH inside the job's single transaction, reporting progress after
+every batch.  A cancelled or failed import is rolled back as a whole, so a
+partial import never lands in the database.
+"""
+import time
+import uuid
+
+from sqlalchemy import insert, select, update, delete, bindparam, and_, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+import models
+from data.data import Data
+from misc import archive
+from misc.imports import IMPORT_BATCH
+from utils import metrics, fiscal, gl
+from utils.fingerprint import actual_row_hash, ACTUAL_HASH_FIELDS
+from utils.money import to_cents
+from utils.jobs import JobContext
+from utils.sequences import ACTUAL_SEQ
+
+
+def _pad2(s) -> str:
+    s = "".join(ch for ch in str(s) if ch.isdigit())
+    return s.zfill(2)[-2:]
+
+
+def _write(job: JobContext, db: Session, *steps) -> list[int]:
+    """Run each (statement, values) step in batches; returns the rows affected per step.
+
+    The phase is recorded before the first write: once the transaction holds the
+    SQLite write lock, job state can only be updated in memory.
+    """
+    job.set_phase("writing", total=sum(len(values) for _, values in steps))
+    written, counts = 0, []
+    for stmt, values in steps:
+        affected = 0
+        for i in range(0, len(values), IMPORT_BATCH):
+            batch = values[i:i + IMPORT_BATCH]
+            affected += db.execute(stmt, batch).rowcount
+            written += len(batch)
+            job.progress(written=written)
+        counts.append(affected)
+    return counts
+
+
+def _fetch(job: JobContext, load) -> list[dict]:
+    job.set_phase("fetching")
+    rows = load() or []
+    job.progress(fetched=len(rows))
+    return rows
+
+
+def import_actuals(job: JobContext, db: Session) -> dict:
+    started = time.perf_counter()
+    rows = _fetch(job, lambda: Data().load_actual_items())
+    job.set_phase("validating", total=len(rows))
+    values = []
+    for r in rows:
+        acct5 = (r.get('gl') or '').strip()
+        line = _pad2(r.get('line') or '')
+        desc = (r.get('description') or '').strip()
+        amount_cents = to_cents(r.get('amount'))
+        if not acct5 or not line or not desc or amount_cents == 0:
+            continue
+        seq = r.get('seq')
+        v = {
+            "id": str(uuid.uuid4()), "acct5": acct5, "line": line, "description": desc, "amount_cents": amount_cents,
+            "seq": float(seq) if seq else None, "tr_date": r.get('tr_date') or None,
+            "fiscal_year": fiscal.fiscal_year(r.get('tr_date')),
+            "vendor_name": (r.get('vendor_name') or '').strip() or None,
+            "vouchno": (r.get('vouchno') or '').strip() or None,
+        }
+        v["row_hash"] = actual_row_hash(v)
+        values.append(v)
+    # one contiguous seq range for the rows that have none; reserved in its own short transaction,
+    # because job state can't be saved once the job's transaction holds the write lock
+    missing = [v for v in values if v["seq"] is None]
+    for v, seq in zip(missing, ACTUAL_SEQ.reserve(len(missing))):
+        v["seq"] = seq
+    # lines imported by an earlier run (same row_hash) are skipped by the unique index; lines
+    # imported before row_hash existed are fingerprinted first, or they would be imported again
+    t = models.ActualItem.__table__
+    if db.execute(select(t.c.id).where(_legacy(t)).limit(1)).first() is not None:
+        _dedupe(job, db)
+    created, = _write(job, db, (sqlite_insert(t).on_conflict_do_nothing(index_elements=[t.c.row_hash]), values))
+    metrics.record_import("erp:actuals", created, time.perf_counter() - started)
+    return {"created": created, "skipped": len(values) - created, "total": len(rows)}
+
+
+def import_budgets(job: JobContext, db: Session) -> dict:
+    started = time.perf_counter()
+    rows = _fetch(job, lambda: Data().load_budget_import())
+    # sql/04-budget.sql returns the budget of the current fiscal year
+    fy = fiscal.current_fiscal_year()
+    values = []
+    for r in rows:
+        gl_acct = r.get('formattedglacctno', '') or ''
+        # skip rows whose last 14 characters (the segments after the fund) are all zeros
+        if gl_acct[-14:] > '00-00-00-00-00':
+            amount = r.get('budgetamt', 0)
+            desc = r.get('description', '')
+            values.append({
+                "id": uuid.uuid4().hex, "acct5": gl_acct, "line": '00',
+                "amount_cents": to_cents(amount), "fiscal_year": fy,
+                "description": desc if desc is not None else '',
+            })
+    imported, = _write(job, db, (insert(models.BudgetItem.__table__), values))
+    metrics.record_import("erp:budget", imported, time.perf_counter() - started)
+    return {"imported": imported, "total": len(rows)}
+
+
+def import_accounts(job: JobContext, db: Session) -> dict:
+    started = time.perf_counter()
+    rows = _fetch(job, lambda: Data().load_gl_list())
+    t = models.Account.__table__
+    # description first, then the segment descriptions (seg01..seg05 in sql/01-gl-listing.sql)
+    described = [t.c.description, *(t.c[f"seg{i}_desc"] for i in range(1, gl.SEGMENTS + 1))]
+    names = [c.name for c in described]
+    existing = {r[0]: tuple(r[1:]) for r in db.execute(select(t.c.key, *described))}
+    new, changed = {}, {}
+    for r in rows:
+        key = (r.get('gl') or r.get('formattedglacctno') or '').strip()
+        desc = (r.get('descrip') or r.get('description') or '').strip()
+        if not key:
+            continue
+        segs = tuple((r.get(f'seg{i:02d}') or '').strip() or None for i in range(1, gl.SEGMENTS + 1))
+        if key in existing:
+            old_desc, *old_segs = existing[key]
+            values = ((desc or old_desc), *(s or o for s, o in zip(segs, old_segs)))
+            if values != existing[key]:
+                changed[key] = values
+        elif key not in new:
+            new[key] = {"id": uuid.uuid4().hex, "key": key, "description": desc or key,
+                        **{f"seg{i}": code for i, code in enumerate(gl.segments(key), 1)},
+                        **{f"seg{i}_desc": s for i, s in enumerate(segs, 1)}}
+    rename = update(t).where(t.c.key == bindparam("b_key")).values({n: bindparam(f"b_{n}") for n in names})
+    updated, created = _write(job, db,
+                              (rename, [{"b_key": k, **{f"b_{n}": v for n, v in zip(names, values)}}
+                                        for k, values in changed.items()]),
+                              (insert(t), list(new.values())))
+    metrics.record_import("erp:accounts", created + updated, time.perf_counter() - started)
+    return {"created": created, "updated": updated, "total": len(rows)}
+
+
+def _legacy(t):
+    # imported before row_hash existed: every ERP line (and most CSV ones) carries its voucher number
+    return and_(t.c.row_hash.is_(None), t.c.vouchno.is_not(None))
+
+
+def _dedupe(job: JobContext, db: Session) -> tuple[int, int, int]:
+    """(removed, fingerprinted, scanned); see dedupe_actuals."""
+    t = models.ActualItem.__table__
+    job.set_phase("scanning")
+    rows = db.execute(select(t.c.id, t.c.seq, t.c.row_hash, *(t.c[f] for f in ACTUAL_HASH_FIELDS))
+                      .where(or_(t.c.row_hash.is_not(None), _legacy(t)))).mappings().all()
+    job.progress(fetched=len(rows))
+    job.set_phase("hashing", total=len(rows))
+    hashes, keep = [], {}
+    for i, r in enumerate(rows):
+        h = actual_row_hash(r)
+        hashes.append(h)
+        # oldest (lowest seq) wins; rows without a seq go last
+        rank = (r["seq"] is None, r["seq"] or 0, r["id"])
+        if h not in keep or rank < keep[h][0]:
+            keep[h] = (rank, r["id"])
+        if i % IMPORT_BATCH == 0:
+            job.progress(fetched=i)
+    kept = {rid for _, rid in keep.values()}
+    removed = [{"b_id": r["id"]} for r in rows if r["id"] not in kept]
+    stale = [{"b_id": r["id"], "b_hash": h} for r, h in zip(rows, hashes) if r["id"] in kept and r["row_hash"] != h]
+    by_id = t.c.id == bindparam("b_id")
+    # clear stale fingerprints first, so setting the new ones can't collide on the unique index
+    deleted, _, fingerprinted = _write(job, db,
+                                       (delete(t).where(by_id), removed),
+                                       (update(t).where(by_id).values(row_hash=None), stale),
+                                       (update(t).where(by_id).values(row_hash=bindparam("b_hash")), stale))
+    return deleted, fingerprinted, len(rows)
+
+
+def dedupe_actuals(job: JobContext, db: Session) -> dict:
+    """Fingerprint the imported actuals and delete duplicates, keeping the one with the lowest seq.
+
+    Imported rows are those with a row_hash and, for ledgers imported before
+    row_hash existed, those with a vouchno: the one-time run for existing data
+    fingerprints them and collapses the copies left by repeated imports
+    (import_actuals does the same before its first insert).  Manual entries have
+    neither and are left alone, as two identical ones can be legitimate; a
+    manual entry given a voucher number is treated as imported.  Run again after
+    ACTUAL_HASH_FIELDS or the import normalisation changes, when stored
+    fingerprints may be stale.
+    """
+    started = time.perf_counter()
+    deleted, fingerprinted, total = _dedupe(job, db)
+    metrics.record_import("dedupe:actuals", deleted + fingerprinted, time.perf_counter() - started)
+    return {"removed": deleted, "fingerprinted": fingerprinted, "total": total}
+
+
+# job kind -> job function
+JOBS = {
+    "erp:actuals": import_actuals,
+    "erp:budget": import_budgets,
+    "erp:accounts": import_accounts,
+    "dedupe:actuals": dedupe_actuals,
+    "archive:ledger": archive.archive_closed_years,
+}
@@ -0,0 +1,184 @@
+"""
+Streaming exports of actuals, budget lines, the account summary and the
+budget-vs-actual line report.
+
+Rows are pulled from a server-side cursor (yield_per) and encoded chunk by
+chunk, so memory use stays flat no matter how many rows the export covers.
+Each generator opens its own session: the request-scoped one from get_db may
+be closed before a StreamingResponse has finished sending.  Every export covers
+one fiscal year, read from its archive file once the year is archived.
+"""
+import csv
+import io
+import json
+from typing import Iterable, Iterator
+
+from sqlalchemy import select, func
+
+import models
+from misc import archive
+from utils.money import from_cents
+from utils.text import contains
+
+EXPORT_CHUNK = 1000
+
+ACTUAL_FIELDS = ["acct5", "line", "tr_date", "vouchno", "vendor_name", "description", "amount"]
+BUDGET_FIELDS = ["acct5", "line", "description", "amount"]
+LINE_REPORT_FIELDS = ["acct5", "line", "budget", "actual", "variance", "budget_desc", "actual_desc"]
+SUMMARY_FIELDS = ["account", "description", "budget", "actual", "variance"]
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def _manager_keys(manager: str):
+    return select(models.AcctMgr.key).where(models.AcctMgr.manager_id == manager)
+
+
+def _stream(stmt, fiscal_year: int | None) -> Iterator[dict]:
+    db = archive.open_session(fiscal_year)
+    try:
+        result = db.execute(stmt.execution_options(yield_per=EXPORT_CHUNK))
+        for row in result.mappings():
+            yield dict(row)
+    finally:
+        db.close()
+
+
+def _in_year(stmt, t, fiscal_year: int | None):
+    return stmt if fiscal_year is None else stmt.where(t.fiscal_year == fiscal_year)
+
+
+def actual_rows(acct5: str | None = None, manager: str | None = None, fiscal_year: int | None = None) -> Iterator[dict]:
+    t = models.ActualItem
+    stmt = _in_year(select(t.acct5, t.line, t.tr_date, t.vouchno, t.vendor_name, t.description, t.amount),
+                    t, fiscal_year)
+    if acct5:
+        stmt = stmt.where(t.acct5 == acct5)
+    if manager:
+        stmt = stmt.where(t.acct5.in_(_manager_keys(manager)))
+    return _stream(stmt.order_by(t.acct5, t.tr_date, t.vouchno), fiscal_year)
+
+
+def budget_rows(acct5: str | None = None, manager: str | None = None, fiscal_year: int | None = None) -> Iterator[dict]:
+    t = models.BudgetItem
+    stmt = _in_year(select(t.acct5, t.line, t.description, t.amount), t, fiscal_year)
+    if acct5:
+        stmt = stmt.where(t.acct5 == acct5)
+    if manager:
+        stmt = stmt.where(t.acct5.in_(_manager_keys(manager)))
+    return _stream(stmt.order_by(t.acct5, t.line), fiscal_year)
+
+
+def summary_rows(acct5: str | None = None, manager: str | None = None, fiscal_year: int | None = None) -> Iterator[dict]:
+    """Per-account budget, actual and variance totals (the home page summary)."""
+    b = (_in_year(select(models.BudgetItem.acct5, func.sum(models.BudgetItem.amount_cents).label("total")),
+                  models.BudgetItem, fiscal_year)
+         .group_by(models.BudgetItem.acct5).subquery())
+    a = (_in_year(select(models.ActualItem.acct5, func.sum(models.ActualItem.amount_cents).label("total")),
+                  models.ActualItem, fiscal_year)
+         .group_by(models.ActualItem.acct5).subquery())
+    acct = models.Account
+    stmt = (select(acct.key.label("account"), acct.description,
+                   func.coalesce(b.c.total, 0).label("budget"),
+                   func.coalesce(a.c.total, 0).label("actual"))
+            .outerjoin(b, b.c.acct5 == acct.key)
+            .outerjoin(a, a.c.acct5 == acct.key))
+    if acct5:
+        stmt = stmt.where(contains(acct.key, acct5))
+    if manager:
+        stmt = stmt.where(acct.key.in_(_manager_keys(manager)))
+    for row in _stream(stmt.order_by(acct.key), fiscal_year):
+        # totals are summed in cents, so the variance is exact
+        row["variance"] = from_cents(row["budget"] - row["actual"])
+        row["budget"] = from_cents(row["budget"])
+        row["actual"] = from_cents(row["actual"])
+        yield row
+
+
+def _grouped(t, acct5: str | None, manager: str | None, fiscal_year: int | None):
+    stmt = _in_year(select(t.acct5, t.line,
+                           func.sum(t.amount_cents).label("cents"),
+                           func.max(t.description).label("description")), t, fiscal_year)
+    if acct5:
+        stmt = stmt.where(t.acct5 == acct5)
+    if manager:
+        stmt = stmt.where(t.acct5.in_(_manager_keys(manager)))
+    return stmt.group_by(t.acct5, t.line).order_by(t.acct5, t.line)
+
+
+def line_report_rows(acct5: str | None = None, manager: str | None = None,
+                     fiscal_year: int | None = None) -> Iterator[dict]:
+    """Budget vs. actual per (acct5, line), produced by merge-joining two ordered, grouped cursors."""
+    budget = _stream(_grouped(models.BudgetItem, acct5, manager, fiscal_year), fiscal_year)
+    actual = _stream(_grouped(models.ActualItem, acct5, manager, fiscal_year), fiscal_year)
+    b = next(budget, None)
+    a = next(actual, None)
+    while b is not None or a is not None:
+        bk = (b["acct5"], b["line"]) if b is not None else None
+        ak = (a["acct5"], a["line"]) if a is not None else None
+        if ak is None or (bk is not None and bk < ak):
+            key, budget_amt, budget_desc, actual_amt, actual_desc = bk, b["cents"], b["description"], 0, None
+            b = next(budget, None)
+        elif bk is None or ak < bk:
+            key, budget_amt, budget_desc, actual_amt, actual_desc = ak, 0, None, a["cents"], a["description"]
+            a = next(actual, None)
+        else:
+            key, budget_amt, budget_desc, actual_amt, actual_desc = bk, b["cents"], b["description"], a["cents"], a["description"]
+            b = next(budget, None)
+            a = next(actual, None)
+        budget_amt = budget_amt or 0
+        actual_amt = actual_amt or 0
+        yield {
+            "acct5": key[0], "line": key[1],
+            "budget": from_cents(budget_amt),
+            "actual": from_cents(actual_amt),
+            "variance": from_cents(budget_amt - actual_amt),
+            "budget_desc": budget_desc,
+            "actual_desc": actual_desc,
+        }
+
+
+def encode_csv(rows: Iterable[dict], fields: list[str]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    # send the header straight away so the client sees the first byte before the query runs
+    yield buf.getvalue().encode("utf-8")
+    buf.seek(0); buf.truncate()
+    n = 0
+    for row in rows:
+        writer.writerow(row)
+        n += 1
+        if n % EXPORT_CHUNK == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0); buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def encode_ndjson(rows: Iterable[dict]) -> Iterator[bytes]:
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row, separators=(",", ":")))
+        if len(chunk) >= EXPORT_CHUNK:
+            yield ("\n".join(chunk) + "\n").encode("utf-8")
+            chunk = []
+    if chunk:
+        yield ("\n".join(chunk) + "\n").encode("utf-8")
+
+
+EXPORTS = {
+    "actuals": (actual_rows, ACTUAL_FIELDS),
+    "budget": (budget_rows, BUDGET_FIELDS),
+    "line-items": (line_report_rows, LINE_REPORT_FIELDS),
+    "summary": (summary_rows, SUMMARY_FIELDS),
+}
+
+
+def export_stream(kind: str, fmt: str, acct5: str | None = None, manager: str | None = None,
+                  fiscal_year: int | None = None) -> Iterator[bytes]:
+    producer, fields = EXPORTS[kind]
+    rows = producer(acct5=acct5, manager=manager, fiscal_year=fiscal_year)
+    if fmt == "ndjson":
+        return encode_ndjson(rows)
+    return encode_csv(rows, fields)
@@ -0,0 +1,217 @@
+"""
+Year-end spend forecast (/api/forecast-items): for every account with a
+budget or actuals in the fiscal year, the actual to date, the projected
+year-end actual and the projected variance against the budget, flagging the
+accounts projected to overspend.
+
+    FORECAST_PROFILE_YEARS=3  prior fiscal years the seasonal profile is taken from
+    FORECAST_MIN_SHARE=0.05   smallest share of a year's spend a profile may expect by
+                              the cut-off before the projection falls back
+
+Methods
+  linear    the dated actual to date divided by the share of the year elapsed;
+  seasonal  the dated actual to date divided by the share of a year's spend the
+            account's prior years had reached by the same point (whole months
+            before the cut-off plus the elapsed part of its month).  An account
+            without usable history uses the profile of all accounts together
+            ("pooled"), and linear when that fails too.
+Undated actuals are added to the projection as they are, not extrapolated.
+A past year's projection is its actual.
+
+All accounts are projected at once: the monthly totals (models.ActualMonthly)
+of the year and of the profile years are loaded into (accounts x months)
+NumPy arrays and every projection is a handful of array operations.  Prior
+years that have been archived are read from their files.  The projection of
+all accounts is cached per (fiscal year, method, cut-off) and data version
+(misc/snapshot.py: it moves with every write to the ledger tables), for the
+CACHE_ENTRIES most recently used keys; filters are applied to the cached
+result.
+"""
+import datetime
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import select, func, inspect
+from sqlalchemy.orm import Session
+
+import models
+from db import engine
+from misc import archive, snapshot, segment_report
+from utils import fiscal, metrics
+from utils.money import from_cents
+
+FORECAST_PROFILE_YEARS = int(os.getenv("FORECAST_PROFILE_YEARS", "3"))
+FORECAST_MIN_SHARE = float(os.getenv("FORECAST_MIN_SHARE", "0.05"))
+
+METHODS = ("seasonal", "linear")
+# projections kept, least recently used dropped first: each distinct cut-off day is its own entry
+CACHE_ENTRIES = 8
+
+_cache: OrderedDict[tuple, tuple] = OrderedDict()
+_lock = threading.Lock()
+
+
+def elapsed(fiscal_year: int, as_of: datetime.date) -> tuple[int, float, float]:
+    """(fiscal month of as_of, share of that month elapsed, share of the year elapsed), as_of inclusive."""
+    start, end = (datetime.date.fromisoformat(d) for d in fiscal.bounds(fiscal_year))
+    if as_of < start:
+        return 1, 0.0, 0.0
+    if as_of >= end - datetime.timedelta(days=1):
+        return 12, 1.0, 1.0
+    month = (as_of.month - fiscal.FISCAL_YEAR_START_MONTH) % 12 + 1
+    month_start = fiscal.month_start(fiscal_year, month)
+    month_end = fiscal.month_start(fiscal_year + 1, 1) if month == 12 else fiscal.month_start(fiscal_year, month + 1)
+    return (month, ((as_of - month_start).days + 1) / (month_end - month_start).days,
+            ((as_of - start).days + 1) / (end - start).days)
+
+
+def _read(db: Session, years: list[int], stmt) -> list[tuple]:
+    """Rows of stmt(years) over `years`, reading archived years from their files."""
+    live = [y for y in years if not archive.is_archived(y)]
+    rows = list(db.execute(stmt(live))) if live else []
+    for year in years:
+        if year in live:
+            continue
+        session = archive.open_session(year)
+        try:
+            # files archived before actual_monthly existed have no monthly totals
+            if inspect(session.get_bind()).has_table(models.ActualMonthly.__tablename__):
+                rows.extend(session.execute(stmt([year])))
+        finally:
+            session.close()
+    return rows
+
+
+def _monthly(years: list[int]):
+    m = models.ActualMonthly
+    return select(m.fiscal_year, m.acct5, m.month, m.amount_cents).where(m.fiscal_year.in_(years), m.amount_cents != 0)
+
+
+def _budgets(years: list[int]):
+    b = models.BudgetItem
+    return select(b.acct5, func.sum(b.amount_cents)).where(b.fiscal_year.in_(years)).group_by(b.acct5)
+
+
+def _positions(keys: np.ndarray, acct) -> np.ndarray:
+    """Index of each key of `acct` in the sorted `keys`; -1 where it is missing."""
+    acct = np.array(acct, dtype=object)
+    pos = np.searchsorted(keys, acct)
+    found = pos < len(keys)
+    found[found] = keys[pos[found]] == acct[found]
+    return np.where(found, pos, -1)
+
+
+def _expected(profile: np.ndarray, total, month: int, month_share: float):
+    """Share of a year's spend a profile (... x 12 months) expects by the cut-off."""
+    return (profile[..., :month - 1].sum(axis=-1) + month_share * profile[..., month - 1]) / total
+
+
+def _project(db: Session, fy: int, method: str, as_of: datetime.date) -> tuple:
+    budgets = _read(db, [fy], _budgets)
+    current = _read(db, [fy], _monthly)
+    prior = _read(db, list(range(fy - FORECAST_PROFILE_YEARS, fy)), _monthly) if method == "seasonal" else []
+
+    keys = np.array(sorted({k for k, _ in budgets} | {r[1] for r in current}), dtype=object)
+    n = len(keys)
+    budget = np.zeros(n, dtype=np.int64)
+    if budgets:
+        acct, cents = zip(*budgets)
+        budget[_positions(keys, acct)] = np.array(cents, dtype=np.int64)
+    # column 0 holds the undated actuals, 1..12 the fiscal months
+    months = np.zeros((n, 13), dtype=np.int64)
+    if current:
+        _, acct, month_of, cents = zip(*current)
+        np.add.at(months, (_positions(keys, acct), np.array(month_of)), np.array(cents, dtype=np.int64))
+
+    month, month_share, year_share = elapsed(fy, as_of)
+    undated = months[:, 0]
+    dated = months[:, 1:month + 1].sum(axis=1)
+    actual = dated + undated
+    projected = actual.astype(np.float64)
+    used = np.full(n, "linear" if 0 < year_share < 1 else "actual", dtype=object)
+
+    if 0 < year_share < 1:
+        projected = dated / year_share + undated
+        if method == "seasonal":
+            profile = np.zeros((n, 12), dtype=np.float64)
+            if prior:
+                _, acct, month_of, cents = zip(*prior)
+                pos, month_of = _positions(keys, acct), np.array(month_of, dtype=np.int64)
+                # dated months of the accounts in this year's keys
+                known = (pos >= 0) & (month_of > 0)
+                np.add.at(profile, (pos[known], month_of[known] - 1), np.array(cents, dtype=np.float64)[known])
+            # expected share of the year's spend by the cut-off, per account and for all accounts pooled
+            totals = profile.sum(axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                own = np.where(totals > 0, _expected(profile, totals, month, month_share), 0.0)
+                pooled_total = profile.sum()
+                pooled = _expected(profile.sum(axis=0), pooled_total, month, month_share) if pooled_total > 0 else 0.0
+                share = np.where(own >= FORECAST_MIN_SHARE, own, pooled)
+                projected = np.where(share >= FORECAST_MIN_SHARE, dated / np.clip(share, FORECAST_MIN_SHARE, 1) + undated,
+                                     projected)
+            used = np.where(own >= FORECAST_MIN_SHARE, "seasonal",
+                            np.where(share >= FORECAST_MIN_SHARE, "pooled", "linear")).astype(object)
+
+    projected = np.rint(projected).astype(np.int64)
+    return keys, budget, actual, projected, used
+
+
+def forecast(db: Session, fiscal_year: int | None = None, method: str = "seasonal",
+             as_of: datetime.date | None = None) -> tuple:
+    """(keys, budget, actual, projected, method) arrays for every account, cached per data version."""
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}: {method}")
+    fy = fiscal_year or fiscal.current_fiscal_year()
+    as_of = as_of or datetime.date.today()
+    with engine.connect() as conn:
+        version = snapshot.data_version(conn)
+    key = (fy, method, as_of)
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == version:
+            _cache.move_to_end(key)
+            metrics.cache_requests.inc(cache="forecast", result="hit")
+            return cached[1]
+    metrics.cache_requests.inc(cache="forecast", result="miss")
+    result = _project(db, fy, method, as_of)
+    with _lock:
+        # entries of an older data version can't be hit again
+        for k in [k for k, (v, _) in _cache.items() if v != version]:
+            del _cache[k]
+        _cache[key] = (version, result)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return result
+
+
+def forecast_items(db: Session, fiscal_year: int | None = None, method: str = "seasonal",
+                   as_of: datetime.date | None = None, acct5: str | None = None,
+                   segments: dict[int, str] | None = None, manager: str | None = None,
+                   over_only: bool = False) -> list[dict]:
+    """`db` is a live-database session; archived profile years are read from their files."""
+    keys, budget, actual, projected, used = forecast(db, fiscal_year, method, as_of)
+    keep = projected > budget if over_only else np.ones(len(keys), dtype=bool)
+    if acct5:
+        keep &= keys == acct5
+    chosen = segment_report.account_keys(segments, manager)
+    if chosen is not None:
+        keep &= np.isin(keys, np.array(db.execute(chosen).scalars().all(), dtype=object))
+    descriptions = dict(db.execute(select(models.Account.key, models.Account.description)).all())
+    items = []
+    for i in np.flatnonzero(keep):
+        b, a, p = int(budget[i]), int(actual[i]), int(projected[i])
+        items.append({
+            "account": keys[i],
+            "description": descriptions.get(keys[i]) or "",
+            "budget": from_cents(b),
+            "actual": from_cents(a),
+            "projected": from_cents(p),
+            "projected_variance": from_cents(b - p),
+            "projected_pct": round(p * 100 / b, 1) if b else None,
+            "over_budget": p > b,
+            "method": used[i],
+        })
+    return items
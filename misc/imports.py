@@ -0,0 +1,322 @@
+"""
+Streaming CSV import for managers, accounts, budget and actual items, and
+XLSX import of budget worksheets.
+
+The upload is decoded incrementally, rows are validated with the Pydantic
+schemas in batches of IMPORT_BATCH, and each batch of valid rows is written
+with one executemany INSERT in its own transaction.  Rows that fail
+validation, or that the database rejects, are reported by CSV line number
+instead of aborting the import.  Actuals already present (same row_hash, see
+utils.fingerprint) are skipped and counted, so re-running an import is safe.
+"""
+import csv
+import datetime
+import io
+import os
+import time
+import uuid
+from typing import BinaryIO
+
+from openpyxl import load_workbook
+from pydantic import ValidationError
+from sqlalchemy import insert, update, select, func, and_, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+import models
+import schemas
+from utils import metrics, fiscal
+from utils.fingerprint import actual_row_hash
+from utils.money import to_cents
+from utils.sequences import ACTUAL_SEQ
+
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "2000"))
+MAX_REPORTED_ERRORS = 1000
+
+
+def _manager_row(row: dict) -> dict:
+    m = schemas.ManagerCreate(**row)
+    return {"id": m.id, "name": m.name, "isdefault": "No", "isadmin": m.isadmin or "No"}
+
+
+def _account_row(row: dict) -> dict:
+    a = schemas.AccountCreate(**row)
+    return {"id": a.id, "key": a.key, "description": a.description}
+
+
+def _budget_row(row: dict) -> dict:
+    row["amount"] = row.get("amount") or 0
+    it = schemas.LineItemCreate(**row)
+    return {"id": it.id, "acct5": it.acct5, "line": it.line, "description": it.description,
+            "amount_cents": to_cents(it.amount)}
+
+
+def _actual_row(row: dict) -> dict:
+    row["amount"] = row.get("amount") or 0
+    row["seq"] = row.get("seq") or None
+    it = schemas.LineItemCreate(**row)
+    values = {"id": it.id, "acct5": it.acct5, "line": it.line, "description": it.description,
+              "amount_cents": to_cents(it.amount), "seq": it.seq, "tr_date": it.tr_date or None,
+              "vendor_name": it.vendor_name or None, "vouchno": it.vouchno or None}
+    values["row_hash"] = actual_row_hash(values)
+    return values
+
+
+# kind -> (model, row validator)
+KINDS = {
+    "managers": (models.Manager, _manager_row),
+    "accounts": (models.Account, _account_row),
+    "budget": (models.BudgetItem, _budget_row),
+    "actuals": (models.ActualItem, _actual_row),
+}
+
+
+def _error_text(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in exc.errors())
+    if isinstance(exc, SQLAlchemyError):
+        return str(getattr(exc, "orig", None) or exc).splitlines()[0]
+    return str(exc)
+
+
+class CsvImport:
+    """One import run; collects counts and per-row errors."""
+
+    def __init__(self, db: Session, kind: str):
+        self.db = db
+        self.kind = kind
+        self.model, self.validate = KINDS[kind]
+        self.rows = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors: list[dict] = []
+
+    def error(self, rownum: int, exc: Exception):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": rownum, "error": _error_text(exc)})
+
+    def _assign_seq(self, values: list[dict]):
+        # actuals without a seq get a contiguous range, reserved in its own short transaction:
+        # rolling back a rejected batch must not hand the range out again while the
+        # row-by-row retry commits rows carrying it
+        missing = [v for v in values if v["seq"] is None]
+        for v, seq in zip(missing, ACTUAL_SEQ.reserve(len(missing))):
+            v["seq"] = seq
+
+    def _insert(self):
+        if self.kind == "actuals":
+            # rows already imported (same row_hash) are skipped by the unique index
+            t = self.model.__table__
+            return sqlite_insert(t).on_conflict_do_nothing(index_elements=[t.c.row_hash])
+        return insert(self.model)
+
+    def _count(self, values: list[dict], res):
+        # ON CONFLICT DO NOTHING reports the rows it wrote; the other kinds' ORM inserts have no
+        # rowcount, and write every row or fail
+        written = res.rowcount if self.kind == "actuals" else len(values)
+        self.inserted += written
+        self.skipped += len(values) - written
+
+    def flush(self, batch: list[tuple[int, dict]]):
+        valid = []
+        for rownum, row in batch:
+            try:
+                valid.append((rownum, self.validate(row)))
+            except Exception as exc:
+                self.error(rownum, exc)
+        if not valid:
+            return
+        values = [v for _, v in valid]
+        if self.kind == "actuals":
+            self._assign_seq(values)
+        stmt = self._insert()
+        try:
+            res = self.db.execute(stmt, values)
+            self.db.commit()
+            self._count(values, res)
+            return
+        except SQLAlchemyError:
+            self.db.rollback()
+        # the batch was rejected as a whole; retry row by row to find the offenders
+        for rownum, v in valid:
+            try:
+                with self.db.begin_nested():
+                    res = self.db.execute(stmt, [v])
+                self._count([v], res)
+            except SQLAlchemyError as exc:
+                self.error(rownum, exc)
+        self.db.commit()
+
+    def run(self, fileobj: BinaryIO) -> dict:
+        started = time.perf_counter()
+        text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+        try:
+            reader = csv.DictReader(text)
+            batch = []
+            # line 1 is the header
+            for rownum, row in enumerate(reader, start=2):
+                self.rows += 1
+                batch.append((rownum, row))
+                if len(batch) >= IMPORT_BATCH:
+                    self.flush(batch)
+                    batch = []
+            if batch:
+                self.flush(batch)
+        finally:
+            text.detach()
+            metrics.record_import(f"csv:{self.kind}", self.inserted, time.perf_counter() - started)
+        return self.report()
+
+    def report(self) -> dict:
+        return {
+            "ok": self.failed == 0,
+            "count": self.inserted,
+            "skipped": self.skipped,
+            "rows": self.rows,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+def import_csv(db: Session, kind: str, fileobj: BinaryIO) -> dict:
+    return CsvImport(db, kind).run(fileobj)
+
+
+# ---- XLSX budget worksheets ----
+
+# accepted header spellings (lower-cased, spaces/underscores removed) -> budget column
+XLSX_HEADERS = {
+    "acct5": "acct5", "gl": "acct5", "glacct": "acct5", "account": "acct5", "acct": "acct5",
+    "formattedglacctno": "acct5",
+    "line": "line", "lineno": "line", "linenumber": "line",
+    "description": "description", "desc": "description",
+    "amount": "amount", "budget": "amount", "budgetamt": "amount",
+    "datefrom": "datefrom",
+}
+
+
+def fiscal_year_start(today: datetime.date | None = None) -> str:
+    """First day of the fiscal year containing `today`, as 'YYYY-MM-DD'."""
+    return fiscal.bounds(fiscal.fiscal_year(today))[0]
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m-%d")
+    return str(value).strip()
+
+
+def _amount(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = _cell_text(value).replace(",", "").replace("$", "")
+    if text.startswith("(") and text.endswith(")"):
+        text = "-" + text[1:-1]
+    return float(text or 0)
+
+
+def _line(value) -> str:
+    digits = "".join(ch for ch in _cell_text(value) if ch.isdigit())
+    if not digits:
+        raise ValueError("line: missing or not a number")
+    if int(digits) > 99:
+        raise ValueError(f"line: more than two digits: {digits}")
+    return f"{int(digits):02d}"
+
+
+def import_budget_xlsx(db: Session, fileobj: BinaryIO) -> dict:
+    """Read the first worksheet of a budget workbook and upsert every line on (acct5, line, datefrom).
+
+    The workbook is read with openpyxl read_only mode; only the distinct (acct5, line, datefrom)
+    rows are kept in memory.  Everything is applied in a single transaction.  A legacy row for the
+    same acct5/line that has no datefrom is stamped with the import's datefrom first, so it is
+    updated in place instead of duplicated; further legacy rows for that acct5/line are left as
+    they are.
+    """
+    started = time.perf_counter()
+    wb = load_workbook(fileobj, read_only=True, data_only=True)
+    errors: list[dict] = []
+    failed = 0
+    rows = 0
+    values: dict[tuple, dict] = {}
+    default_from = fiscal_year_start()
+    try:
+        ws = wb.worksheets[0]
+        it = ws.iter_rows(values_only=True)
+        header = next(it, None) or ()
+        columns = {}
+        for i, name in enumerate(header):
+            key = _cell_text(name).lower().replace(" ", "").replace("_", "")
+            if key in XLSX_HEADERS and XLSX_HEADERS[key] not in columns:
+                columns[XLSX_HEADERS[key]] = i
+        missing = [c for c in ("acct5", "line", "amount") if c not in columns]
+        if missing:
+            return {"ok": False, "count": 0, "rows": 0, "failed": 0,
+                    "errors": [{"row": 1, "error": f"missing column(s): {', '.join(missing)}"}],
+                    "errors_truncated": False}
+
+        def cell(row, name):
+            i = columns.get(name)
+            return row[i] if i is not None and i < len(row) else None
+
+        for rownum, row in enumerate(it, start=2):
+            if not any(v is not None and _cell_text(v) for v in row):
+                continue
+            rows += 1
+            try:
+                acct5 = _cell_text(cell(row, "acct5"))
+                if not acct5:
+                    raise ValueError("acct5: missing")
+                line = _line(cell(row, "line"))
+                try:
+                    amount_cents = to_cents(_amount(cell(row, "amount")))
+                except ValueError:
+                    raise ValueError("amount: not a number")
+                datefrom = _cell_text(cell(row, "datefrom")) or default_from
+                values[(acct5, line, datefrom)] = {
+                    "id": uuid.uuid4().hex, "acct5": acct5, "line": line, "datefrom": datefrom,
+                    "description": _cell_text(cell(row, "description")), "amount_cents": amount_cents,
+                }
+            except Exception as exc:
+                failed += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"row": rownum, "error": _error_text(exc)})
+    finally:
+        wb.close()
+
+    if values:
+        t = models.BudgetItem.__table__
+        # one legacy row per (acct5, line): stamping them all would collide on (acct5, line, datefrom)
+        legacy = (select(func.min(t.c.id))
+                  .where(and_(t.c.acct5 == bindparam("b_acct5"), t.c.line == bindparam("b_line"),
+                              t.c.datefrom.is_(None)))
+                  .scalar_subquery())
+        adopt = (update(t)
+                 .where(t.c.id == legacy)
+                 .values(datefrom=bindparam("b_datefrom"), fiscal_year=bindparam("b_fiscal_year")))
+        stmt = sqlite_insert(t)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.acct5, t.c.line, t.c.datefrom],
+            set_={"description": stmt.excluded.description, "amount_cents": stmt.excluded.amount_cents},
+        )
+        try:
+            db.execute(adopt, [{"b_acct5": a, "b_line": l, "b_datefrom": d, "b_fiscal_year": fiscal.fiscal_year(d)}
+                               for (a, l, d) in values])
+            db.execute(stmt, list(values.values()))
+            db.commit()
+        except SQLAlchemyError as exc:
+            db.rollback()
+            return {"ok": False, "count": 0, "rows": rows, "failed": rows,
+                    "errors": [{"row": None, "error": _error_text(exc)}], "errors_truncated": False}
+
+    metrics.record_import("xlsx:budget", len(values), time.perf_counter() - started)
+    return {"ok": failed == 0, "count": len(values), "rows": rows, "failed": failed,
+            "errors": errors, "errors_truncated": failed > len(errors)}
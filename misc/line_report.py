@@ -0,0 +1,197 @@
+"""
+Budget-vs-actual line report (/api/line-items): budget and actual amounts
+summed per (acct5, line), joined, with the variance.  Filters:
+
+    acct5        exact account key
+    description  case-insensitive substring of the line's description (utils/text.py)
+    manager      accounts assigned to the manager in acct_mgrs
+    fiscal_year  one fiscal year (utils/fiscal.py); None reports every year in the tables
+
+Three engines compute the same rows; LINE_REPORT_ENGINE picks one (default
+snapshot, or sql when LEDGER_SNAPSHOT is off):
+
+    sql     one statement: grouped budget and grouped actual lines outer-joined
+            on the union of their keys, with every filter pushed into the
+            grouped scans, so the (acct5, line) index and acct_mgrs(manager_id)
+            limit a filtered report to the accounts it covers.
+    numpy   reads acct5, line, amount_cents and description for every row,
+            factorizes (acct5, line) once over both tables, sums with bincount
+            and applies the filters as boolean masks.  Its cost does not depend
+            on the filters, which suits the unfiltered report.
+    snapshot  the same group-by over the process-local ledger snapshot
+            (misc/snapshot.py): no table scan per request, only a data-version
+            check and whatever changed since the last one.
+
+Amounts are summed as integer cents and converted once per output row.  The
+descriptions are those of the last budget and actual row of each key; a budget
+line filtered out by description still lends its description to an actual on
+the same (acct5, line), as the dict-based join did.
+"""
+import os
+
+import numpy as np
+from sqlalchemy import select, func, union, and_, literal_column
+from sqlalchemy.orm import Session
+
+import models
+from misc import archive, snapshot
+from utils.money import from_cents
+from utils.text import fold, contains
+
+LINE_REPORT_ENGINE = os.getenv("LINE_REPORT_ENGINE", "snapshot" if snapshot.LEDGER_SNAPSHOT else "sql").strip().lower()
+
+
+def _columns(db: Session, model, acct5: str | None, manager: str | None,
+             fiscal_year: int | None) -> dict[str, np.ndarray]:
+    # plain DBAPI tuples: building a SQLAlchemy Row per ledger line costs more than the query
+    cursor = db.connection().connection.cursor()
+    try:
+        sql = f"SELECT acct5, line, amount_cents, description FROM {model.__tablename__}"
+        if fiscal_year is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(sql + " WHERE fiscal_year = ?", (fiscal_year,))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    acct5s, lines, cents, descriptions = zip(*rows) if rows else ((), (), (), ())
+    cols = {
+        # fixed-width unicode arrays sort and compare in C, unlike arrays of Python str objects
+        "acct5": np.array(acct5s, dtype=str),
+        "line": np.array(lines, dtype=str),
+        "cents": np.array(cents, dtype=np.int64),
+        "description": np.array(descriptions, dtype=object),
+    }
+    mask = np.ones(len(rows), dtype=bool)
+    if acct5:
+        mask &= cols["acct5"] == acct5
+    if manager:
+        keys = db.execute(select(models.AcctMgr.key).where(models.AcctMgr.manager_id == manager)).scalars().all()
+        mask &= np.isin(cols["acct5"], np.array(keys, dtype=str))
+    return {k: v[mask] for k, v in cols.items()}
+
+
+def _contains(values: np.ndarray, text: str) -> np.ndarray:
+    needle = fold(text)
+    return np.fromiter((needle in fold(v or "") for v in values), dtype=bool, count=len(values))
+
+
+def _last_index(codes: np.ndarray, n: int) -> np.ndarray:
+    """Position of the last row for each code (-1 where a code has no rows)."""
+    last = np.full(n, -1, dtype=np.int64)
+    np.maximum.at(last, codes, np.arange(len(codes), dtype=np.int64))
+    return last
+
+
+def numpy_line_items(db: Session, acct5: str | None = None, description: str | None = None,
+                     manager: str | None = None, fiscal_year: int | None = None) -> list[dict]:
+    budget = _columns(db, models.BudgetItem, acct5, manager, fiscal_year)
+    actual = _columns(db, models.ActualItem, acct5, manager, fiscal_year)
+    nb = len(budget["acct5"])
+
+    # one factorization of (acct5, line) over both tables; np.unique sorts, so keys come out ordered
+    acct_keys, acct_codes = np.unique(np.concatenate([budget["acct5"], actual["acct5"]]), return_inverse=True)
+    line_keys, line_codes = np.unique(np.concatenate([budget["line"], actual["line"]]), return_inverse=True)
+    pair = acct_codes.astype(np.int64) * len(line_keys) + line_codes
+    pairs, codes = np.unique(pair, return_inverse=True)
+    n = len(pairs)
+    b_codes, a_codes = codes[:nb], codes[nb:]
+
+    # the description filter applies per row; descriptions for lookup use the unfiltered budget rows
+    b_desc_last = _last_index(b_codes, n)
+    if description:
+        b_keep = _contains(budget["description"], description)
+        a_keep = _contains(actual["description"], description)
+    else:
+        b_keep = np.ones(nb, dtype=bool)
+        a_keep = np.ones(len(a_codes), dtype=bool)
+
+    b_sum = np.bincount(b_codes[b_keep], weights=budget["cents"][b_keep], minlength=n)
+    a_sum = np.bincount(a_codes[a_keep], weights=actual["cents"][a_keep], minlength=n)
+    present = (np.bincount(b_codes[b_keep], minlength=n) + np.bincount(a_codes[a_keep], minlength=n)) > 0
+    # bincount sums in float64: exact for integer cents up to 2**53
+    b_sum = np.rint(b_sum).astype(np.int64)
+    a_sum = np.rint(a_sum).astype(np.int64)
+    variance = b_sum - a_sum
+    a_desc_last = _last_index(a_codes[a_keep], n)
+    a_desc_rows = actual["description"][a_keep]
+
+    items = []
+    for i in np.flatnonzero(present):
+        b_last, a_last = b_desc_last[i], a_desc_last[i]
+        items.append({
+            "acct5": str(acct_keys[pairs[i] // len(line_keys)]),
+            "line": str(line_keys[pairs[i] % len(line_keys)]),
+            "budget": from_cents(int(b_sum[i])),
+            "actual": from_cents(int(a_sum[i])),
+            "variance": from_cents(int(variance[i])),
+            "budget_desc": budget["description"][b_last] if b_last >= 0 else None,
+            "actual_desc": a_desc_rows[a_last] if a_last >= 0 else None,
+        })
+    return items
+
+
+def _grouped(model, acct5: str | None, description: str | None, manager: str | None, fiscal_year: int | None):
+    t = model.__table__
+    # SQLite takes the bare description column from the row that has max(rowid): the last one
+    stmt = select(t.c.acct5, t.c.line, func.sum(t.c.amount_cents).label("cents"), t.c.description,
+                  func.max(literal_column(f"{t.name}.rowid")).label("last_row"))
+    if fiscal_year is not None:
+        stmt = stmt.where(t.c.fiscal_year == fiscal_year)
+    if acct5:
+        stmt = stmt.where(t.c.acct5 == acct5)
+    if manager:
+        stmt = stmt.where(t.c.acct5.in_(select(models.AcctMgr.key).where(models.AcctMgr.manager_id == manager)))
+    if description:
+        stmt = stmt.where(contains(t.c.description, description))
+    return stmt.group_by(t.c.acct5, t.c.line)
+
+
+def sql_line_items(db: Session, acct5: str | None = None, description: str | None = None,
+                   manager: str | None = None, fiscal_year: int | None = None) -> list[dict]:
+    b = _grouped(models.BudgetItem, acct5, description, manager, fiscal_year).cte("b")
+    a = _grouped(models.ActualItem, acct5, description, manager, fiscal_year).cte("a")
+    # budget descriptions ignore the description filter (see the module docstring)
+    bd = _grouped(models.BudgetItem, acct5, None, manager, fiscal_year).cte("bd") if description else b
+    k = union(select(b.c.acct5, b.c.line), select(a.c.acct5, a.c.line)).cte("k")
+
+    def on(side):
+        return and_(side.c.acct5 == k.c.acct5, side.c.line == k.c.line)
+
+    stmt = (select(k.c.acct5, k.c.line, func.coalesce(b.c.cents, 0), func.coalesce(a.c.cents, 0),
+                   bd.c.description, a.c.description)
+            .select_from(k)
+            .outerjoin(b, on(b))
+            .outerjoin(a, on(a)))
+    if bd is not b:
+        stmt = stmt.outerjoin(bd, on(bd))
+    items = []
+    for acct, line, budget, actual, budget_desc, actual_desc in db.execute(stmt.order_by(k.c.acct5, k.c.line)):
+        items.append({
+            "acct5": acct, "line": line,
+            "budget": from_cents(budget),
+            "actual": from_cents(actual),
+            "variance": from_cents(budget - actual),
+            "budget_desc": budget_desc,
+            "actual_desc": actual_desc,
+        })
+    return items
+
+
+def snapshot_line_items(db: Session, acct5: str | None = None, description: str | None = None,
+                        manager: str | None = None, fiscal_year: int | None = None) -> list[dict]:
+    if fiscal_year is not None and archive.is_archived(fiscal_year):
+        # the snapshot holds the live tables; `db` reads the year's archive file
+        return sql_line_items(db, acct5=acct5, description=description, manager=manager, fiscal_year=fiscal_year)
+    return snapshot.line_items(acct5=acct5, description=description, manager=manager, fiscal_year=fiscal_year)
+
+
+ENGINES = {"sql": sql_line_items, "numpy": numpy_line_items, "snapshot": snapshot_line_items}
+if LINE_REPORT_ENGINE not in ENGINES:
+    raise ValueError(f"LINE_REPORT_ENGINE must be one of {', '.join(ENGINES)}: '{LINE_REPORT_ENGINE}'")
+
+
+def line_items(db: Session, acct5: str | None = None, description: str | None = None,
+               manager: str | None = None, fiscal_year: int | None = None) -> list[dict]:
+    return ENGINES[LINE_REPORT_ENGINE](db, acct5=acct5, description=description, manager=manager,
+                                       fiscal_year=fiscal_year)
@@ -0,0 +1,79 @@
+"""
+Monthly spend report (/api/monthly-items): a fiscal year's actuals month by
+month with the cumulative spend against the year's budget, for one account,
+a manager's accounts, the accounts with given GL segment codes (utils/gl.py,
+e.g. seg2=03 for department 03), or every account whose key starts with a
+prefix (the leading segments, e.g. '52100' or '52100-03').
+
+The months are read from actual_monthly (models.ActualMonthly), which the
+actual_items triggers in app.py keep summed per (fiscal_year, acct5, fiscal
+month), so the report reads at most twelve rows per account and never the
+ledger itself.  An archived year (misc/archive.py) is read from its file,
+which carries the year's monthly rows.
+
+The budget is the year's total over budget_items; `budget_to_date` spreads it
+evenly over the twelve months.  Undated actuals (month 0) have been spent at
+some point in the year and count towards every month's cumulative spend.
+"""
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+import models
+from misc import segment_report
+from utils import fiscal
+from utils.money import from_cents
+
+
+def _filters(column, acct5: str | None, prefix: str | None, segments: dict[int, str] | None,
+             manager: str | None) -> list:
+    conds = []
+    if acct5:
+        conds.append(column == acct5)
+    if prefix:
+        # a key range rather than LIKE, so the scan seeks on the (fiscal_year, acct5, ...) keys
+        conds.extend((column >= prefix, column < prefix[:-1] + chr(ord(prefix[-1]) + 1)))
+    keys = segment_report.account_keys(segments, manager)
+    if keys is not None:
+        conds.append(column.in_(keys))
+    return conds
+
+
+def monthly_items(db: Session, fiscal_year: int | None = None, acct5: str | None = None,
+                  prefix: str | None = None, segments: dict[int, str] | None = None,
+                  manager: str | None = None) -> dict:
+    """`db` is a session on the year's database: the live one, or its archive file."""
+    fy = fiscal_year or fiscal.current_fiscal_year()
+    m = models.ActualMonthly
+    by_month = {month: (cents or 0, count or 0) for month, cents, count in db.execute(
+        select(m.month, func.sum(m.amount_cents), func.sum(m.count))
+        .where(m.fiscal_year == fy, *_filters(m.acct5, acct5, prefix, segments, manager))
+        .group_by(m.month))}
+    b = models.BudgetItem
+    budget = db.execute(select(func.sum(b.amount_cents))
+                        .where(b.fiscal_year == fy, *_filters(b.acct5, acct5, prefix, segments, manager))).scalar() or 0
+
+    undated, undated_count = by_month.get(0, (0, 0))
+    cumulative, months = undated, []
+    for month in range(1, 13):
+        cents, count = by_month.get(month, (0, 0))
+        cumulative += cents
+        to_date = budget * month // 12
+        months.append({
+            "month": month,
+            "start": fiscal.month_start(fy, month).isoformat(),
+            "actual": from_cents(cents),
+            "count": count,
+            "cumulative": from_cents(cumulative),
+            "budget_to_date": from_cents(to_date),
+            "variance": from_cents(to_date - cumulative),
+            "pct_of_budget": round(cumulative * 100 / budget, 1) if budget else None,
+        })
+    return {
+        "fiscal_year": fy,
+        "budget": from_cents(budget),
+        "actual": from_cents(cumulative),
+        "remaining": from_cents(budget - cumulative),
+        "undated": from_cents(undated),
+        "undated_count": undated_count,
+        "months": months,
+    }
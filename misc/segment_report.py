@@ -0,0 +1,77 @@
+"""
+Segment rollups (/api/segment-items): a fiscal year's budget, actual and
+variance summed over the GL segment hierarchy (utils/gl.py).
+
+    level        group by the first `level` segments: 1 per fund, 2 per fund and
+                 department, ... 5 per account; 0 for one total
+    seg1..seg5   only accounts with these segment codes, e.g. seg2=03 for all of
+                 department 03 whatever the fund
+    manager      accounts assigned to the manager in acct_mgrs
+
+The accounts are chosen and grouped through their indexed seg1..seg5
+columns.  Actuals are read from the monthly totals (models.ActualMonthly, at
+most twelve rows per account and year) and budgets from budget_items through
+its (fiscal_year, acct5, line) index; both are summed per group in one
+GROUP BY over their UNION ALL.  Ledger rows for keys missing from accounts
+have no segments and are left out.
+"""
+from sqlalchemy import select, func, union_all, literal
+from sqlalchemy.orm import Session
+
+import models
+from utils import fiscal, gl
+from utils.money import from_cents
+
+
+def account_keys(segments: dict[int, str] | None = None, manager: str | None = None):
+    """SELECT of the keys of the accounts with the given segment codes (and manager), or None for all."""
+    a = models.Account.__table__
+    conds = [a.c[f"seg{i}"] == code for i, code in sorted((segments or {}).items())]
+    if manager:
+        conds.append(a.c.key.in_(select(models.AcctMgr.key).where(models.AcctMgr.manager_id == manager)))
+    return select(a.c.key).where(*conds) if conds else None
+
+
+def segment_items(db: Session, fiscal_year: int | None = None, level: int = 1,
+                  segments: dict[int, str] | None = None, manager: str | None = None) -> list[dict]:
+    """`db` is a session on the year's database: the live one, or its archive file."""
+    fy = fiscal_year or fiscal.current_fiscal_year()
+    if not 0 <= level <= gl.SEGMENTS:
+        raise ValueError(f"level must be 0-{gl.SEGMENTS}: {level}")
+    keys = account_keys(segments, manager)
+    b, m = models.BudgetItem.__table__, models.ActualMonthly.__table__
+    parts = [select(b.c.acct5, b.c.amount_cents.label("budget"), literal(0).label("actual"))
+             .where(b.c.fiscal_year == fy),
+             select(m.c.acct5, literal(0).label("budget"), m.c.amount_cents.label("actual"))
+             .where(m.c.fiscal_year == fy)]
+    if keys is not None:
+        parts = [p.where(p.selected_columns.acct5.in_(keys)) for p in parts]
+    u = union_all(*parts).subquery("u")
+
+    a = models.Account.__table__
+    group = [a.c[f"seg{i}"] for i in range(1, level + 1)]
+    described = [func.max(a.c[f"seg{level}_desc"])] if level else []
+    stmt = (select(*group, *described, func.count(func.distinct(a.c.key)),
+                   func.sum(u.c.budget), func.sum(u.c.actual))
+            .select_from(u.join(a, a.c.key == u.c.acct5))
+            .group_by(*group)
+            .order_by(*group))
+
+    items = []
+    for row in db.execute(stmt):
+        codes, rest = list(row[:level]), row[level:]
+        description, (accounts, budget, actual) = (rest[0], rest[1:]) if level else (None, rest)
+        if not accounts:
+            continue
+        budget, actual = budget or 0, actual or 0
+        items.append({
+            "segments": {f"seg{i}": code for i, code in enumerate(codes, 1)},
+            "prefix": gl.prefix(codes) if codes and None not in codes else None,
+            "description": description or "",
+            "accounts": accounts,
+            "budget": from_cents(budget),
+            "actual": from_cents(actual),
+            "variance": from_cents(budget - actual),
+        })
+    return items
+
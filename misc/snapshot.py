@@ -0,0 +1,453 @@
+"""
+Process-local, read-optimized snapshot of the ledger: accounts, acct_mgrs,
+budget_items and actual_items held as NumPy columns, serving the report
+endpoints (/api/home-items, /api/budget-items, /api/actual-items and the
+line report) without scanning the tables for every request.
+
+    LEDGER_SNAPSHOT=1        serve the report endpoints from the snapshot (default on)
+    SNAPSHOT_FULL_EVERY=3600 seconds after which the snapshot is rebuilt from scratch
+
+Layout
+  * strings are interned in two pools, account keys and other text; columns
+    hold int32 codes (0 is NULL), so each distinct description, vendor or
+    date is stored once and account joins compare integers;
+  * amounts are int64 cents, fiscal years int16; every table keeps its rowids;
+  * rows are grouped per account by an offset index (order + offsets), so one
+    account's or one manager's rows are a few slices, not a scan.
+
+Freshness
+  Every request checks the data version: max(rowid) of each table and the
+  newest id in ledger_changes, which UPDATE and DELETE triggers fill with the
+  rowids they touch.  When it moved, only the difference is read: rows past
+  the snapshot's highest rowid (inserts) and the logged rowids (updates and
+  deletes, re-read by rowid).  A table is reloaded whole when its logged
+  changes exceed REPLAY_LIMIT of its rows or the log was pruned past the
+  snapshot.  The version check, the changes and the rows are read in one
+  transaction, so they are consistent.
+
+Each uvicorn worker holds its own copy; stats() reports its memory.
+"""
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from db import engine
+from utils import metrics
+from utils.money import from_cents
+from utils.text import fold
+
+LEDGER_SNAPSHOT = os.getenv("LEDGER_SNAPSHOT", "1").strip().lower() not in ("0", "false", "no", "off", "")
+SNAPSHOT_FULL_EVERY = float(os.getenv("SNAPSHOT_FULL_EVERY", "3600"))
+# share of a table's rows that may be re-read as single changes; past it the table is reloaded
+REPLAY_LIMIT = 0.25
+# rebuild the string pools once they hold this many times the strings of the last full build
+POOL_SLACK = 2.0
+
+# table -> (column, snapshot column, kind); kind is "key" (account pool), "text" (text pool), "int" or "year"
+TABLES = {
+    "accounts": [("key", "acct", "key"), ("description", "description", "text")],
+    "acct_mgrs": [("key", "acct", "key"), ("manager_id", "manager", "text")],
+    "budget_items": [("acct5", "acct", "key"), ("line", "line", "text"), ("amount_cents", "cents", "int"),
+                     ("description", "description", "text"), ("fiscal_year", "fy", "year")],
+    "actual_items": [("acct5", "acct", "key"), ("line", "line", "text"), ("amount_cents", "cents", "int"),
+                     ("description", "description", "text"), ("tr_date", "tr_date", "text"),
+                     ("vendor_name", "vendor", "text"), ("vouchno", "vouchno", "text"),
+                     ("fiscal_year", "fy", "year")],
+}
+
+VERSION_SQL = text("SELECT " + ", ".join(f"(SELECT max(rowid) FROM {t})" for t in TABLES)
+                   + ", (SELECT max(id) FROM ledger_changes), (SELECT min(id) FROM ledger_changes)")
+
+
+class StringPool:
+    """Interned strings; code 0 is NULL."""
+
+    def __init__(self):
+        self.values: list[str | None] = [None]
+        self.codes: dict[str, int] = {}
+        self.nbytes = 0
+
+    def encode(self, strings) -> np.ndarray:
+        codes, values = self.codes, self.values
+
+        def code(s):
+            if s is None:
+                return 0
+            c = codes.get(s)
+            if c is None:
+                c = codes[s] = len(values)
+                values.append(s)
+                self.nbytes += sys.getsizeof(s)
+            return c
+
+        return np.fromiter(map(code, strings), dtype=np.int32, count=len(strings))
+
+    def lookup(self, s: str | None) -> int | None:
+        return 0 if s is None else self.codes.get(s)
+
+    def matching(self, codes: np.ndarray, needle: str) -> np.ndarray:
+        """Mask of `codes` whose string contains `needle`, case-insensitively as in SQL (utils/text.py); each distinct string is tested once."""
+        needle = fold(needle)
+        distinct, inverse = np.unique(codes, return_inverse=True)
+        values = self.values
+        hit = np.fromiter((c != 0 and needle in fold(values[c]) for c in distinct.tolist()),
+                          dtype=bool, count=len(distinct))
+        return hit[inverse]
+
+
+class Table:
+    """Immutable columns of one table plus its per-account offset index."""
+
+    def __init__(self, name: str, rowid: np.ndarray, columns: dict[str, np.ndarray], n_keys: int):
+        self.name = name
+        self.rowid = rowid
+        self.columns = columns
+        self.max_rowid = int(rowid.max()) if len(rowid) else 0
+        acct = columns["acct"]
+        self.order = np.argsort(acct, kind="stable").astype(np.int32)
+        self.offsets = np.searchsorted(acct[self.order], np.arange(n_keys + 1)).astype(np.int64)
+        self._totals = {}
+
+    def __len__(self):
+        return len(self.rowid)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.rowid, self.order, self.offsets, *self.columns.values(), *self._totals.values()]
+        return sum(a.nbytes for a in arrays)
+
+    def rows_for(self, acct_codes) -> np.ndarray:
+        """Positions of the rows of the given accounts, account by account."""
+        limit = len(self.offsets) - 1
+        parts = [self.order[self.offsets[c]:self.offsets[c + 1]] for c in acct_codes if 0 < c < limit]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+
+    def in_year(self, rows: np.ndarray, fiscal_year: int | None) -> np.ndarray:
+        return rows if fiscal_year is None else rows[self.columns["fy"][rows] == fiscal_year]
+
+    def totals(self, fiscal_year: int | None = None) -> np.ndarray:
+        """Sum of cents per account code, in one fiscal year or all of them."""
+        totals = self._totals.get(fiscal_year)
+        if totals is None:
+            acct, cents = self.columns["acct"], self.columns["cents"]
+            if fiscal_year is not None:
+                mask = self.columns["fy"] == fiscal_year
+                acct, cents = acct[mask], cents[mask]
+            # bincount sums in float64: exact for integer cents up to 2**53
+            sums = np.bincount(acct, weights=cents, minlength=len(self.offsets) - 1)
+            totals = self._totals[fiscal_year] = np.rint(sums).astype(np.int64)
+        return totals
+
+
+class View:
+    """What a request reads: the tables and pools as of one data version."""
+
+    def __init__(self, tables: dict[str, Table], keys: StringPool, text_pool: StringPool, version: tuple):
+        self.tables = tables
+        self.keys = keys
+        self.text = text_pool
+        self.version = version
+
+    def key(self, code) -> str:
+        return self.keys.values[code]
+
+    def string(self, code) -> str | None:
+        return self.text.values[code]
+
+
+class _State:
+    def __init__(self):
+        self.keys = StringPool()
+        self.text = StringPool()
+        self.tables: dict[str, Table] = {}
+        self.version: tuple | None = None
+        self.change_id = 0
+        self.built_at = 0.0
+        self.pool_size = 0
+        self.view: View | None = None
+        self.refreshes = {"hit": 0, "incremental": 0, "full": 0}
+        self.last_refresh = None
+
+
+_lock = threading.Lock()
+_state = _State()
+
+
+def _load(conn, name: str, state: _State, where: str = "", params: dict | None = None) -> tuple[np.ndarray, dict]:
+    spec = TABLES[name]
+    sql = f"SELECT rowid, {', '.join(c for c, _, _ in spec)} FROM {name} {where} ORDER BY rowid"
+    rows = (conn.exec_driver_sql(sql, params) if params else conn.exec_driver_sql(sql)).fetchall()
+    cols = list(zip(*rows)) if rows else [()] * (len(spec) + 1)
+    rowid = np.array(cols[0], dtype=np.int64)
+    columns = {}
+    for (_, col, kind), values in zip(spec, cols[1:]):
+        if kind == "key":
+            columns[col] = state.keys.encode(values)
+        elif kind == "text":
+            columns[col] = state.text.encode(values)
+        else:
+            columns[col] = np.array([v or 0 for v in values], dtype=np.int16 if kind == "year" else np.int64)
+    return rowid, columns
+
+
+def _full(conn, state: _State, version: tuple):
+    state.keys, state.text = StringPool(), StringPool()
+    loaded = {name: _load(conn, name, state) for name in TABLES}
+    n_keys = len(state.keys.values)
+    state.tables = {name: Table(name, rowid, cols, n_keys) for name, (rowid, cols) in loaded.items()}
+    state.change_id = version[len(TABLES)] or 0
+    state.built_at = time.time()
+    state.pool_size = len(state.keys.values) + len(state.text.values)
+
+
+def _incremental(conn, state: _State, version: tuple) -> bool:
+    """Apply inserts and logged changes; False when a full rebuild is needed instead."""
+    newest, oldest = version[len(TABLES)] or 0, version[len(TABLES) + 1]
+    if oldest is not None and oldest > state.change_id + 1 and newest > state.change_id:
+        return False  # the log was pruned past what this snapshot has seen
+    changed = {}
+    if newest > state.change_id:
+        for tbl, row_id in conn.exec_driver_sql(
+                "SELECT DISTINCT tbl, row_id FROM ledger_changes WHERE id > ?", (state.change_id,)):
+            changed.setdefault(tbl, set()).add(row_id)
+    updates = {}
+    for i, name in enumerate(TABLES):
+        table = state.tables[name]
+        rowids = changed.get(name, set())
+        max_rowid = version[i] or 0
+        if not rowids and max_rowid == table.max_rowid:
+            continue
+        if len(rowids) > max(REPLAY_LIMIT * len(table), 1000):
+            return False
+        keep = ~np.isin(table.rowid, np.fromiter(rowids, dtype=np.int64, count=len(rowids)))
+        rowid, cols = _load(conn, name, state,
+                            "WHERE rowid > :top OR rowid IN (SELECT row_id FROM ledger_changes "
+                            "WHERE id > :since AND tbl = :tbl)",
+                            {"top": table.max_rowid, "since": state.change_id, "tbl": name})
+        merged = np.concatenate([table.rowid[keep], rowid])
+        # rows stay in rowid order, so "the last row" of a group means the same as in SQL
+        order = np.argsort(merged, kind="stable")
+        updates[name] = (merged[order], {c: np.concatenate([v[keep], cols[c]])[order] for c, v in table.columns.items()})
+    # new account keys widen every table's offset index, not only the tables that changed
+    n_keys = len(state.keys.values)
+    for name, table in state.tables.items():
+        if name in updates:
+            state.tables[name] = Table(name, *updates[name], n_keys)
+        elif len(table.offsets) - 1 < n_keys:
+            state.tables[name] = Table(name, table.rowid, table.columns, n_keys)
+    state.change_id = newest
+    return True
+
+
+def _publish(state: _State):
+    for name, table in state.tables.items():
+        metrics.snapshot_rows.set(len(table), table=name)
+        metrics.snapshot_bytes.set(table.nbytes, part=name)
+    metrics.snapshot_bytes.set(state.keys.nbytes, part="key_pool")
+    metrics.snapshot_bytes.set(state.text.nbytes, part="text_pool")
+
+
+def data_version(conn) -> tuple:
+    """max(rowid) of each ledger table and the newest ledger_changes id: moves with every write to them."""
+    return tuple(conn.execute(VERSION_SQL).one())[:len(TABLES) + 1]
+
+
+def get() -> View:
+    """The snapshot as of the current data version, refreshed first if the tables changed."""
+    with _lock:
+        state = _state
+        started = time.perf_counter()
+        with engine.connect() as conn:
+            with conn.begin():
+                version = tuple(conn.execute(VERSION_SQL).one())
+                data_version = version[:len(TABLES) + 1]
+                stale = time.time() - state.built_at > SNAPSHOT_FULL_EVERY
+                if state.view is not None and data_version == state.version and not stale:
+                    state.refreshes["hit"] += 1
+                    metrics.cache_requests.inc(cache="ledger_snapshot", result="hit")
+                    return state.view
+                metrics.cache_requests.inc(cache="ledger_snapshot", result="miss")
+                bloated = len(state.keys.values) + len(state.text.values) > POOL_SLACK * state.pool_size + 100000
+                kind = "incremental"
+                if state.view is None or stale or bloated or not _incremental(conn, state, version):
+                    _full(conn, state, version)
+                    kind = "full"
+        state.version = data_version
+        state.view = View(dict(state.tables), state.keys, state.text, data_version)
+        seconds = time.perf_counter() - started
+        state.refreshes[kind] += 1
+        state.last_refresh = {"kind": kind, "seconds": round(seconds, 4), "at": time.time()}
+        metrics.snapshot_refreshes.inc(kind=kind)
+        metrics.snapshot_refresh_duration.observe(seconds, kind=kind)
+        _publish(state)
+        return state.view
+
+
+def stats() -> dict:
+    with _lock:
+        state = _state
+        tables = {name: {"rows": len(t), "bytes": t.nbytes, "max_rowid": t.max_rowid}
+                  for name, t in state.tables.items()}
+        pools = {"keys": {"strings": len(state.keys.values) - 1, "bytes": state.keys.nbytes},
+                 "text": {"strings": len(state.text.values) - 1, "bytes": state.text.nbytes}}
+        return {
+            "enabled": LEDGER_SNAPSHOT,
+            "built": state.view is not None,
+            "version": list(state.version) if state.version else None,
+            "change_id": state.change_id,
+            "built_at": state.built_at or None,
+            "tables": tables,
+            "pools": pools,
+            "bytes": sum(t["bytes"] for t in tables.values()) + sum(p["bytes"] for p in pools.values()),
+            "refreshes": dict(state.refreshes),
+            "last_refresh": state.last_refresh,
+        }
+
+
+# ---- queries ----
+
+def _like(pool: StringPool, codes: np.ndarray, needle: str | None) -> np.ndarray:
+    return pool.matching(codes, needle) if needle else np.ones(len(codes), dtype=bool)
+
+
+def _managed(view: View, manager: str) -> np.ndarray:
+    """Account codes assigned to `manager`."""
+    mgrs = view.tables["acct_mgrs"]
+    code = view.text.lookup(manager)
+    if code is None:
+        return np.empty(0, dtype=np.int32)
+    return np.unique(mgrs.columns["acct"][mgrs.columns["manager"] == code])
+
+
+def account_codes(view: View, acct5: str | None = None, description: str | None = None,
+                  manager: str | None = None) -> list[int]:
+    """Codes of the accounts crud.account_list would return (key and description match as LIKE '%x%'), by key."""
+    accounts = view.tables["accounts"]
+    acct = accounts.columns["acct"]
+    mask = (acct != 0) & _like(view.keys, acct, acct5) & _like(view.text, accounts.columns["description"], description)
+    if manager:
+        mask &= np.isin(acct, _managed(view, manager))
+    codes = [c for c in acct[mask].tolist() if view.key(c).strip()]
+    return sorted(codes, key=view.key)
+
+
+def _account_descriptions(view: View) -> dict[int, str]:
+    accounts = view.tables["accounts"]
+    return dict(zip(accounts.columns["acct"].tolist(), accounts.columns["description"].tolist()))
+
+
+def _total(table: Table, code: int, fiscal_year: int | None) -> int:
+    totals = table.totals(fiscal_year)
+    return int(totals[code]) if code < len(totals) else 0
+
+
+def home_items(acct5: str | None = None, description: str | None = None, manager: str | None = None,
+               fiscal_year: int | None = None) -> list[dict]:
+    view = get()
+    budget, actual = view.tables["budget_items"], view.tables["actual_items"]
+    descriptions = _account_descriptions(view)
+    items = []
+    for c in account_codes(view, acct5, description, manager):
+        b, a = _total(budget, c, fiscal_year), _total(actual, c, fiscal_year)
+        items.append({"account": view.key(c), "description": view.string(descriptions.get(c, 0)) or "",
+                      "budget": from_cents(b), "actual": from_cents(a), "variance": from_cents(b - a)})
+    return items
+
+
+def budget_items(acct5: str | None = None, description: str | None = None, manager: str | None = None,
+                 fiscal_year: int | None = None) -> list[dict]:
+    view = get()
+    budget = view.tables["budget_items"]
+    descriptions = _account_descriptions(view)
+    return [{"account": view.key(c), "description": view.string(descriptions.get(c, 0)) or "",
+             "budget": from_cents(_total(budget, c, fiscal_year))}
+            for c in account_codes(view, acct5, description, manager)]
+
+
+def actual_items(acct5: str | None = None, description: str | None = None, manager: str | None = None,
+                 vendor: str | None = None, fiscal_year: int | None = None) -> list[dict]:
+    view = get()
+    actual = view.tables["actual_items"]
+    cols = actual.columns
+    codes = account_codes(view, acct5, description, manager)
+    rows = actual.in_year(actual.rows_for(codes), fiscal_year)
+    if vendor:
+        rows = rows[view.text.matching(cols["vendor"][rows], vendor)]
+    text_values = view.text.values
+    items = [{"account": view.key(a), "amount": from_cents(cents), "description": text_values[d],
+              "tr_date": text_values[t], "vendor_name": text_values[v], "vouchno": text_values[n]}
+             for a, cents, d, t, v, n in zip(cols["acct"][rows].tolist(), cols["cents"][rows].tolist(),
+                                             cols["description"][rows].tolist(), cols["tr_date"][rows].tolist(),
+                                             cols["vendor"][rows].tolist(), cols["vouchno"][rows].tolist())]
+    items.sort(key=lambda r: (r["account"], r["tr_date"] or "", r["vouchno"] or ""))
+    return items
+
+
+def _selected(view: View, table: Table, acct5: str | None, manager: str | None,
+              fiscal_year: int | None) -> np.ndarray:
+    if acct5:
+        code = view.keys.lookup(acct5)
+        rows = table.rows_for([code]) if code else np.empty(0, dtype=np.int32)
+    elif manager:
+        rows = table.rows_for(_managed(view, manager).tolist())
+    else:
+        rows = np.arange(len(table), dtype=np.int32)
+    return table.in_year(rows, fiscal_year)
+
+
+def _grouped(view: View, table: Table, rows: np.ndarray, keep: np.ndarray) -> dict[tuple, tuple]:
+    """(acct code, line code) -> (kept cents, kept rows, description of the last kept row, of the last row).
+
+    Descriptions are text codes, None where no row was kept; "last" is by rowid, as in the SQL engine."""
+    cols = table.columns
+    width = len(view.text.values)
+    pair = cols["acct"][rows].astype(np.int64) * width + cols["line"][rows]
+    rowid = table.rowid[rows]
+    # order by (pair, rowid) so the last row of each pair is the newest
+    order = np.lexsort((rowid, pair))
+    pair, rowid, rows, keep = pair[order], rowid[order], rows[order], keep[order]
+    starts = np.flatnonzero(np.r_[True, pair[1:] != pair[:-1]]) if len(pair) else np.empty(0, dtype=np.int64)
+    ends = np.r_[starts[1:], len(pair)].astype(np.int64)
+    cents = np.where(keep, cols["cents"][rows], 0)
+    sums = np.add.reduceat(cents, starts) if len(pair) else np.empty(0, dtype=np.int64)
+    kept = np.add.reduceat(keep.astype(np.int64), starts) if len(pair) else np.empty(0, dtype=np.int64)
+    # last kept row per pair: the highest position among kept rows
+    position = np.where(keep, np.arange(len(pair)), -1)
+    last_kept = np.maximum.reduceat(position, starts) if len(pair) else np.empty(0, dtype=np.int64)
+    desc = cols["description"][rows]
+    out = {}
+    for s, e, total, k, lk in zip(starts.tolist(), ends.tolist(), sums.tolist(), kept.tolist(), last_kept.tolist()):
+        p = int(pair[s])
+        out[(p // width, p % width)] = (total, k, int(desc[lk]) if lk >= 0 else None, int(desc[e - 1]))
+    return out
+
+
+def line_items(acct5: str | None = None, description: str | None = None, manager: str | None = None,
+               fiscal_year: int | None = None) -> list[dict]:
+    """Same rows as misc.line_report's engines, from the snapshot."""
+    view = get()
+    budget, actual = view.tables["budget_items"], view.tables["actual_items"]
+    b_rows = _selected(view, budget, acct5, manager, fiscal_year)
+    a_rows = _selected(view, actual, acct5, manager, fiscal_year)
+    b = _grouped(view, budget, b_rows, _like(view.text, budget.columns["description"][b_rows], description))
+    a = _grouped(view, actual, a_rows, _like(view.text, actual.columns["description"][a_rows], description))
+    items = []
+    for key in b.keys() | a.keys():
+        b_cents, b_kept, _, b_desc = b.get(key, (0, 0, None, None))
+        a_cents, a_kept, a_desc, _ = a.get(key, (0, 0, None, None))
+        if not b_kept and not a_kept:
+            continue
+        items.append({
+            "acct5": view.key(key[0]), "line": view.string(key[1]),
+            "budget": from_cents(b_cents),
+            "actual": from_cents(a_cents),
+            "variance": from_cents(b_cents - a_cents),
+            "budget_desc": view.string(b_desc) if b_desc is not None else None,
+            "actual_desc": view.string(a_desc) if a_desc is not None else None,
+        })
+    items.sort(key=lambda r: (r["acct5"], r["line"]))
+    return items
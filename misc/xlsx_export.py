@@ -0,0 +1,105 @@
+"""
+XLSX export of the account summary and per-account line detail.
+
+Workbooks are written with openpyxl's write-only mode, so rows go straight to
+the zip stream instead of being held as a cell grid.  Generation runs in a
+worker process (XLSX_WORKERS, default 1) so a large export does not hold the
+GIL or a threadpool slot while other requests are being served.
+"""
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from db import engine
+from misc import exports
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# sheet key -> (sheet title, row producer, columns, column widths)
+SHEETS = {
+    "summary": ("Summary", exports.summary_rows, exports.SUMMARY_FIELDS, [22, 40, 14, 14, 14]),
+    "line-items": ("Lines", exports.line_report_rows, exports.LINE_REPORT_FIELDS, [22, 6, 14, 14, 14, 40, 40]),
+}
+WORKBOOKS = {
+    "summary": ["summary"],
+    "line-items": ["line-items"],
+    "report": ["summary", "line-items"],
+}
+MONEY_COLUMNS = {"budget", "actual", "variance", "amount"}
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _init_worker():
+    # a forked worker inherits the parent's pooled SQLite connections; open its own instead
+    engine.dispose(close=False)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=int(os.getenv("XLSX_WORKERS", "1")), initializer=_init_worker)
+    return _pool
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def write_sheet(wb: Workbook, title: str, rows: Iterable[dict], fields: list[str], widths: list[int]) -> int:
+    ws = wb.create_sheet(title=title)
+    for i, width in enumerate(widths):
+        ws.column_dimensions[chr(ord("A") + i)].width = width
+    ws.freeze_panes = "A2"
+    bold = Font(bold=True)
+    header = []
+    for name in fields:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = bold
+        header.append(cell)
+    ws.append(header)
+    money = [i for i, name in enumerate(fields) if name in MONEY_COLUMNS]
+    count = 0
+    for row in rows:
+        values = [row.get(name) for name in fields]
+        for i in money:
+            if values[i] is not None:
+                values[i] = round(values[i], 2)
+        ws.append(values)
+        count += 1
+    return count
+
+
+def build_workbook(kind: str, path: str, acct5: str | None = None, manager: str | None = None,
+                   fiscal_year: int | None = None) -> int:
+    """Write the workbook for `kind` to `path`; returns the number of data rows.  Runs in the worker process."""
+    wb = Workbook(write_only=True)
+    count = 0
+    for sheet in WORKBOOKS[kind]:
+        title, producer, fields, widths = SHEETS[sheet]
+        count += write_sheet(wb, title, producer(acct5=acct5, manager=manager, fiscal_year=fiscal_year), fields, widths)
+    wb.save(path)
+    return count
+
+
+async def render(kind: str, acct5: str | None = None, manager: str | None = None,
+                 fiscal_year: int | None = None) -> str:
+    """Build the workbook in the worker pool and return the temp file path; the caller removes it."""
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(get_pool(), build_workbook, kind, path, acct5, manager, fiscal_year)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
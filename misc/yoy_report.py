@@ -0,0 +1,124 @@
+"""
+Year-over-year report (/api/yoy-items): per account, or per (account, line),
+the fiscal year's budget and actual to date next to the prior year's actual
+to the same fiscal day, with the change.
+
+    fiscal_year  the year reported (default: the current one)
+    as_of        last day counted (default: today, or the year's last day for a past year)
+    acct5        exact account key
+    manager      accounts assigned to the manager in acct_mgrs
+    lines        group by (account, line) instead of by account
+
+"The same fiscal day" is the same number of days into the fiscal year, so the
+two periods have the same length.  Undated actuals count towards their year's
+actual to date.
+
+The budget lines and both years' actuals are projected into one shape
+(acct5, line, budget, actual, prior) and summed in a single GROUP BY over
+their UNION ALL; the actual scans read the covering (fiscal_year, acct5,
+tr_date, line, amount_cents) index, seeking to the account when filtered.
+A year that has been archived (misc/archive.py) is read from its file in a
+statement of its own and merged.
+"""
+import datetime
+
+from sqlalchemy import select, func, union_all, literal, and_, or_
+from sqlalchemy.orm import Session
+
+import models
+from misc import archive
+from utils import fiscal
+from utils.money import from_cents
+
+
+def cutoffs(fiscal_year: int, as_of: datetime.date | None = None) -> tuple[str, str]:
+    """Exclusive tr_date bounds for the year to date and the prior year to the same fiscal day."""
+    start, end = (datetime.date.fromisoformat(d) for d in fiscal.bounds(fiscal_year))
+    if as_of is None:
+        as_of = min(datetime.date.today(), end - datetime.timedelta(days=1))
+    cut = min(max(as_of + datetime.timedelta(days=1), start), end)
+    prior_start, prior_end = (datetime.date.fromisoformat(d) for d in fiscal.bounds(fiscal_year - 1))
+    # a whole year is compared with the whole prior year, whatever their lengths
+    prior_cut = prior_end if cut == end else min(prior_start + (cut - start), prior_end)
+    return cut.isoformat(), prior_cut.isoformat()
+
+
+def _keys(t, acct5: str | None, manager: str | None) -> list:
+    conds = []
+    if acct5:
+        conds.append(t.c.acct5 == acct5)
+    if manager:
+        conds.append(t.c.acct5.in_(select(models.AcctMgr.key).where(models.AcctMgr.manager_id == manager)))
+    return conds
+
+
+def _budget(year: int, acct5, manager):
+    t = models.BudgetItem.__table__
+    return (select(t.c.acct5, t.c.line, t.c.amount_cents.label("budget"),
+                   literal(0).label("actual"), literal(0).label("prior"))
+            .where(t.c.fiscal_year == year, *_keys(t, acct5, manager)))
+
+
+def _actual(year: int, cut: str, column: str, acct5, manager, undated: bool):
+    t = models.ActualItem.__table__
+    in_period = t.c.tr_date < cut
+    if undated:
+        in_period = or_(in_period, t.c.tr_date.is_(None))
+    cents = t.c.amount_cents
+    return (select(t.c.acct5, t.c.line, literal(0).label("budget"),
+                   (cents if column == "actual" else literal(0)).label("actual"),
+                   (cents if column == "prior" else literal(0)).label("prior"))
+            .where(and_(t.c.fiscal_year == year, in_period), *_keys(t, acct5, manager)))
+
+
+def _grouped(db: Session, parts: list, lines: bool) -> dict[tuple, list[int]]:
+    u = union_all(*parts).subquery("u")
+    keys = [u.c.acct5, u.c.line] if lines else [u.c.acct5]
+    stmt = (select(*keys, func.sum(u.c.budget), func.sum(u.c.actual), func.sum(u.c.prior))
+            .group_by(*keys))
+    width = len(keys)
+    return {tuple(row[:width]): list(row[width:]) for row in db.execute(stmt)}
+
+
+def yoy_items(db: Session, fiscal_year: int | None = None, as_of: datetime.date | None = None,
+              acct5: str | None = None, manager: str | None = None, lines: bool = False) -> list[dict]:
+    """`db` is a live-database session; archived years are read from their files."""
+    fy = fiscal_year or fiscal.current_fiscal_year()
+    cut, prior_cut = cutoffs(fy, as_of)
+    # undated actuals belong to the current fiscal year; they only count there
+    undated = fy == fiscal.current_fiscal_year()
+    by_source: dict[int | None, list] = {}
+    for year, parts in ((fy, [_budget(fy, acct5, manager), _actual(fy, cut, "actual", acct5, manager, undated)]),
+                        (fy - 1, [_actual(fy - 1, prior_cut, "prior", acct5, manager, False)])):
+        by_source.setdefault(year if archive.is_archived(year) else None, []).extend(parts)
+
+    totals: dict[tuple, list[int]] = {}
+    for source, parts in by_source.items():
+        session = db if source is None else archive.open_session(source)
+        try:
+            for key, sums in _grouped(session, parts, lines).items():
+                into = totals.setdefault(key, [0, 0, 0])
+                for i, v in enumerate(sums):
+                    into[i] += v or 0
+        finally:
+            if session is not db:
+                session.close()
+
+    descriptions = dict(db.execute(select(models.Account.key, models.Account.description)).all())
+    items = []
+    for key in sorted(totals):
+        budget, actual, prior = totals[key]
+        row = {"account": key[0]}
+        if lines:
+            row["line"] = key[1]
+        row.update({
+            "description": descriptions.get(key[0]) or "",
+            "budget": from_cents(budget),
+            "actual": from_cents(actual),
+            "variance": from_cents(budget - actual),
+            "prior_actual": from_cents(prior),
+            "change": from_cents(actual - prior),
+            "change_pct": round((actual - prior) * 100 / prior, 1) if prior else None,
+        })
+        items.append(row)
+    return items
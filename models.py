@@ -1,6 +1,28 @@
-from sqlalchemy import Column, String, ForeignKey, Float, UniqueConstraint
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, ForeignKey, Float, Integer, Text, UniqueConstraint, Index, text
+from sqlalchemy.orm import relationship, validates
+from sqlalchemy.ext.hybrid import hybrid_property
 from db import Base
+from utils.money import to_cents, from_cents
+from utils import fiscal, gl
+
+
+class MoneyAmount:
+    """`amount` in dollars over an integer-cents column, for Python code and SQL expressions alike."""
+    amount_cents = Column(Integer, nullable=False, default=0)  # money as integer cents
+
+    @hybrid_property
+    def amount(self) -> float | None:
+        return from_cents(self.amount_cents)
+
+    @amount.inplace.setter
+    def _amount_setter(self, value):
+        self.amount_cents = to_cents(value)
+
+    @amount.inplace.expression
+    @classmethod
+    def _amount_expression(cls):
+        return (cls.amount_cents / 100.0).label("amount")
+
 
 class Manager(Base):
     __tablename__ = "managers"
@@ -15,6 +37,27 @@ class Account(Base):
     key = Column(String, unique=True, nullable=False, index=True)  # '52100-03-31-01-01'
     description = Column(String, nullable=False)
     # manager_id = Column(String, ForeignKey("managers.id"), nullable=True)
+    # utils.gl segments of key, '52100', '03', ...; set from the key
+    seg1 = Column(String, default=gl.column_default(1))
+    seg2 = Column(String, default=gl.column_default(2))
+    seg3 = Column(String, default=gl.column_default(3))
+    seg4 = Column(String, default=gl.column_default(4))
+    seg5 = Column(String, default=gl.column_default(5))
+    # segment descriptions from the GL listing (seg01..seg05 in sql/01-gl-listing.sql)
+    seg1_desc = Column(String)
+    seg2_desc = Column(String)
+    seg3_desc = Column(String)
+    seg4_desc = Column(String)
+    seg5_desc = Column(String)
+    __table_args__ = (Index('ix_accounts_seg1', 'seg1'), Index('ix_accounts_seg2', 'seg2'),
+                      Index('ix_accounts_seg3', 'seg3'), Index('ix_accounts_seg4', 'seg4'),
+                      Index('ix_accounts_seg5', 'seg5'))
+
+    @validates('key')
+    def _set_segments(self, key, value):
+        for i, code in enumerate(gl.segments(value), 1):
+            setattr(self, f'seg{i}', code)
+        return value
 
 class AcctMgr(Base):
     __tablename__ = "acct_mgrs"
@@ -22,28 +65,124 @@ class AcctMgr(Base):
     # make this a foreign key to accounts.key
     key = Column(String, nullable=False)  # '52100-03-31-01-01' GL account key
     manager_id = Column(String, ForeignKey("managers.id"), nullable=False)
+    #
+    __table_args__ = (UniqueConstraint('key', 'manager_id', name='uq_acct_mgrs_key_manager'),
+                      Index('ix_acct_mgrs_manager_key', 'manager_id', 'key'))
 
-class BudgetItem(Base):
+class BudgetItem(MoneyAmount, Base):
     __tablename__ = "budget_items"
     id = Column(String, primary_key=True, index=True)
     acct5 = Column(String, nullable=False)  # references Account.key
     line = Column(String, nullable=False)   # '01'..'99'
     description = Column(String, nullable=False)
-    amount = Column(Float, nullable=False, default=0.0)
     datefrom = Column(String, nullable=True)  # e.g. '2023-01-01'
     dateto = Column(String, nullable=True)    # e.g. '2023-12-31'
+    # utils.fiscal year of datefrom; the current one for lines without dates
+    fiscal_year = Column(Integer, nullable=False, default=fiscal.column_default('datefrom'))
     #
-    __table_args__ = (UniqueConstraint('acct5', 'line', 'datefrom', name='uq_budget_acct5_line_from'),)
+    __table_args__ = (UniqueConstraint('acct5', 'line', 'datefrom', name='uq_budget_acct5_line_from'),
+                      Index('ix_budget_items_fy_acct5_line', 'fiscal_year', 'acct5', 'line'))
 
-class ActualItem(Base):
+    @validates('datefrom')
+    def _set_fiscal_year(self, key, value):
+        self.fiscal_year = fiscal.fiscal_year(value)
+        return value
+
+class ActualItem(MoneyAmount, Base):
     __tablename__ = "actual_items"
     id = Column(String, primary_key=True, index=True)
     acct5 = Column(String, nullable=False)  # references Account.key
     line = Column(String, nullable=False)   # '01'..'99'
     tr_date = Column(String, nullable=True)  # transaction date, e.g. '2023-03-15'
     description = Column(String, nullable=False)
-    amount = Column(Float, nullable=False, default=0.0)
     seq = Column(Float, nullable=True)  # sequence number, increments by 5
     vendor_name = Column(String, nullable=True)
     vouchno = Column(String, nullable=True)
+    row_hash = Column(String, nullable=True)  # utils.fingerprint.actual_row_hash; NULL for manual entries
+    # utils.fiscal year of tr_date; the current one for undated entries
+    fiscal_year = Column(Integer, nullable=False, default=fiscal.column_default('tr_date'))
     #__table_args__ = (UniqueConstraint('acct5', 'line', name='uq_actual_acct5_line'),)
+    __table_args__ = (Index('ix_actual_items_acct5_line', 'acct5', 'line'),
+                      Index('ix_actual_items_acct5_amount', 'acct5', 'amount_cents'),
+                      Index('ux_actual_items_row_hash', 'row_hash', unique=True),
+                      Index('ix_actual_items_fy_acct5_line', 'fiscal_year', 'acct5', 'line'),
+                      # covers the year-to-date scans of misc/yoy_report.py
+                      Index('ix_actual_items_fy_acct5_date', 'fiscal_year', 'acct5', 'tr_date', 'line', 'amount_cents'))
+
+    @validates('tr_date')
+    def _set_fiscal_year(self, key, value):
+        self.fiscal_year = fiscal.fiscal_year(value)
+        return value
+
+class LineCounter(Base):
+    # last line number handed out per account; budget_items and actual_items count separately
+    __tablename__ = "line_counters"
+    kind = Column(String, primary_key=True)   # table name: 'budget_items' or 'actual_items'
+    acct5 = Column(String, primary_key=True)
+    last_line = Column(Integer, nullable=False, default=0)
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(String, primary_key=True, index=True)
+    kind = Column(String, nullable=False)            # 'erp:actuals', 'erp:budget', 'erp:accounts'
+    status = Column(String, nullable=False, default='queued')  # queued, running, succeeded, failed, cancelled
+    phase = Column(String, nullable=True)            # e.g. 'fetching', 'writing'
+    rows_total = Column(Integer, nullable=True)
+    rows_fetched = Column(Integer, nullable=False, default=0)
+    rows_written = Column(Integer, nullable=False, default=0)
+    cancel_requested = Column(Integer, nullable=False, default=0)
+    result = Column(Text, nullable=True)             # JSON summary when finished
+    error = Column(Text, nullable=True)
+    worker = Column(String, nullable=True)           # 'host:pid' of the process running it
+    created_at = Column(Float, nullable=False)       # epoch seconds
+    started_at = Column(Float, nullable=True)
+    phase_started_at = Column(Float, nullable=True)
+    finished_at = Column(Float, nullable=True)
+    #
+    # at most one queued/running job per kind, enforced by the database
+    __table_args__ = (Index('ux_jobs_active_kind', 'kind', unique=True,
+                            sqlite_where=text("status IN ('queued', 'running')")),)
+
+class Schedule(Base):
+    __tablename__ = "schedules"
+    name = Column(String, primary_key=True)          # 'accounts', 'budget', 'actuals'
+    schedule = Column(String, nullable=False)        # cron expression or 'every 30m'
+    next_run_at = Column(Float, nullable=False)      # epoch seconds; claimed with compare-and-set
+    last_started_at = Column(Float, nullable=True)
+    last_finished_at = Column(Float, nullable=True)
+    last_status = Column(String, nullable=True)      # running, succeeded, failed, cancelled, skipped
+    last_duration = Column(Float, nullable=True)
+    last_rows = Column(Integer, nullable=True)
+    last_error = Column(Text, nullable=True)
+    last_job_id = Column(String, nullable=True)
+    last_worker = Column(String, nullable=True)
+    runs = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+
+class Sequence(Base):
+    # next unallocated value of each sequence (see utils/sequences.py)
+    __tablename__ = "sequences"
+    name = Column(String, primary_key=True)    # e.g. 'actual_items.seq'
+    next_value = Column(Float, nullable=False)
+
+class LedgerChange(Base):
+    # rows updated or deleted in the ledger tables, written by triggers (see misc/snapshot.py)
+    __tablename__ = "ledger_changes"
+    id = Column(Integer, primary_key=True)     # AUTOINCREMENT: ids are never reused
+    tbl = Column(String, nullable=False)       # 'accounts', 'acct_mgrs', 'budget_items', 'actual_items'
+    row_id = Column(Integer, nullable=False)   # rowid of the changed row
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class ArchivedYear(Base):
+    # fiscal years moved to their archive files (see misc/archive.py); triggers reject ledger writes to them
+    __tablename__ = "archived_years"
+    fiscal_year = Column(Integer, primary_key=True)
+
+class ActualMonthly(Base):
+    # actual_items summed per fiscal year, account and fiscal month, kept current by triggers (see app.py)
+    __tablename__ = "actual_monthly"
+    fiscal_year = Column(Integer, primary_key=True)
+    acct5 = Column(String, primary_key=True)
+    month = Column(Integer, primary_key=True)    # utils.fiscal month 1..12; 0 for undated actuals
+    amount_cents = Column(Integer, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
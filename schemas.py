@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Optional, Literal
 
 class ManagerBase(BaseModel):
     name: str = Field(..., min_length=1)
@@ -24,6 +24,12 @@ class AccountCreate(AccountBase):
 
 class Account(AccountBase):
     id: str
+    # utils.gl segments of the key; read-only, set from the key
+    seg1: Optional[str] = None
+    seg2: Optional[str] = None
+    seg3: Optional[str] = None
+    seg4: Optional[str] = None
+    seg5: Optional[str] = None
     class Config:
         from_attributes = True
 
@@ -45,7 +51,36 @@ class LineItem(LineItemBase):
     class Config:
         from_attributes = True
 
+class BudgetLineCreate(BaseModel):
+    acct5: str
+    description: str
+    amount: float = 0.0
+    line: Optional[str] = None
+
+class BatchOperation(BaseModel):
+    """One write of POST /api/batch (misc/batch.py)."""
+    op: Literal["create", "update", "delete"]
+    kind: Literal["budget", "actual"]
+    # update/delete address a line by id, or by (acct5, line) in the current fiscal year
+    # (an error when that matches several actual lines)
+    id: Optional[str] = None
+    acct5: Optional[str] = None
+    line: Optional[str] = None
+    description: Optional[str] = None
+    amount: Optional[float] = None
+    tr_date: Optional[str] = None
+    vendor_name: Optional[str] = None
+    vouchno: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation] = Field(..., min_length=1, max_length=1000)
+
 class AcctMgrCreate(BaseModel):
     id: str
     key: str
     manager_id: str
+
+class BulkAssign(BaseModel):
+    account_ids: list[str] = Field(..., min_length=1)
+    manager_id: str
+    mode: Literal["add", "remove", "toggle"] = "toggle"
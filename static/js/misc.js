@@ -117,3 +117,63 @@ document.addEventListener('DOMContentLoaded', function() {
 
 });
 
+
+// background jobs (imports): poll /api/jobs/{id} until the job finishes.
+// onUpdate(job) is called on every poll; resolves with the final job.
+function pollJob(jobId, onUpdate, intervalMs) {
+    intervalMs = intervalMs || 1000;
+    return new Promise(function (resolve, reject) {
+        function tick() {
+            fetch('/api/jobs/' + encodeURIComponent(jobId))
+                .then(function (resp) {
+                    if (!resp.ok) throw new Error('HTTP ' + resp.status);
+                    return resp.json();
+                })
+                .then(function (job) {
+                    if (onUpdate) onUpdate(job);
+                    if (job.status === 'queued' || job.status === 'running') {
+                        setTimeout(tick, intervalMs);
+                    } else {
+                        resolve(job);
+                    }
+                })
+                .catch(reject);
+        }
+        tick();
+    });
+}
+
+function cancelJob(jobId) {
+    return fetch('/api/jobs/' + encodeURIComponent(jobId) + '/cancel', {method: 'POST'});
+}
+
+// short progress text for a job, e.g. "writing 12000 / 48000 (about 9s left)"
+function describeJob(job) {
+    let text = job.phase || job.status;
+    if (job.phase === 'writing' && job.rows_total) {
+        text += ' ' + job.rows_written + ' / ' + job.rows_total;
+    } else if (job.rows_fetched) {
+        text += ' (' + job.rows_fetched + ' rows fetched)';
+    }
+    if (job.eta_seconds != null) text += ' (about ' + Math.ceil(job.eta_seconds) + 's left)';
+    return text;
+}
+
+// apply create/update/delete operations on budget and actual lines in one
+// transaction (POST /api/batch); resolves to {ok, results}, one result per operation
+function postBatch(operations) {
+    return fetch('/api/batch', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({operations: operations})
+    }).then(function (resp) {
+        if (resp.status !== 200 && resp.status !== 409) throw new Error('HTTP ' + resp.status);
+        return resp.json();
+    });
+}
+
+// first error message of a batch response, e.g. "budget line 52100-03-31-01-01 07 not found"
+function batchError(data) {
+    let failed = (data.results || []).filter(function (r) { return r.status === 'error'; });
+    return failed.length ? failed[0].error : 'not applied';
+}
@@ -0,0 +1,23 @@
+"""
+Content fingerprints for imported actuals.
+
+actual_items.row_hash holds a hash of the fields that identify a ledger line in
+the source system; the column is uniquely indexed, so an import inserts with
+ON CONFLICT DO NOTHING and a row that is already present is skipped in one
+index probe.  The line number and seq are assigned locally and are not part of
+the fingerprint.  Manually entered rows have no fingerprint (NULL); rows
+imported before the column existed get theirs from the dedupe:actuals job.
+"""
+import hashlib
+
+ACTUAL_HASH_FIELDS = ("acct5", "vouchno", "tr_date", "amount_cents", "description", "vendor_name")
+
+
+def _text(value) -> str:
+    return "" if value is None else str(value).strip()
+
+
+def actual_row_hash(values: dict) -> str:
+    """Fingerprint of an actual_items row given as a column dict (amount in amount_cents)."""
+    key = "\x1f".join(_text(values.get(f)) for f in ACTUAL_HASH_FIELDS)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
@@ -0,0 +1,82 @@
+"""
+Fiscal years.  A fiscal year runs from the first of FISCAL_YEAR_START_MONTH
+(default 3, March, as in sql/02-actual-items.sql) to the day before the same
+date a year later, and is numbered by the calendar year it starts in:
+fiscal year 2025 is 2025-03-01 .. 2026-02-28.  Fiscal months are numbered
+1..12 from the first month of the year.
+
+A value is dated when it starts with YYYY-MM (month 01-12), as ISO dates do;
+only that year and month are read, so '2025-04' and '2025-04-31' are April
+2025.  Anything else is undated.  fiscal_year() and the SQL expressions apply
+this same rule, so a row's stored fiscal_year and its month in actual_monthly
+always agree.
+"""
+import datetime
+import os
+import re
+
+FISCAL_YEAR_START_MONTH = int(os.getenv("FISCAL_YEAR_START_MONTH", "3"))
+if not 1 <= FISCAL_YEAR_START_MONTH <= 12:
+    raise ValueError(f"FISCAL_YEAR_START_MONTH must be 1-12: {FISCAL_YEAR_START_MONTH}")
+
+
+_DATED = re.compile(r"[0-9]{4}-(0[1-9]|1[0-2])")
+
+
+def _year_month(value) -> tuple[int, int] | None:
+    if isinstance(value, datetime.date):
+        return value.year, value.month
+    if value is None:
+        return None
+    text = str(value)
+    if not _DATED.match(text):
+        return None
+    return int(text[:4]), int(text[5:7])
+
+
+def fiscal_year(value=None) -> int:
+    """Fiscal year of a date or ISO date string; today's when it is missing or undated."""
+    year, month = _year_month(value) or _year_month(datetime.date.today())
+    return year if month >= FISCAL_YEAR_START_MONTH else year - 1
+
+
+def current_fiscal_year() -> int:
+    return fiscal_year()
+
+
+def bounds(year: int) -> tuple[str, str]:
+    """First day of the fiscal year and first day of the next one, as ISO strings."""
+    return (datetime.date(year, FISCAL_YEAR_START_MONTH, 1).isoformat(),
+            datetime.date(year + 1, FISCAL_YEAR_START_MONTH, 1).isoformat())
+
+
+def month_start(year: int, month: int) -> datetime.date:
+    """First day of fiscal month `month` (1..12) of fiscal year `year`."""
+    m = FISCAL_YEAR_START_MONTH + month - 1
+    return datetime.date(year + (m - 1) // 12, (m - 1) % 12 + 1, 1)
+
+
+def _sql_dated(column: str) -> str:
+    return f"{column} GLOB '[0-9][0-9][0-9][0-9]-[01][0-9]*' AND substr({column}, 6, 2) BETWEEN '01' AND '12'"
+
+
+def sql_expression(column: str, default: int) -> str:
+    """SQLite expression for the fiscal year of an ISO date column; `default` where the column holds no date."""
+    return (f"CASE WHEN {_sql_dated(column)} "
+            f"THEN CAST(substr({column}, 1, 4) AS INTEGER) "
+            f"- (CAST(substr({column}, 6, 2) AS INTEGER) < {FISCAL_YEAR_START_MONTH}) "
+            f"ELSE {int(default)} END")
+
+
+def sql_month_expression(column: str) -> str:
+    """SQLite expression for the fiscal month (1..12) of an ISO date column; 0 where it holds no date."""
+    return (f"CASE WHEN {_sql_dated(column)} "
+            f"THEN (CAST(substr({column}, 6, 2) AS INTEGER) + {12 - FISCAL_YEAR_START_MONTH}) % 12 + 1 "
+            f"ELSE 0 END")
+
+
+def column_default(date_column: str):
+    """Column default for Core inserts that leave fiscal_year out: derived from the row's `date_column`."""
+    def default(context):
+        return fiscal_year(context.get_current_parameters().get(date_column))
+    return default
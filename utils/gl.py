@@ -0,0 +1,28 @@
+"""
+GL account keys.  A key like '52100-03-31-01-01' is five dash-separated
+segments, the fund first and the department second; sql/01-gl-listing.sql
+returns the description of each as seg01..seg05.
+
+Account stores the segments of its key as seg1..seg5 (and their descriptions
+as seg1_desc..seg5_desc), so reports can filter and group accounts by any
+segment through an index rather than by parsing keys.
+"""
+SEGMENTS = 5
+
+
+def segments(key: str | None) -> list[str | None]:
+    """The SEGMENTS segments of a key, None for the ones it lacks."""
+    parts = [p.strip() or None for p in (key or "").split("-")][:SEGMENTS]
+    return parts + [None] * (SEGMENTS - len(parts))
+
+
+def prefix(codes: list[str]) -> str:
+    """Key prefix of the leading segments `codes`, e.g. ['52100', '03'] -> '52100-03'."""
+    return "-".join(codes)
+
+
+def column_default(segment: int):
+    """Column default for Core inserts that leave segment `segment` (1-based) out: taken from the key."""
+    def default(context):
+        return segments(context.get_current_parameters().get("key"))[segment - 1]
+    return default
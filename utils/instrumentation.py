@@ -0,0 +1,95 @@
+"""
+Per-request database instrumentation.
+
+RequestStats collects the number of SQLite statements and SQL Server (pyodbc)
+calls made while serving one request, and the time spent in each.  The stats
+object lives in a context variable set by QueryTimingMiddleware; threadpool
+endpoints inherit a copy of the context, so they update the same object.
+
+SQLite statements are counted through the engine's before/after_cursor_execute
+events, with handle_error cleaning up after a statement that failed (all
+registered in db.py); pyodbc calls are wrapped with `source_timer()`.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from utils import metrics
+
+
+class RequestStats:
+    __slots__ = ("started", "queries", "db_time", "source_queries", "source_time")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.source_queries = 0
+        self.source_time = 0.0
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """Value for the Server-Timing response header (durations in ms)."""
+        return ", ".join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'mssql;dur={self.source_time * 1000:.1f};desc="{self.source_queries} queries"',
+            f"total;dur={self.elapsed() * 1000:.1f}",
+        ])
+
+
+_current: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar("request_stats", default=None)
+
+
+def begin_request() -> tuple[RequestStats, contextvars.Token]:
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def current() -> RequestStats | None:
+    return _current.get()
+
+
+# ---- SQLAlchemy engine events ----
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    metrics.db_queries.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+
+def handle_error(exception_context):
+    # a failed statement gets no after_cursor_execute; drop its start time so the next
+    # statement on this connection doesn't pop it
+    conn = exception_context.connection
+    if conn is not None and exception_context.statement is not None and conn.info.get("query_start"):
+        conn.info["query_start"].pop()
+
+
+# ---- SQL Server (pyodbc) calls ----
+
+@contextmanager
+def source_timer():
+    """Time a pyodbc execute + fetch against the current request's stats."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.source_queries.observe(elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.source_queries += 1
+            stats.source_time += elapsed
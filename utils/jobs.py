@@ -0,0 +1,264 @@
+"""
+Background jobs for long-running imports.
+
+`start(kind, fn)` records a job in the `jobs` table and runs `fn(job, db)` on a
+worker thread, returning immediately.  The partial unique index on jobs.kind
+allows only one queued/running job per kind, so a second request (a page
+refresh, another browser, another worker process) gets the job that is already
+running instead of starting a concurrent import.
+
+The job function reports progress through the JobContext it is given:
+
+    job.set_phase("writing", total=len(rows))
+    job.progress(written=n)       # also raises JobCancelled once cancel is requested
+
+Live counters are kept in memory and merged into `get()`; the table is updated
+at phase changes and when the job finishes, because an import holds the SQLite
+write lock while it writes.  Cancellation is cooperative: the job stops at its
+next progress() call and the import rolls back its transaction.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+import models
+from db import SessionLocal
+
+logger = logging.getLogger("budget.jobs")
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+ACTIVE = ("queued", "running")
+WORKER = f"{socket.gethostname()}:{os.getpid()}"
+# how often a running job re-reads cancel_requested, for cancels made through another worker process
+CANCEL_POLL_SECONDS = 1.0
+
+_executor: ThreadPoolExecutor | None = None
+_live: dict[str, "JobContext"] = {}
+_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """Handed to the job function; tracks phase, counters and cancellation."""
+
+    def __init__(self, job_id: str, kind: str):
+        self.id = job_id
+        self.kind = kind
+        self.phase = "queued"
+        self.rows_total = None
+        self.rows_fetched = 0
+        self.rows_written = 0
+        self.phase_started_at = time.time()
+        self.cancelled = threading.Event()
+        self._polled = time.monotonic()
+
+    def set_phase(self, phase: str, total: int | None = None):
+        self.check_cancelled()
+        self.phase = phase
+        self.rows_total = total
+        self.phase_started_at = time.time()
+        _save(self.id, phase=phase, rows_total=total, phase_started_at=self.phase_started_at,
+              rows_fetched=self.rows_fetched, rows_written=self.rows_written)
+
+    def progress(self, fetched: int | None = None, written: int | None = None):
+        if fetched is not None:
+            self.rows_fetched = fetched
+        if written is not None:
+            self.rows_written = written
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if not self.cancelled.is_set() and time.monotonic() - self._polled >= CANCEL_POLL_SECONDS:
+            self._polled = time.monotonic()
+            db = SessionLocal()
+            try:
+                if db.execute(select(models.Job.cancel_requested).where(models.Job.id == self.id)).scalar():
+                    self.cancelled.set()
+            finally:
+                db.close()
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+
+def _save(job_id: str, **values):
+    db = SessionLocal()
+    try:
+        db.execute(update(models.Job).where(models.Job.id == job_id).values(**values))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning("job %s: could not save state: %s", job_id, e)
+    finally:
+        db.close()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+    return _executor
+
+
+def _run(ctx: JobContext, fn):
+    now = time.time()
+    _save(ctx.id, status="running", started_at=now, phase="starting", phase_started_at=now)
+    db = SessionLocal()
+    try:
+        result = fn(ctx, db)
+        db.commit()
+        final = {"status": "succeeded", "result": json.dumps(result)}
+    except JobCancelled:
+        db.rollback()
+        final = {"status": "cancelled"}
+    except Exception as e:
+        db.rollback()
+        logger.exception("job %s (%s) failed", ctx.id, ctx.kind)
+        final = {"status": "failed", "error": str(e)}
+    finally:
+        db.close()
+    _save(ctx.id, phase="done", rows_total=ctx.rows_total, rows_fetched=ctx.rows_fetched,
+          rows_written=ctx.rows_written, finished_at=time.time(), **final)
+    with _lock:
+        _live.pop(ctx.id, None)
+
+
+def start(kind: str, fn) -> tuple[dict, bool]:
+    """Queue fn(job, db) as a `kind` job. Returns (job, started); started is False if one was already active."""
+    db = SessionLocal()
+    try:
+        job_id = uuid.uuid4().hex
+        db.add(models.Job(id=job_id, kind=kind, status="queued", phase="queued", worker=WORKER,
+                          created_at=time.time()))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            existing = db.execute(select(models.Job.id).where(models.Job.kind == kind,
+                                                              models.Job.status.in_(ACTIVE))).scalar()
+            return get(existing), False
+    finally:
+        db.close()
+    ctx = JobContext(job_id, kind)
+    with _lock:
+        _live[job_id] = ctx
+    _get_executor().submit(_run, ctx, fn)
+    return get(job_id), True
+
+
+def _as_dict(job: models.Job) -> dict:
+    d = {
+        "id": job.id, "kind": job.kind, "status": job.status, "phase": job.phase,
+        "rows_total": job.rows_total, "rows_fetched": job.rows_fetched, "rows_written": job.rows_written,
+        "cancel_requested": bool(job.cancel_requested),
+        "created_at": job.created_at, "started_at": job.started_at, "finished_at": job.finished_at,
+        "result": json.loads(job.result) if job.result else None, "error": job.error,
+    }
+    ctx = _live.get(job.id)
+    if ctx is not None and job.status in ACTIVE:
+        d.update(phase=ctx.phase, rows_total=ctx.rows_total, rows_fetched=ctx.rows_fetched,
+                 rows_written=ctx.rows_written, cancel_requested=ctx.cancelled.is_set() or d["cancel_requested"])
+        d["eta_seconds"] = _eta(ctx)
+    else:
+        d["eta_seconds"] = None
+    return d
+
+
+def _eta(ctx: JobContext) -> float | None:
+    # rate of the current phase; only meaningful once its row total is known
+    done = ctx.rows_written if ctx.phase == "writing" else ctx.rows_fetched
+    elapsed = time.time() - ctx.phase_started_at
+    if not ctx.rows_total or not done or elapsed <= 0:
+        return None
+    return round((ctx.rows_total - done) / (done / elapsed), 1)
+
+
+def get(job_id: str) -> dict | None:
+    db = SessionLocal()
+    try:
+        job = db.get(models.Job, job_id)
+        return _as_dict(job) if job else None
+    finally:
+        db.close()
+
+
+def latest(kind: str | None = None, limit: int = 20) -> list[dict]:
+    db = SessionLocal()
+    try:
+        stmt = select(models.Job).order_by(models.Job.created_at.desc()).limit(limit)
+        if kind:
+            stmt = stmt.where(models.Job.kind == kind)
+        return [_as_dict(j) for j in db.execute(stmt).scalars()]
+    finally:
+        db.close()
+
+
+def cancel(job_id: str) -> dict | None:
+    with _lock:
+        ctx = _live.get(job_id)
+    if ctx is not None:
+        ctx.cancelled.set()
+    # also flag it in the table, for a job running in another worker process
+    _save(job_id, cancel_requested=1)
+    return get(job_id)
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # os.kill(pid, 0) would terminate the process on Windows; ask the kernel instead
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+            return code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def _alive(worker: str | None) -> bool:
+    host, _, pid = (worker or "").rpartition(":")
+    if not pid.isdigit():
+        return False
+    if host != socket.gethostname():
+        # another machine's job; leave it alone
+        return True
+    return _pid_alive(int(pid))
+
+
+def recover():
+    """Mark jobs whose worker process on this host has exited as failed; called at startup.
+
+    Frees the per-kind slot held by a job that was interrupted by a restart or crash.
+    """
+    db = SessionLocal()
+    try:
+        stale = [j.id for j in db.execute(select(models.Job).where(models.Job.status.in_(ACTIVE))).scalars()
+                 if j.id not in _live and not _alive(j.worker)]
+        if stale:
+            db.execute(update(models.Job).where(models.Job.id.in_(stale))
+                       .values(status="failed", error="interrupted by restart", finished_at=time.time()))
+            db.commit()
+            logger.warning("marked %d interrupted job(s) as failed", len(stale))
+    finally:
+        db.close()
@@ -0,0 +1,152 @@
+"""
+Process-local metrics in the Prometheus text exposition format.
+
+A deliberately small registry (counters, gauges, histograms with labels) so
+the app does not need prometheus_client.  Each uvicorn worker keeps its own
+numbers; scrape every worker, or run a single worker, to get the full picture.
+
+The metrics the app records are defined at the bottom of this module and
+served by GET /metrics.
+"""
+import bisect
+import threading
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY: list["_Metric"] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.label_names)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{_labels(self.label_names, key)} {_num(value)}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket (non-cumulative) counts, +Inf last, then sum
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[i] += 1
+            state[-1] += value
+
+    def _render_value(self, key: tuple, state) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+            cumulative += count
+            le = 'le="%s"' % _num(bound)
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_num(state[-1])}")
+        lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ---- Application metrics ----
+
+http_requests = Counter("http_requests_total", "HTTP requests by route template and status.",
+                        ("method", "route", "status"))
+http_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency by route template.",
+                         ("method", "route"))
+db_pool_wait = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a SQLite pool connection.",
+                         buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+db_queries = Histogram("db_query_duration_seconds", "SQLite statement execution time.",
+                       buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+source_queries = Histogram("source_query_duration_seconds", "SQL Server (ERP) query time including fetch.")
+cache_requests = Counter("cache_requests_total", "Cache lookups by cache name and result (hit/miss).",
+                         ("cache", "result"))
+import_rows = Counter("import_rows_total", "Rows written by imports.", ("kind",))
+import_duration = Histogram("import_duration_seconds", "Wall time of import runs.", ("kind",))
+snapshot_refreshes = Counter("ledger_snapshot_refreshes_total",
+                             "Ledger snapshot refreshes by kind (incremental or full).", ("kind",))
+snapshot_refresh_duration = Histogram("ledger_snapshot_refresh_seconds", "Time to refresh the ledger snapshot.",
+                                      ("kind",))
+snapshot_rows = Gauge("ledger_snapshot_rows", "Rows held in the ledger snapshot.", ("table",))
+snapshot_bytes = Gauge("ledger_snapshot_bytes", "Approximate memory held by the ledger snapshot.", ("part",))
+
+
+def record_import(kind: str, rows: int, seconds: float) -> None:
+    import_rows.inc(rows, kind=kind)
+    import_duration.observe(seconds, kind=kind)
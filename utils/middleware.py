@@ -6,6 +6,8 @@ import json
 from dotenv import load_dotenv
 from starlette.responses import Response
 from auth import Auth
+from utils import instrumentation, metrics
+import time
 
 load_dotenv()  # Load environment variables from .env file
 
@@ -45,6 +47,42 @@ class ContextProcessorMiddleware(BaseHTTPMiddleware):
             response.context.setdefault("appname", request.state.context["appname"])
         return response
 
+class QueryTimingMiddleware(BaseHTTPMiddleware):
+    """Count SQL queries per request, emit a Server-Timing header, and warn past QUERY_BUDGET queries."""
+    async def dispatch(self, request: Request, call_next):
+        stats, token = instrumentation.begin_request()
+        try:
+            response: Response = await call_next(request)
+        finally:
+            instrumentation.end_request(token)
+        response.headers["Server-Timing"] = stats.server_timing()
+        budget = int(os.environ.get("QUERY_BUDGET", "50"))
+        if budget and stats.queries + stats.source_queries > budget:
+            logging.warning(f"Query budget exceeded: {request.method} {request.url.path} "
+                            f"ran {stats.queries} SQLite + {stats.source_queries} SQL Server queries "
+                            f"(budget {budget}, db {stats.db_time * 1000:.0f} ms)")
+        return response
+
+class MetricsMiddleware(BaseHTTPMiddleware):
+    """Record request count, in-flight requests and latency per route template (e.g. /api/home-items)."""
+    async def dispatch(self, request: Request, call_next):
+        started = time.perf_counter()
+        metrics.http_in_flight.inc()
+        status_code = 500
+        try:
+            response: Response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            metrics.http_in_flight.dec()
+            route = request.scope.get("route")
+            # unmatched paths share one label so scanners can't blow up the label set
+            template = getattr(route, "path", None)
+            if template is None:
+                template = "/static" if request.url.path.startswith("/static/") else "<unmatched>"
+            metrics.http_requests.inc(method=request.method, route=template, status=str(status_code))
+            metrics.http_latency.observe(time.perf_counter() - started, method=request.method, route=template)
+
 class ClientIPLoggingMiddleware(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         client_ip = request.client.host  # Extract client IP address
@@ -0,0 +1,20 @@
+"""
+Money is stored as integer cents (amount_cents columns) and converted at the
+edges: API schemas, imports and exports keep working in dollars as floats.
+
+Sums over cents are exact; convert once, after aggregating:
+
+    from_cents(db.execute(select(func.sum(models.ActualItem.amount_cents))).scalar())
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+
+def to_cents(amount) -> int:
+    """Dollars (float, str, Decimal or None) to integer cents, rounding half away from zero."""
+    if amount is None or amount == "":
+        return 0
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents) -> float | None:
+    return None if cents is None else cents / 100
@@ -0,0 +1,31 @@
+"""
+Response classes for large JSON payloads.
+
+FastJSONResponse is opt-in: routes that return big lists of plain dicts can
+return it instead of JSONResponse.  It uses orjson when it is installed and
+falls back to a compact stdlib json encoding otherwise, so the app still runs
+without the extra dependency.
+"""
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(
+            content,
+            ensure_ascii=False,
+            allow_nan=False,
+            separators=(",", ":"),
+        ).encode("utf-8")
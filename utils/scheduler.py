@@ -0,0 +1,304 @@
+"""
+In-process scheduler for the periodic ERP syncs.
+
+Started from the FastAPI lifespan, it runs the GL (accounts), budget and
+actuals imports as background jobs on a schedule set in the environment:
+
+    SYNC_ACCOUNTS=15 2 * * *      cron expression (local time): 02:15 every day
+    SYNC_BUDGET=0 3 * * 1-5       03:00 on weekdays
+    SYNC_ACTUALS=30m              interval: s, m, h or d suffix, or plain seconds
+    SYNC_ARCHIVE=0 4 1 * *        archive closed fiscal years (misc/archive.py), monthly
+    SYNC_JITTER=300               random delay of up to this many seconds per run
+
+A sync that is not configured does not run.  Cron expressions support *, lists,
+ranges and steps (e.g. */15, 1-5, 0,30); pick off-peak hours and add jitter to
+spread the syncs out.
+
+Every uvicorn worker runs the loop, but a run is claimed in the `schedules`
+table with a compare-and-set on next_run_at, so exactly one worker starts each
+due run.  The same row keeps the last-run stats served by /api/scheduler.
+"""
+import asyncio
+import datetime
+import logging
+import os
+import random
+import time
+
+from sqlalchemy import select, update, case
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import models
+from db import SessionLocal
+from utils import jobs
+
+logger = logging.getLogger("budget.scheduler")
+
+# schedule name -> job kind run by it
+SYNCS = {
+    "accounts": "erp:accounts",
+    "budget": "erp:budget",
+    "actuals": "erp:actuals",
+    "archive": "archive:ledger",
+}
+# longest sleep between checks, so a run claimed elsewhere or a changed row is noticed
+MAX_SLEEP = 60.0
+JOB_POLL = 5.0
+
+_tasks: list[asyncio.Task] = []
+
+
+# ---- schedule expressions ----
+
+def _cron_field(text: str, lo: int, hi: int) -> set[int]:
+    values = set()
+    for part in text.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            a, b = part.split("-", 1)
+            start, end = int(a), int(b)
+        else:
+            start = int(part)
+            end = hi if step > 1 else start
+        if start < lo or end > hi or start > end or step < 1:
+            raise ValueError(f"cron field '{text}' out of range {lo}-{hi}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron:
+    """Five-field cron expression: minute hour day-of-month month day-of-week (0 = Sunday)."""
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression needs 5 fields: '{expr}'")
+        self.expr = expr
+        self.minutes = _cron_field(fields[0], 0, 59)
+        self.hours = _cron_field(fields[1], 0, 23)
+        self.days = _cron_field(fields[2], 1, 31)
+        self.months = _cron_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _cron_field(fields[4], 0, 7)}
+        # like cron: when both day fields are restricted, either one matching is enough
+        self.any_day = fields[2] != "*" and fields[4] != "*"
+
+    def _day_matches(self, d: datetime.date) -> bool:
+        dom = d.day in self.days
+        dow = (d.weekday() + 1) % 7 in self.weekdays
+        return (dom or dow) if self.any_day else (dom and dow)
+
+    def next_after(self, after: float) -> float:
+        t = datetime.datetime.fromtimestamp(after).replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = t + datetime.timedelta(days=4 * 366)  # covers Feb 29
+        while t < limit:
+            if t.month not in self.months or not self._day_matches(t.date()):
+                t = (t + datetime.timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if t.hour not in self.hours:
+                t = (t + datetime.timedelta(hours=1)).replace(minute=0)
+                continue
+            if t.minute in self.minutes:
+                return t.timestamp()
+            t += datetime.timedelta(minutes=1)
+        raise ValueError(f"cron expression never fires: '{self.expr}'")
+
+    def __str__(self):
+        return self.expr
+
+
+class Interval:
+    UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+    def __init__(self, text: str):
+        text = text.strip().lower()
+        unit = self.UNITS.get(text[-1:], None)
+        self.seconds = float(text[:-1]) * unit if unit else float(text)
+        if self.seconds <= 0:
+            raise ValueError(f"interval must be positive: '{text}'")
+        self.text = text
+
+    def next_after(self, after: float) -> float:
+        return after + self.seconds
+
+    def __str__(self):
+        return f"every {self.text}"
+
+
+def parse_schedule(text: str):
+    text = text.strip()
+    return Cron(text) if len(text.split()) == 5 else Interval(text)
+
+
+def configured() -> dict:
+    """name -> schedule for every sync set in the environment; bad expressions are logged and skipped."""
+    schedules = {}
+    for name in SYNCS:
+        text = os.getenv(f"SYNC_{name.upper()}", "").strip()
+        if not text:
+            continue
+        try:
+            schedules[name] = parse_schedule(text)
+        except ValueError as e:
+            logger.error("SYNC_%s: %s", name.upper(), e)
+    return schedules
+
+
+def _jitter() -> float:
+    return random.uniform(0, float(os.getenv("SYNC_JITTER", "0") or 0))
+
+
+# ---- schedules table ----
+
+def _ensure_row(name: str, schedule) -> float:
+    """Create the row on first start (keeping an existing next_run_at) and return next_run_at."""
+    db = SessionLocal()
+    try:
+        first = schedule.next_after(time.time()) + _jitter()
+        t = models.Schedule.__table__
+        stmt = sqlite_insert(t).values(name=name, schedule=str(schedule), next_run_at=first)
+        # a changed expression starts over from now instead of keeping the old next run
+        db.execute(stmt.on_conflict_do_update(index_elements=["name"], set_={
+            "schedule": stmt.excluded.schedule,
+            "next_run_at": case((t.c.schedule != stmt.excluded.schedule, stmt.excluded.next_run_at),
+                                else_=t.c.next_run_at),
+        }))
+        db.commit()
+        return db.execute(select(models.Schedule.next_run_at).where(models.Schedule.name == name)).scalar()
+    finally:
+        db.close()
+
+
+def _claim(name: str, due: float, following: float) -> bool:
+    """Move next_run_at from `due` to `following`; only the worker whose update succeeds runs the sync."""
+    db = SessionLocal()
+    try:
+        res = db.execute(update(models.Schedule)
+                         .where(models.Schedule.name == name, models.Schedule.next_run_at == due)
+                         .values(next_run_at=following, last_started_at=time.time(), last_worker=jobs.WORKER,
+                                 last_status="running", last_job_id=None))
+        db.commit()
+        return res.rowcount == 1
+    finally:
+        db.close()
+
+
+def _record(name: str, **values):
+    db = SessionLocal()
+    try:
+        db.execute(update(models.Schedule).where(models.Schedule.name == name).values(**values))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _finish(name: str, status: str, started: float, job: dict | None = None, error: str | None = None):
+    db = SessionLocal()
+    try:
+        row = db.get(models.Schedule, name)
+        row.last_status = status
+        row.last_finished_at = time.time()
+        row.last_duration = round(row.last_finished_at - started, 3)
+        row.last_error = error
+        row.runs = (row.runs or 0) + 1
+        if status == "failed":
+            row.failures = (row.failures or 0) + 1
+        if job:
+            row.last_job_id = job["id"]
+            row.last_rows = job.get("rows_written")
+        db.commit()
+    finally:
+        db.close()
+
+
+# ---- loop ----
+
+async def _run_sync(name: str):
+    from misc import erp_imports
+    kind = SYNCS[name]
+    started = time.time()
+    job, was_started = await asyncio.to_thread(jobs.start, kind, erp_imports.JOBS[kind])
+    try:
+        await asyncio.to_thread(_record, name, last_job_id=job["id"])
+    except Exception as e:
+        # the import may already hold the write lock; the id is recorded again when it finishes
+        logger.warning("sync %s: could not record job id: %s", name, e)
+    if not was_started:
+        # an import of this kind (probably a manual one) is already running
+        await asyncio.to_thread(_finish, name, "skipped", started, job)
+        return
+    while job and job["status"] in jobs.ACTIVE:
+        await asyncio.sleep(JOB_POLL)
+        job = await asyncio.to_thread(jobs.get, job["id"])
+    status = job["status"] if job else "failed"
+    await asyncio.to_thread(_finish, name, status, started, job, job.get("error") if job else "job disappeared")
+    logger.info("sync %s: %s", name, status)
+
+
+async def _loop(name: str, schedule):
+    due = await asyncio.to_thread(_ensure_row, name, schedule)
+    logger.info("sync %s scheduled %s; next run %s", name, schedule,
+                datetime.datetime.fromtimestamp(due).isoformat(timespec="seconds"))
+    while True:
+        now = time.time()
+        if due > now:
+            await asyncio.sleep(min(due - now, MAX_SLEEP))
+        else:
+            following = schedule.next_after(max(due, now)) + _jitter()
+            try:
+                if await asyncio.to_thread(_claim, name, due, following):
+                    try:
+                        await _run_sync(name)
+                    except Exception as e:
+                        logger.exception("sync %s failed", name)
+                        await asyncio.to_thread(_finish, name, "failed", now, None, str(e))
+            except Exception:
+                # e.g. the database was locked by an import; try again shortly
+                logger.exception("sync %s: scheduler error", name)
+                await asyncio.sleep(MAX_SLEEP)
+        try:
+            row = await asyncio.to_thread(_get_row, name)
+            due = row.next_run_at if row else schedule.next_after(time.time())
+        except Exception:
+            logger.exception("sync %s: could not read schedule", name)
+
+
+def _get_row(name: str):
+    db = SessionLocal()
+    try:
+        return db.get(models.Schedule, name)
+    finally:
+        db.close()
+
+
+def start():
+    for name, schedule in configured().items():
+        _tasks.append(asyncio.create_task(_loop(name, schedule), name=f"sync:{name}"))
+
+
+async def stop():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+
+
+def stats() -> list[dict]:
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(models.Schedule).order_by(models.Schedule.name)).scalars().all()
+    finally:
+        db.close()
+    active = configured()
+    return [{
+        "name": r.name, "schedule": r.schedule, "enabled": r.name in active,
+        "next_run_at": r.next_run_at, "last_started_at": r.last_started_at,
+        "last_finished_at": r.last_finished_at, "last_status": r.last_status,
+        "last_duration": r.last_duration, "last_rows": r.last_rows, "last_error": r.last_error,
+        "last_job_id": r.last_job_id, "last_worker": r.last_worker,
+        "runs": r.runs or 0, "failures": r.failures or 0,
+    } for r in rows]
@@ -0,0 +1,81 @@
+"""
+Block-allocated sequence numbers backed by the `sequences` table.
+
+Each sequence row holds the next value that has not been handed out.  Values
+are reserved by advancing it with one UPDATE ... RETURNING, so allocating never
+scans the table the numbers end up in (that table is read once, to seed the
+counter the first time a sequence is used).
+
+    ACTUAL_SEQ.next()                 one value from this process's cached block
+    ACTUAL_SEQ.reserve(n, conn)       n contiguous values inside the caller's transaction
+
+Ordering guarantees:
+  * every value is handed out once, across threads and worker processes;
+  * values from next() increase within a process, and values from one
+    reserve() call are contiguous and increasing;
+  * values are not ordered across processes: each process draws from its own
+    block of SEQ_BLOCK values, so a later insert in one worker can get a lower
+    number than an earlier insert in another;
+  * there can be gaps: the rest of a cached block is lost when the process
+    exits, and a reserve() whose transaction rolls back returns its range.
+"""
+import os
+import threading
+
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import models
+from db import engine
+
+SEQ_BLOCK = int(os.getenv("SEQ_BLOCK", "100"))
+
+
+class Sequence:
+    def __init__(self, name: str, column, step: float = 1, start: float = 1, block: int = SEQ_BLOCK):
+        self.name = name
+        self.column = column      # seeds the counter from max(column) on first use
+        self.step = step
+        self.start = start
+        self.block = block
+        self._next = None
+        self._end = None
+        self._lock = threading.Lock()
+
+    def _advance(self, conn, n: int) -> float:
+        t = models.Sequence.__table__
+        bump = update(t).where(t.c.name == self.name).values(next_value=t.c.next_value + n * self.step)
+        new = conn.execute(bump.returning(t.c.next_value)).scalar()
+        if new is None:
+            # first use: start after the highest value already stored
+            top = conn.execute(select(func.max(self.column))).scalar()
+            seed = top + self.step if top is not None else self.start
+            conn.execute(sqlite_insert(t).values(name=self.name, next_value=seed)
+                         .on_conflict_do_nothing(index_elements=["name"]))
+            new = conn.execute(bump.returning(t.c.next_value)).scalar()
+        return new - n * self.step
+
+    def reserve(self, n: int, conn=None) -> list[float]:
+        """n contiguous values. With `conn` the reservation commits or rolls back with the caller."""
+        if n <= 0:
+            return []
+        if conn is not None:
+            first = self._advance(conn, n)
+        else:
+            with engine.begin() as own:
+                first = self._advance(own, n)
+        return [first + i * self.step for i in range(n)]
+
+    def next(self) -> float:
+        with self._lock:
+            if self._next is None or self._next >= self._end:
+                with engine.begin() as conn:
+                    self._next = self._advance(conn, self.block)
+                self._end = self._next + self.block * self.step
+            value = self._next
+            self._next += self.step
+            return value
+
+
+# actual_items.seq has always counted in steps of 5 from 1
+ACTUAL_SEQ = Sequence("actual_items.seq", models.ActualItem.seq, step=5, start=1.0)
@@ -0,0 +1,27 @@
+"""
+Case-insensitive substring filters (description, vendor) that give the same
+rows whichever engine evaluates them.
+
+SQLite's lower() and LIKE fold ASCII letters only, so the filters run in
+Python (the NumPy and snapshot engines) fold the same way: 'É' matches 'É'
+but not 'é' everywhere.  In SQL the needle is matched literally, with % and _
+escaped:
+
+    select(...).where(contains(models.ActualItem.vendor_name, vendor))
+    needle in fold(value)                   # fold(needle) first
+"""
+import string
+
+from sqlalchemy import func
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def fold(s: str) -> str:
+    """s with its ASCII letters lowercased, as SQLite's lower() does."""
+    return s.lower() if s.isascii() else s.translate(_ASCII_LOWER)
+
+
+def contains(column, needle: str):
+    """SQL condition: `column` (NULL as '') contains `needle`, ASCII case-insensitively."""
+    return func.lower(func.coalesce(column, '')).contains(fold(needle), autoescape=True)